@@ -1,29 +1,98 @@
+"""
+Админка, которая не замедляется с ростом таблиц постов и комментариев.
+
+Список считает строки EstimatedCountPaginator'ом, без второго COUNT(*) по
+всей таблице (show_full_result_count), авторы подгружаются тем же
+запросом, поиск идёт по полнотекстовому индексу вместо LIKE '%…%', а
+связи в формах выбираются по id или автодополнением, а не выпадающим
+списком из всех строк. Удаление выбранного уходит в фоновую задачу
+пачками (см. posts.jobs).
+"""
 from django.contrib import admin
 
+from . import jobs
 from .models import Post, Comment, Follow, Group
+from .paginators import EstimatedCountPaginator
+from .search import get_backend
+
+# больше id в IN (...) не передаём: хватает, чтобы найти нужную запись
+SEARCH_LIMIT = 500
+
+
+def delete_in_background(modeladmin, request, queryset):
+    jobs.submit(
+        queryset, jobs.delete,
+        f"удаление: {modeladmin.model._meta.verbose_name_plural}",
+    )
+    modeladmin.message_user(
+        request,
+        "Удаление запущено в фоне: записи удаляются пачками и исчезнут "
+        "из списка в течение нескольких минут.",
+    )
+
+
+delete_in_background.short_description = "Удалить выбранные (в фоне)"
+delete_in_background.allowed_permissions = ("delete",)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Общие настройки списков для таблиц на миллионы строк."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = (delete_in_background,)
+    search_kind = None
+
+    def get_actions(self, request):
+        # delete_selected грузит все выбранные объекты ради подтверждения
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        ids = get_backend().object_ids(
+            self.search_kind, search_term, SEARCH_LIMIT
+        )
+        return queryset.filter(pk__in=ids), False
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ("pk", "text", "pub_date", "author")
+    list_select_related = ("author",)
     search_fields = ("text",)
+    search_kind = "post"
     list_filter = ("pub_date",)
+    autocomplete_fields = ("author", "group")
     empty_value_display = "-пусто-"
 
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
+    search_fields = ("title", "slug")
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ("pk", "text", "created", "author")
+    list_select_related = ("author",)
     search_fields = ("text",)
+    search_kind = "comment"
     list_filter = ("created",)
+    autocomplete_fields = ("author",)
+    raw_id_fields = ("post",)
+    # путь ветки считается при создании: перенос ответа его бы сломал
+    readonly_fields = ("parent",)
     empty_value_display = "-пусто-"
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ("user", "author")
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
     empty_value_display = "-пусто-"
 
 
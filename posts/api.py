@@ -0,0 +1,217 @@
+"""
+Read-only API лент для мобильных клиентов: /api/v1/.
+
+Все списки листаются курсором, ответы снабжаются ETag, посчитанным по
+объектам страницы до сериализации, поэтому на If-None-Match с неизменной
+страницей отдаётся 304 без рендеринга тела.
+"""
+import hashlib
+from collections import OrderedDict
+
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework import viewsets
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .feed import FeedPaginator, feed_posts
+from .ingest import ingest, read_jsonl
+from .models import Group, Post
+from .serializers import (
+    CommentSerializer, FollowSerializer, GroupSerializer, PostSerializer
+)
+
+
+class PostCursorPagination(CursorPagination):
+    page_size = 20
+    ordering = ("-pub_date", "-id")
+
+
+class CommentCursorPagination(CursorPagination):
+    page_size = 50
+    ordering = ("-created", "-id")
+
+
+class IdCursorPagination(CursorPagination):
+    page_size = 50
+    ordering = ("id",)
+
+
+class FeedCursorPagination(BasePagination):
+    """
+    Лента подписок страницами FeedPaginator (?after= / ?before=): курсор
+    CursorPagination сортировал бы всю ленту пользователя.
+    """
+
+    page_size = 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = FeedPaginator(request.user, self.page_size, queryset)
+        self.page = paginator.get_page(
+            after=request.query_params.get("after"),
+            before=request.query_params.get("before"),
+        )
+        return list(self.page)
+
+    def link(self, param, cursor):
+        if not cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), "after")
+        url = remove_query_param(url, "before")
+        return replace_query_param(url, param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.link("after", self.page.next_cursor)),
+            ("previous", self.link("before", self.page.previous_cursor)),
+            ("results", data),
+        ]))
+
+
+class ConditionalMixin:
+    """
+    ETag — по значениям полей объектов страницы. Last-Modified не
+    отдаётся: удалённый объект уходит со страницы, не сдвигая времени
+    изменения оставшихся, и If-Modified-Since получил бы устаревший 304.
+    """
+
+    def object_version(self, obj):
+        return tuple(
+            getattr(obj, field.attname) for field in obj._meta.concrete_fields
+        )
+
+    def validators(self, objects):
+        payload = repr((
+            self.request.user.pk,
+            self.request.get_full_path(),
+            [self.object_version(obj) for obj in objects],
+        ))
+        return hashlib.md5(payload.encode()).hexdigest()
+
+    def conditional(self, objects, build_response):
+        etag = quote_etag(self.validators(objects))
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = build_response()
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.conditional(
+            page,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional(
+            [instance],
+            lambda: super(ConditionalMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+
+class PostViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = PostSerializer
+    pagination_class = PostCursorPagination
+
+    def get_queryset(self):
+        queryset = Post.objects.for_cards()
+        group = self.request.query_params.get("group")
+        if group:
+            queryset = queryset.filter(group__slug=group)
+        author = self.request.query_params.get("author")
+        if author:
+            queryset = queryset.filter(author__username=author)
+        return queryset
+
+
+class FeedViewSet(PostViewSet):
+    pagination_class = FeedCursorPagination
+
+    def get_queryset(self):
+        return feed_posts(self.request.user).for_cards()
+
+
+class GroupViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Group.objects.select_related("stats")
+    serializer_class = GroupSerializer
+    pagination_class = IdCursorPagination
+    lookup_field = "slug"
+
+    def object_version(self, group):
+        stats = getattr(group, "stats", None)
+        return (
+            super().object_version(group),
+            stats and super().object_version(stats),
+        )
+
+
+class CommentViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = CommentSerializer
+    pagination_class = CommentCursorPagination
+
+    def get_queryset(self):
+        post = get_object_or_404(Post, pk=self.kwargs["post_id"])
+        return post.comments.select_related("author")
+
+
+class FollowViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = FollowSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        return self.request.user.follower.select_related("user", "author")
+
+
+class JSONLinesParser(BaseParser):
+    """Тело application/x-ndjson читается построчно, без загрузки целиком."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_jsonl(stream if stream is not None else [])
+
+
+class BulkIngestView(APIView):
+    """
+    Пакетная загрузка постов и комментариев для персонала: JSON-массив
+    или JSONL со строками в формате posts.ingest.
+    """
+
+    permission_classes = (IsAdminUser,)
+    parser_classes = (JSONParser, JSONLinesParser)
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            rows = (
+                (number, row, None) if isinstance(row, dict)
+                else (number, None, "ожидался объект")
+                for number, row in enumerate(data, 1)
+            )
+        elif isinstance(data, dict):
+            return Response({"detail": "ожидался массив строк"}, status=400)
+        else:
+            rows = data
+        result = ingest(rows)
+        return Response({
+            "posts": result["posts"],
+            "comments": result["comments"],
+            "errors": [
+                {"line": number, "error": error}
+                for number, error in result["errors"]
+            ],
+        })
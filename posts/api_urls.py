@@ -0,0 +1,20 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import api
+
+router = DefaultRouter()
+router.register('posts', api.PostViewSet, basename='api-posts')
+router.register('feed', api.FeedViewSet, basename='api-feed')
+router.register('groups', api.GroupViewSet, basename='api-groups')
+router.register('follows', api.FollowViewSet, basename='api-follows')
+router.register(
+    r'posts/(?P<post_id>\d+)/comments',
+    api.CommentViewSet,
+    basename='api-comments'
+)
+
+urlpatterns = [
+    path('bulk/', api.BulkIngestView.as_view(), name='api-bulk'),
+    path('', include(router.urls)),
+]
@@ -0,0 +1,256 @@
+"""
+Нагрузочный прогон страниц постов.
+
+run_client() ходит по страницам тестовым клиентом в этом же процессе и
+считает SQL-запросы каждого ответа, run_http() нагружает запущенный
+сервер из нескольких потоков. Отчёт — p50/p95/p99 по каждой странице,
+запросы в секунду и пиковый RSS процесса; compare() сверяет его с
+сохранённой базой. Так же сравниваются развёртывания: отчёт прогона
+WSGI-сервера сохраняется с --save и служит базой для прогона ASGI.
+"""
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.db.models import Count
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from yatube.metrics import Histogram
+
+from .models import Group, Post, User
+from .paginators import encode_cursor
+from .templatetags.post_cards import _reverse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# страницы, которые видят только вошедшие пользователи
+AUTHENTICATED = {"follow_index"}
+# API пускает только по токену (TokenAuthentication)
+API = {"api posts"}
+# разница p95 меньше этого считается шумом, а не регрессией
+NOISE_MS = 1.0
+
+
+def bench_urls():
+    """
+    Страницы для прогона на самых тяжёлых объектах базы: автор с
+    наибольшим числом подписчиков, самая большая группа, самый
+    обсуждаемый пост. Возвращает (страницы, читатель ленты) или None.
+    """
+    reader = User.objects.order_by("-stats__following_count").first()
+    author = User.objects.order_by("-stats__followers_count").first()
+    post = Post.objects.select_related("author").order_by(
+        "-comment_count"
+    ).first()
+    if post is None:
+        return None
+    group = Group.objects.annotate(size=Count("posts")).order_by(
+        "-size"
+    ).first()
+    deep = Post.objects.order_by("-pub_date", "-pk")[50:51].first() or post
+
+    urls = {
+        "index": reverse("index"),
+        "index?after": f"{reverse('index')}?after={encode_cursor(deep)}",
+        "profile": reverse("profile", args=[author.username]),
+        "post": reverse("post", args=[post.author.username, post.pk]),
+        "follow_index": reverse("follow_index"),
+        "search": f"{reverse('search')}?q={post.text.split()[0]}",
+        "api posts": "/api/v1/posts/",
+    }
+    if group is not None:
+        urls["group"] = reverse("group", args=[group.slug])
+    return urls, reader
+
+
+def _summary(latency, queries, errors):
+    # задержка копится в микросекундах: у гистограммы точность от единицы
+    return {
+        "requests": latency.total,
+        "errors": errors,
+        "p50_ms": round(latency.percentile(50) / 1000, 3),
+        "p95_ms": round(latency.percentile(95) / 1000, 3),
+        "p99_ms": round(latency.percentile(99) / 1000, 3),
+        "mean_ms": round(latency.sum / max(latency.total, 1) / 1000, 3),
+        "queries": queries.max if queries is not None else None,
+    }
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def api_token(reader):
+    return Token.objects.get_or_create(user=reader)[0].key
+
+
+def run_client(urls, reader, requests=50, warmup=5):
+    anonymous = Client()
+    logged_in = Client()
+    logged_in.force_login(reader)
+    api = Client(HTTP_AUTHORIZATION=f"Token {api_token(reader)}")
+
+    pages = {}
+    started_all = time.perf_counter()
+    for name, url in urls.items():
+        client = anonymous
+        if name in AUTHENTICATED:
+            client = logged_in
+        elif name in API:
+            client = api
+        for _ in range(warmup):
+            client.get(url)
+        latency, queries, errors = Histogram(), Histogram(), 0
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            latency.record(elapsed * 1e6)
+            queries.record(len(captured.captured_queries))
+            errors += response.status_code != 200
+        pages[name] = {"url": url, **_summary(latency, queries, errors)}
+    return {
+        "pages": pages,
+        "rps": _rps(pages, time.perf_counter() - started_all),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def _rps(pages, elapsed):
+    total = sum(page["requests"] for page in pages.values())
+    return round(total / elapsed, 1) if elapsed else 0
+
+
+def _fetch(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_http(base_url, urls, reader, requests=50, workers=8):
+    """
+    Нагрузка на запущенный сервер: workers потоков одновременно.
+    Число запросов к БД и память сервера отсюда не видны — их смотрят
+    в /metrics/ сервера.
+    """
+    client = Client()
+    client.force_login(reader)
+    session = client.cookies[settings.SESSION_COOKIE_NAME].value
+    cookie = {"Cookie": f"{settings.SESSION_COOKIE_NAME}={session}"}
+    token = {"Authorization": f"Token {api_token(reader)}"}
+
+    def job(name):
+        headers = {}
+        if name in AUTHENTICATED:
+            headers = cookie
+        elif name in API:
+            headers = token
+        return name, *_fetch(base_url.rstrip("/") + urls[name], headers)
+
+    histograms = {name: Histogram() for name in urls}
+    errors = dict.fromkeys(urls, 0)
+    jobs = [name for _ in range(requests) for name in urls]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, elapsed, ok in pool.map(job, jobs):
+            histograms[name].record(elapsed * 1e6)
+            errors[name] += not ok
+    elapsed = time.perf_counter() - started
+
+    pages = {
+        name: {"url": urls[name], **_summary(histograms[name], None,
+                                             errors[name])}
+        for name in urls
+    }
+    return {"pages": pages, "rps": _rps(pages, elapsed), "peak_rss_kb": None}
+
+
+def compare(report, baseline, tolerance=0.25):
+    """Список регрессий относительно базы; пустой — всё в порядке."""
+    regressions = []
+    for name, page in report["pages"].items():
+        base = baseline.get("pages", {}).get(name)
+        if base is None:
+            continue
+        slower = page["p95_ms"] - base["p95_ms"]
+        if slower > base["p95_ms"] * tolerance and slower > NOISE_MS:
+            regressions.append(
+                f"{name}: p95 {page['p95_ms']} мс, было {base['p95_ms']} мс"
+            )
+        if (page["queries"] is not None and base.get("queries") is not None
+                and page["queries"] > base["queries"]):
+            regressions.append(
+                f"{name}: запросов {page['queries']}, было {base['queries']}"
+            )
+        if page["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: ошибок {page['errors']}")
+    rps, base_rps = report.get("rps"), baseline.get("rps")
+    if rps and base_rps and rps < base_rps * (1 - tolerance):
+        regressions.append(f"запросов в секунду {rps}, было {base_rps}")
+    rss, base_rss = report.get("peak_rss_kb"), baseline.get("peak_rss_kb")
+    if rss and base_rss and rss > base_rss * (1 + tolerance):
+        regressions.append(f"пиковый RSS {rss} КБ, было {base_rss} КБ")
+    return regressions
+
+
+def render_templates(iterations=200, posts=10, template_name="index.html"):
+    """
+    Микро-бенчмарк рендеринга ленты из posts карточек: время на страницу,
+    поиски шаблонов и промахи кэша reverse() в среднем на страницу.
+    """
+    page = list(
+        Post.objects.for_cards().order_by("-pub_date", "-pk")[:posts]
+    )
+    request = RequestFactory().get("/")
+    request.user = AnonymousUser()
+    context = {"page": page}
+
+    engine = engines["django"].engine
+    find_template = engine.find_template
+    lookups = 0
+
+    def counting_find_template(*args, **kwargs):
+        nonlocal lookups
+        lookups += 1
+        return find_template(*args, **kwargs)
+
+    render_to_string(template_name, context, request)
+    latency = Histogram()
+    misses = _reverse.cache_info().misses
+    engine.find_template = counting_find_template
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            render_to_string(template_name, context, request)
+            latency.record((time.perf_counter() - started) * 1e6)
+    finally:
+        del engine.find_template
+    summary = _summary(latency, None, 0)
+    return {
+        "posts": len(page),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "mean_ms": summary["mean_ms"],
+        "template_lookups": lookups / iterations,
+        "reverse_misses": (_reverse.cache_info().misses - misses) / iterations,
+    }
@@ -0,0 +1,150 @@
+"""
+Кэш лент и карточек постов.
+
+Вместо кэширования целой страницы кэшируются:
+* упорядоченный список id первой страницы каждой ленты (index, группа,
+  профиль) — сбрасывается сигналами при создании, правке и удалении поста;
+* отрендеренная часть карточки поста ({% cache %} в post_item.html) по ключу
+  (id, updated) — после правки у поста новый ключ, старый удаляется;
+* время последнего изменения поста, пользователя и группы в миллисекундах —
+  из него и индексных агрегатов строятся ETag и Last-Modified страниц.
+
+Страницы целиком кэширует только край (yatube.edge) — по суррогатным
+ключам из surrogate_keys(), их же сбрасывает purge_edge().
+"""
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from yatube import edge
+
+from .models import Group
+
+CARD_FRAGMENT = "post_card"
+
+
+def feed_ids_timeout():
+    return getattr(settings, "FEED_IDS_CACHE_TIMEOUT", 300)
+
+
+def feed_key(name, *args):
+    return ":".join(["feed-ids", name, *map(str, args)])
+
+
+def card_key(post_id, updated, username):
+    # имя автора в ключе: переименование не меняет updated поста, а ссылка
+    # на профиль и @автор лежат внутри фрагмента
+    return make_template_fragment_key(
+        CARD_FRAGMENT, [post_id, updated.isoformat(), username]
+    )
+
+
+def feed_keys(post, group_ids=()):
+    keys = [feed_key("index"), feed_key("profile", post.author_id)]
+    for group_id in {post.group_id, *group_ids}:
+        if group_id is not None:
+            keys.append(feed_key("group", group_id))
+    return keys
+
+
+def invalidate_post(post, group_ids=(), card=None):
+    keys = feed_keys(post, group_ids)
+    if card:
+        keys.append(card)
+    cache.delete_many(keys)
+    touch_post(post, group_ids)
+
+
+def version_key(kind, pk):
+    return f"changed:{kind}:{pk}"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def touch(*keys):
+    """Отмечает, что страницы объектов изменились прямо сейчас."""
+    now = _now_ms()
+    cache.set_many(dict.fromkeys(keys, now), timeout=None)
+
+
+def changed_at(*keys):
+    """
+    Время последнего изменения объектов. Вытесненный из кэша ключ
+    считается изменённым сейчас: лишний 200 безопаснее ложного 304.
+    """
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = _now_ms()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        found.update(cache.get_many(missing))
+    return [
+        datetime.fromtimestamp(found.get(key, _now_ms()) / 1000, timezone.utc)
+        for key in keys
+    ]
+
+
+def _version_keys(post, group_ids=()):
+    keys = [version_key("post", post.pk), version_key("user", post.author_id)]
+    for group_id in {post.group_id, *group_ids}:
+        if group_id is not None:
+            keys.append(version_key("group", group_id))
+    return keys
+
+
+def touch_post(post, group_ids=()):
+    """Пост виден на своей странице, в профиле автора и в группах."""
+    touch(*_version_keys(post, group_ids))
+
+
+def invalidate_posts(posts):
+    """
+    invalidate_post() для пачки новых или прокомментированных постов одним
+    обращением к кэшу; на краю сбрасываются и ленты, где они появились.
+    """
+    feeds, versions = set(), set()
+    for post in posts:
+        feeds.update(feed_keys(post))
+        versions.update(_version_keys(post))
+    if feeds:
+        cache.delete_many(list(feeds))
+        touch(*versions)
+        purge_edge(
+            posts=[post.pk for post in posts],
+            authors={post.author_id for post in posts},
+            group_ids={post.group_id for post in posts},
+            index=True,
+        )
+
+
+def surrogate_keys(posts=(), authors=(), groups=()):
+    """Ключи страниц на краю: post-<id>, author-<id>, group-<slug>."""
+    return [
+        *(f"post-{pk}" for pk in posts),
+        *(f"author-{pk}" for pk in authors),
+        *(f"group-{slug}" for slug in groups),
+    ]
+
+
+def purge_edge(posts=(), authors=(), group_ids=(), slugs=(), index=False):
+    """
+    Сбрасывает на краю страницы с этими объектами; index — ещё и главную.
+    Без пурджера ничего не делает, даже не ищет slug групп.
+    """
+    if not edge.enabled():
+        return
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if group_ids:
+        slugs = {*slugs, *Group.objects.filter(pk__in=group_ids).values_list(
+            "slug", flat=True
+        )}
+    edge.purge(
+        *(["index"] if index else []),
+        *surrogate_keys(posts, authors, slugs),
+    )
@@ -0,0 +1,52 @@
+"""
+Одновременное выполнение независимых запросов одного представления.
+
+gather() запускает функции в общем ограниченном пуле потоков; у каждого
+потока своё соединение с базой, поэтому, например, страница постов и
+проверка подписки идут в PostgreSQL параллельно, и время ответа — самый
+долгий запрос, а не их сумма. Включается POSTS_PARALLEL_QUERIES: у SQLite
+выигрыша нет, а внутри транзакции другие соединения не видят её данных,
+так что там функции выполняются по очереди в текущем потоке.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "POSTS_QUERY_THREADS", 8),
+                thread_name_prefix="queries",
+            )
+    return _executor
+
+
+def _run(function):
+    try:
+        return function()
+    finally:
+        # соединения потоков пула живут по тем же правилам CONN_MAX_AGE
+        close_old_connections()
+
+
+def gather(*functions):
+    """Результаты функций в том же порядке."""
+    if (not getattr(settings, "POSTS_PARALLEL_QUERIES", False)
+            or len(functions) < 2 or connection.in_atomic_block):
+        return [function() for function in functions]
+    # контекст запроса (маршрутизация на реплику, метрики) — и в потоках
+    futures = [
+        executor().submit(copy_context().run, _run, function)
+        for function in functions[1:]
+    ]
+    first = functions[0]()
+    return [first, *(future.result() for future in futures)]
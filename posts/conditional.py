@@ -0,0 +1,117 @@
+"""
+Условные GET для страниц поста, профиля и группы.
+
+Валидаторы считаются одним индексным запросом на страницу — max(pub_date)
+постов, время последнего комментария — и временем последнего изменения
+объектов из кэша (posts.cache.touch). Сами посты и комментарии не
+загружаются, а на совпавший If-None-Match / If-Modified-Since отдаётся 304
+без рендеринга шаблона. В ETag входят адрес страницы с курсором и
+пользователь: кнопки подписки и правки у каждого свои, поэтому в
+валидаторах есть и время последней смены его подписок.
+"""
+import hashlib
+
+from django.contrib.auth.models import User
+from django.db.models import OuterRef, Subquery
+from django.views.decorators.http import condition
+
+from .cache import changed_at, version_key
+from .models import Comment, Group, Post
+from .relationships import version as following_version
+
+
+def _latest(model, owner, field):
+    # ORDER BY ... LIMIT 1 читает одну запись индекса (owner, field),
+    # а MAX() через JOIN и GROUP BY прошёл бы все записи владельца
+    return Subquery(
+        model.objects.filter(**{owner: OuterRef("pk")})
+        .order_by(f"-{field}").values(field)[:1]
+    )
+
+
+def _viewer_keys(request):
+    """Ключи версий, от которых зависят кнопки на карточках у зрителя."""
+    if request.user.is_authenticated:
+        return [following_version(request.user.pk)]
+    return []
+
+
+def _validators(request, moments, extra=()):
+    moments = [moment for moment in moments if moment is not None]
+    payload = repr((
+        request.get_full_path(),
+        request.user.pk,
+        [moment.isoformat() for moment in moments],
+        extra,
+    ))
+    return hashlib.md5(payload.encode()).hexdigest(), max(moments)
+
+
+def _memoized(compute):
+    # condition() спрашивает ETag и Last-Modified по отдельности
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, "_page_validators"):
+            request._page_validators = compute(request, *args, **kwargs)
+        return request._page_validators
+    return validators
+
+
+@_memoized
+def post_validators(request, username, post_id):
+    row = Post.objects.filter(
+        pk=post_id, author__username=username
+    ).annotate(
+        last_comment=_latest(Comment, "post", "created")
+    ).values_list(
+        "author_id", "updated", "comment_count", "last_comment"
+    ).first()
+    if row is None:
+        return None, None
+    author_id, updated, comment_count, last_comment = row
+    versions = changed_at(
+        version_key("post", post_id),
+        version_key("user", author_id),
+        *_viewer_keys(request),
+    )
+    return _validators(
+        request, [updated, last_comment, *versions], (comment_count,)
+    )
+
+
+@_memoized
+def profile_validators(request, username):
+    row = User.objects.filter(username=username).annotate(
+        last_post=_latest(Post, "author", "pub_date")
+    ).values_list("pk", "last_post").first()
+    if row is None:
+        return None, None
+    user_id, last_post = row
+    versions = changed_at(
+        version_key("user", user_id), *_viewer_keys(request)
+    )
+    return _validators(request, [last_post, *versions])
+
+
+@_memoized
+def group_validators(request, slug):
+    row = Group.objects.filter(slug=slug).annotate(
+        last_post=_latest(Post, "group", "pub_date")
+    ).values_list("pk", "last_post").first()
+    if row is None:
+        return None, None
+    group_id, last_post = row
+    versions = changed_at(
+        version_key("group", group_id), *_viewer_keys(request)
+    )
+    return _validators(request, [last_post, *versions])
+
+
+def conditional_page(validators):
+    return condition(
+        etag_func=lambda request, *args, **kwargs: (
+            validators(request, *args, **kwargs)[0]
+        ),
+        last_modified_func=lambda request, *args, **kwargs: (
+            validators(request, *args, **kwargs)[1]
+        ),
+    )
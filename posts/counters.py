@@ -0,0 +1,167 @@
+"""
+Денормализованные счётчики: посты, подписчики и подписки пользователя
+(UserStats), комментарии поста (Post.comment_count) и активность группы
+(GroupStats).
+
+Счётчики меняются атомарно выражениями F() из сигналов создания и
+удаления, а recount() пересчитывает их целиком, если они разошлись.
+Окна активности групп за 24 ч и 7 дней со временем устаревают, их
+сдвигает refresh_groups() — manage.py refresh_group_stats по расписанию;
+после него страницы групп и каталог меняют валидаторы и сбрасываются на
+краю.
+"""
+from datetime import timedelta
+
+from django.db.models import (
+    Case, Count, DateTimeField, F, IntegerField, OuterRef, Subquery, Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from yatube import edge
+
+from . import cache
+from .models import Comment, Follow, Group, GroupStats, Post, User, UserStats
+
+BATCH_SIZE = 1000
+WINDOWS = {
+    "posts_24h": timedelta(hours=24),
+    "posts_7d": timedelta(days=7),
+}
+
+
+def _shift(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def bump_user(user_id, **deltas):
+    values = {field: _shift(field, delta) for field, delta in deltas.items()}
+    updated = UserStats.objects.filter(user_id=user_id).update(**values)
+    # при каскадном удалении пользователя строки уже может не быть
+    if not updated and min(deltas.values()) > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**values)
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=_shift("comment_count", delta)
+    )
+
+
+def _group_deltas(moments, sign):
+    now = timezone.now()
+    deltas = {"posts_count": len(moments)}
+    for field, span in WINDOWS.items():
+        deltas[field] = sum(1 for moment in moments if moment >= now - span)
+    return {
+        field: _shift(field, sign * delta)
+        for field, delta in deltas.items() if delta
+    }
+
+
+def group_posts_added(group_id, moments):
+    """Новые посты группы с датами публикации moments."""
+    if group_id is None or not moments:
+        return
+    latest = max(moments)
+    values = _group_deltas(moments, 1)
+    values["last_post_at"] = Case(
+        When(last_post_at__gte=latest, then=F("last_post_at")),
+        default=Value(latest, output_field=DateTimeField()),
+        output_field=DateTimeField(),
+    )
+    if not GroupStats.objects.filter(group_id=group_id).update(**values):
+        GroupStats.objects.get_or_create(group_id=group_id)
+        GroupStats.objects.filter(group_id=group_id).update(**values)
+
+
+def group_post_removed(group_id, moment):
+    """Пост удалён из группы или перенесён в другую."""
+    if group_id is None:
+        return
+    stats = GroupStats.objects.filter(group_id=group_id)
+    stats.update(**_group_deltas([moment], -1))
+    # если ушёл последний пост, время берётся у предыдущего по индексу
+    # (group, pub_date, id)
+    stats.filter(last_post_at__lte=moment).update(
+        last_post_at=_latest_post(group_id)
+    )
+
+
+def _latest_post(group):
+    return Subquery(
+        Post.objects.filter(group=group).order_by("-pub_date", "-id")
+        .values("pub_date")[:1]
+    )
+
+
+def group_stats_for(group):
+    try:
+        return group.stats
+    except GroupStats.DoesNotExist:
+        return GroupStats.objects.get_or_create(group=group)[0]
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats.objects.get_or_create(user=user)[0]
+
+
+def _count_of(model, field, **filters):
+    rows = model.objects.filter(
+        **{field: OuterRef("pk")}, **filters
+    ).order_by().values(field).annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def recount():
+    """Пересчитывает все счётчики несколькими UPDATE ... SET = (SELECT)."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        "pk", flat=True
+    )
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in missing.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    posts = Post.objects.update(comment_count=_count_of(Comment, "post"))
+    users = UserStats.objects.update(
+        posts_count=_count_of(Post, "author"),
+        followers_count=_count_of(Follow, "author"),
+        following_count=_count_of(Follow, "user"),
+    )
+    return posts, users
+
+
+def refresh_groups():
+    """Пересчитывает сводку всех групп, в том числе окна активности."""
+    now = timezone.now()
+    missing = Group.objects.filter(stats__isnull=True).values_list(
+        "pk", flat=True
+    )
+    GroupStats.objects.bulk_create(
+        (GroupStats(group_id=pk) for pk in missing.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    windows = {
+        field: _count_of(Post, "group", pub_date__gte=now - span)
+        for field, span in WINDOWS.items()
+    }
+    refreshed = GroupStats.objects.update(
+        posts_count=_count_of(Post, "group"),
+        last_post_at=_latest_post(OuterRef("pk")),
+        refreshed_at=now,
+        **windows,
+    )
+    slugs = dict(Group.objects.values_list("pk", "slug"))
+    cache.touch(*(cache.version_key("group", pk) for pk in slugs))
+    cache.purge_edge(slugs=slugs.values())
+    edge.purge("groups")
+    return refreshed
@@ -0,0 +1,153 @@
+"""
+Выгрузка данных пользователя: профиль, посты, комментарии и подписки.
+
+Записи читаются .iterator(chunk_size) без создания моделей и отдаются
+генератором кусками по CHUNK байт, поэтому память не зависит от числа
+постов, а первые байты уходят клиенту сразу. Строки JSONL совместимы с
+import_posts. Zip пишется в поток без перемотки: кроме data.jsonl в него
+попадают картинки постов из media/.
+"""
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK = 64 * 1024
+CHUNK_SIZE = 2000
+
+
+def records(user, chunk_size=CHUNK_SIZE):
+    yield {
+        "type": "user",
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "date_joined": user.date_joined,
+    }
+    posts = user.posts.order_by("pk").values(
+        "id", "text", "pub_date", "group__slug", "image"
+    )
+    for post in posts.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "post",
+            "id": post["id"],
+            "author": user.username,
+            "text": post["text"],
+            "pub_date": post["pub_date"],
+            "group": post["group__slug"],
+            "image": post["image"] or None,
+        }
+    comments = user.comments.order_by("pk").values(
+        "id", "post_id", "parent_id", "text", "created"
+    )
+    for comment in comments.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "comment",
+            "id": comment["id"],
+            "post": comment["post_id"],
+            "parent": comment["parent_id"],
+            "author": user.username,
+            "text": comment["text"],
+            "created": comment["created"],
+        }
+    following = user.follower.order_by("pk").values_list(
+        "author__username", flat=True
+    )
+    for username in following.iterator(chunk_size=chunk_size):
+        yield {"type": "following", "author": username}
+    followers = user.following.order_by("pk").values_list(
+        "user__username", flat=True
+    )
+    for username in followers.iterator(chunk_size=chunk_size):
+        yield {"type": "follower", "user": username}
+
+
+def _lines(user, chunk_size):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records(user, chunk_size):
+        yield (encoder.encode(record) + "\n").encode()
+
+
+def jsonl_chunks(user, chunk_size=CHUNK_SIZE):
+    lines = _lines(user, chunk_size)
+    # профиль уходит сразу, остальное — кусками по CHUNK
+    yield next(lines)
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+class _Sink:
+    """Файл только на запись: zipfile пишет в него, генератор забирает."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def _image_names(user, chunk_size):
+    names = user.posts.exclude(image="").exclude(image=None).order_by(
+        "pk"
+    ).values_list("image", flat=True)
+    for name in names.iterator(chunk_size=chunk_size):
+        if default_storage.exists(name):
+            yield name
+
+
+def zip_chunks(user, chunk_size=CHUNK_SIZE):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.jsonl", "w", force_zip64=True) as entry:
+            lines = _lines(user, chunk_size)
+            entry.write(next(lines))
+            yield sink.drain()
+            for line in lines:
+                entry.write(line)
+                if sink.size >= CHUNK:
+                    yield sink.drain()
+        for name in _image_names(user, chunk_size):
+            # картинки уже сжаты, поэтому кладутся как есть
+            info = zipfile.ZipInfo(f"media/{name}")
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = default_storage.size(name)
+            with default_storage.open(name) as source, \
+                    archive.open(info, "w") as entry:
+                for block in iter(lambda: source.read(CHUNK), b""):
+                    entry.write(block)
+                    if sink.size >= CHUNK:
+                        yield sink.drain()
+    yield sink.drain()
+
+
+def export_chunks(user, data_format="jsonl", chunk_size=CHUNK_SIZE):
+    if data_format == "zip":
+        return zip_chunks(user, chunk_size)
+    return jsonl_chunks(user, chunk_size)
@@ -0,0 +1,275 @@
+"""
+Материализованная лента подписок.
+
+Посты обычных авторов раскладываются по лентам подписчиков при публикации
+(fan-out on write). Посты авторов, у которых подписчиков больше
+FEED_FANOUT_LIMIT, не раскладываются, а подмешиваются при чтении ленты
+(fan-out on read), чтобы один пост не порождал миллионы записей.
+
+Режим автора хранится флагом UserStats.feed_pull и меняется только
+задачей switch_mode(), когда число подписчиков пересекло порог: переход
+к раскладке сначала заполняет ленты подписчиков постами, написанными без
+неё, а переход к чтению удаляет ставшие лишними записи. Задачу ставят
+сигналы подписок (FEED_MODE_SWITCH) и manage.py rebalance_feeds.
+
+FeedPaginator листает ленту по самим записям FeedEntry: страница — это
+диапазон индекса (user, pub_date, post) без сортировки, посты страницы
+читаются по id. Посты авторов без раскладки выбираются отдельным запросом
+на автора по индексу (author, pub_date, id) и сливаются с записями.
+"""
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Q
+
+from . import jobs
+from .models import FeedEntry, Follow, Post, UserStats
+from .paginators import CursorPage, decode_cursor, newer_than, older_than
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# id постов в одном DELETE ... IN: не больше 999 параметров у старых SQLite
+DELETE_CHUNK = 300
+
+
+def fanout_limit():
+    return getattr(settings, "FEED_FANOUT_LIMIT", 5000)
+
+
+def backfill_limit():
+    return getattr(settings, "FEED_BACKFILL_LIMIT", 500)
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(user_id=author_id, feed_pull=True).exists()
+
+
+def pull_author_ids(user):
+    """Авторы из подписок пользователя, чьи посты читаются без раскладки."""
+    return list(
+        UserStats.objects.filter(
+            user__following__user=user, feed_pull=True
+        ).values_list("user_id", flat=True)
+    )
+
+
+def fan_out_post(post):
+    if is_pull_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_posts(posts):
+    """fan_out_post() для пачки: подписчики всех авторов одним запросом."""
+    author_ids = {post.author_id for post in posts}
+    pull = set(
+        UserStats.objects.filter(
+            user_id__in=author_ids, feed_pull=True
+        ).values_list("user_id", flat=True)
+    )
+    followers = {}
+    follows = Follow.objects.filter(
+        author_id__in=author_ids - pull
+    ).values_list("author_id", "user_id")
+    for author_id, user_id in follows.iterator():
+        followers.setdefault(author_id, []).append(user_id)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for post in posts
+            for user_id in followers.get(post.author_id, ())
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def add_author(user_id, author_id):
+    """Заполняет ленту последними постами автора после подписки."""
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        "-pub_date"
+    ).values_list("id", "pub_date")[:backfill_limit()]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def mismatched_authors():
+    """id авторов, чей режим не соответствует числу подписчиков."""
+    limit = fanout_limit()
+    return UserStats.objects.filter(
+        Q(feed_pull=False, followers_count__gt=limit)
+        | Q(feed_pull=True, followers_count__lte=limit)
+    ).values_list("user_id", flat=True)
+
+
+def _fill_followers(author_id, after_pk=0):
+    """Записи последних постов автора в ленты всех его подписчиков."""
+    posts = list(
+        Post.objects.filter(author_id=author_id, pk__gt=after_pk)
+        .order_by("-pub_date").values_list("id", "pub_date")
+        [:backfill_limit()]
+    )
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id in followers.iterator()
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def switch_mode(author_id):
+    """
+    Переводит автора в режим, соответствующий числу подписчиков. Лента
+    при этом не теряет и не повторяет постов: при слиянии FeedPaginator
+    убирает посты, которые есть и в записях, и в выборке по автору.
+    """
+    stats = UserStats.objects.filter(user_id=author_id)
+    current = stats.values_list("followers_count", "feed_pull").first()
+    if current is None:
+        return False
+    followers, pull = current
+    if (followers > fanout_limit()) == pull:
+        return False
+    if not pull:
+        # чтение начинает подмешивать посты автора сразу, записи уже не нужны
+        stats.update(feed_pull=True)
+        posts = Post.objects.filter(author_id=author_id)
+        for ids in jobs.batches(posts, DELETE_CHUNK):
+            FeedEntry.objects.filter(post_id__in=ids).delete()
+        return True
+    # пока флаг стоит, новые посты не раскладываются: после снятия флага
+    # догоняем то, что автор написал во время заполнения
+    last = Post.objects.aggregate(last=Max("pk"))["last"] or 0
+    _fill_followers(author_id)
+    stats.update(feed_pull=False)
+    _fill_followers(author_id, after_pk=last)
+    return True
+
+
+def _switch_logged(author_id):
+    try:
+        switch_mode(author_id)
+    except Exception:
+        logger.exception("Не удалось сменить режим ленты автора %s", author_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_switch(author_id):
+    """Ставит switch_mode(), если число подписчиков автора пересекло порог."""
+    if not mismatched_authors().filter(user_id=author_id).exists():
+        return
+    mode = getattr(settings, "FEED_MODE_SWITCH", "thread")
+    if mode == "sync":
+        switch_mode(author_id)
+    elif mode == "thread":
+        transaction.on_commit(
+            partial(jobs.executor().submit, _switch_logged, author_id)
+        )
+
+
+def remove_author(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id,
+    ).delete()
+
+
+def feed_posts(user):
+    """
+    Посты ленты подписок одним запросом (без сортировки). Его порядок
+    требует сортировки всей ленты, поэтому страницы листает FeedPaginator,
+    а это — для проверки принадлежности поста ленте и нумерованных страниц.
+    """
+    pull_authors = pull_author_ids(user)
+    if not pull_authors:
+        return Post.objects.filter(feed_entries__user=user)
+    entries = FeedEntry.objects.filter(user=user).values("post_id")
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author_id__in=pull_authors)
+    )
+
+
+class FeedPaginator:
+    is_cursor = True
+
+    def __init__(self, user, per_page, posts=None):
+        self.user = user
+        self.per_page = int(per_page)
+        self.posts = Post.objects.for_cards() if posts is None else posts
+
+    def key_queries(self, after=None, before=None, pull_authors=None):
+        """
+        Запросы ключей (pub_date, id поста) страницы: записи ленты и посты
+        каждого автора без раскладки.
+        """
+        if pull_authors is None:
+            pull_authors = pull_author_ids(self.user)
+        sources = [(FeedEntry.objects.filter(user=self.user), "post_id")]
+        sources += [
+            (Post.objects.filter(author_id=author_id), "pk")
+            for author_id in pull_authors
+        ]
+        for queryset, key in sources:
+            if before:
+                queryset = newer_than(queryset, *before, key=key).order_by(
+                    "pub_date", key
+                )
+            else:
+                if after:
+                    queryset = older_than(queryset, *after, key=key)
+                queryset = queryset.order_by("-pub_date", f"-{key}")
+            yield queryset.values_list("pub_date", key)[:self.per_page + 1]
+
+    def keys(self, after, before):
+        found = {}
+        for queryset in self.key_queries(after, before):
+            # пост автора, сменившего режим, может быть в обоих источниках
+            for pub_date, pk in queryset:
+                found[pk] = pub_date
+        ordered = sorted(
+            ((pub_date, pk) for pk, pub_date in found.items()),
+            reverse=not before,
+        )
+        return ordered[:self.per_page + 1]
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after)
+        before = None if after else decode_cursor(before)
+        keys = self.keys(after, before)
+        more = len(keys) > self.per_page
+        ids = [pk for _, pk in keys[:self.per_page]]
+        if before:
+            ids.reverse()
+        posts = self.posts.in_bulk(ids)
+        rows = [posts[pk] for pk in ids if pk in posts]
+        if before:
+            return CursorPage(rows, True, more)
+        return CursorPage(rows, more, bool(after))
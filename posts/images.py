@@ -0,0 +1,138 @@
+"""
+Фоновая обработка картинок постов.
+
+При загрузке картинки пост помечается image_ready=False, а задача
+render_variants() в отдельном процессе готовит обрезанную карточку
+960x339 в JPEG и набор WebP разной ширины без метаданных. Шаблоны
+ссылаются на готовые файлы, поэтому при рендеринге картинки не трогаются.
+
+Режим задаётся POSTS_IMAGE_PROCESSING:
+    "process" — пул процессов внутри веб-сервера;
+    "worker"  — только пометка, обработку делает manage.py process_images;
+    "sync"    — сразу в запросе (для тестов и отладки).
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import purge_edge
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+CARD_SIZE = (960, 339)
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANTS_DIR = "posts/variants"
+
+_executor = None
+
+
+def variant_dir(image_name):
+    # имя с расширением: image.png и image.jpg — разные файлы, и их
+    # варианты не должны перезаписывать друг друга
+    return f"{VARIANTS_DIR}/{os.path.basename(image_name)}"
+
+
+def card_name(image_name):
+    return f"{variant_dir(image_name)}/card.jpg"
+
+
+def webp_name(image_name, width):
+    return f"{variant_dir(image_name)}/w{width}.webp"
+
+
+def _card_height(width):
+    return round(width * CARD_SIZE[1] / CARD_SIZE[0])
+
+
+def render_variants(source_path, target_dir):
+    """
+    Готовит все варианты картинки. Работает только с путями к файлам,
+    поэтому выполняется в отдельном процессе без Django.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        # новое изображение без info/exif исходного файла
+        image = image.convert("RGB")
+        clean = Image.new("RGB", image.size)
+        clean.paste(image)
+
+    card = ImageOps.fit(clean, CARD_SIZE, Image.LANCZOS)
+    card.save(
+        os.path.join(target_dir, "card.jpg"),
+        "JPEG", quality=85, optimize=True, progressive=True,
+    )
+    for width in VARIANT_WIDTHS:
+        variant = ImageOps.fit(
+            clean, (width, _card_height(width)), Image.LANCZOS
+        )
+        variant.save(
+            os.path.join(target_dir, f"w{width}.webp"),
+            "WEBP", quality=80, method=4,
+        )
+
+
+def mark_ready(post_id, image_name):
+    # updated меняется, чтобы сменился ключ закэшированной карточки
+    if Post.objects.filter(pk=post_id, image=image_name).update(
+        image_ready=True, updated=timezone.now()
+    ):
+        # update() мимо сигналов: на краю сбрасываем страницы с постом сами
+        purge_edge(posts=[post_id])
+
+
+def process(post_id, image_name):
+    render_variants(
+        default_storage.path(image_name),
+        default_storage.path(variant_dir(image_name)),
+    )
+    mark_ready(post_id, image_name)
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, "POSTS_IMAGE_WORKERS", 2)
+        )
+    return _executor
+
+
+def _finished(post_id, image_name, future):
+    try:
+        future.result()
+        mark_ready(post_id, image_name)
+    except Exception:
+        logger.exception("Не удалось обработать картинку поста %s", post_id)
+    finally:
+        connections.close_all()
+
+
+def submit(post_id, image_name):
+    mode = getattr(settings, "POSTS_IMAGE_PROCESSING", "process")
+    if mode == "sync":
+        process(post_id, image_name)
+    elif mode == "process":
+        future = executor().submit(
+            render_variants,
+            default_storage.path(image_name),
+            default_storage.path(variant_dir(image_name)),
+        )
+        future.add_done_callback(partial(_finished, post_id, image_name))
+
+
+def schedule(post):
+    """Ставит обработку новой картинки поста после коммита транзакции."""
+    Post.objects.filter(pk=post.pk).update(image_ready=False)
+    post.image_ready = False
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(partial(submit, post.pk, name))
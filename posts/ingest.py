@@ -0,0 +1,493 @@
+"""
+Пакетный импорт постов и комментариев из JSONL или CSV.
+
+Строка — объект с полем type: "post" (id, author, text, group, pub_date)
+или "comment" (id, post, parent, author, text, created). id — номер
+записи в источнике: post и parent комментария сначала ищутся среди id
+файла, затем среди id базы. Ответ получает путь ветки от родителя, и,
+как в форме комментария, глубже MAX_DEPTH ветка не растёт. Текст
+проверяется полями NewPostForm и CommentForm
+без создания формы на каждую строку, а авторы, группы и посты ищутся по
+словарям, которые дополняются одним запросом на пачку. Пачка вставляется
+bulk_create в одной транзакции вместе со счётчиками, лентами подписок и
+поисковым индексом: сигналы bulk_create не вызывает. После каждой пачки
+номер последней строки пишется в файл контрольной точки, а новые id
+записей файла дописываются в соседний <точка>.ids, и прерванный импорт
+продолжается с неё.
+"""
+import csv
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Max, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache, counters, feed, search
+from .forms import CommentForm, NewPostForm
+from .models import (
+    MAX_DEPTH, PATH_STEP, ROOT_BASE, Comment, Group, Post, User,
+)
+
+BATCH_SIZE = 500
+# не больше 999 параметров в запросе для старых SQLite
+UPDATE_CHUNK = 300
+
+_post_text = NewPostForm.base_fields["text"]
+_comment_text = CommentForm.base_fields["text"]
+
+
+def read_jsonl(lines):
+    """Тройки (номер строки, объект, ошибка разбора)."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, None, f"не JSON: {error}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "ожидался объект"
+            continue
+        yield number, row, None
+
+
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # пустые ячейки — то же, что отсутствующие ключи в JSONL
+        row = {key: value for key, value in row.items() if value}
+        yield reader.line_num, row, None
+
+
+def read_rows(file, data_format):
+    readers = {"jsonl": read_jsonl, "csv": read_csv}
+    return readers[data_format](file)
+
+
+class Lookup:
+    """
+    username → id, slug → id, id уже существующих постов, id постов
+    источника → id вставленных, и для комментариев — id → (id, пост,
+    путь, родитель), отдельно для файла и для базы.
+    """
+
+    def __init__(self, imported=None, imported_comments=None):
+        self.users = {}
+        self.groups = {}
+        self.posts = set()
+        self.comments = {}
+        self.imported = {} if imported is None else imported
+        self.imported_comments = (
+            {} if imported_comments is None else imported_comments
+        )
+        # соответствия, ещё не дописанные в файл id
+        self.added = []
+
+    def load(self, rows):
+        names = {str(row["author"]) for row in rows if row.get("author")}
+        names -= self.users.keys()
+        if names:
+            self.users.update(
+                User.objects.filter(username__in=names).values_list(
+                    "username", "pk"
+                )
+            )
+        slugs = {str(row["group"]) for row in rows if row.get("group")}
+        slugs -= self.groups.keys()
+        if slugs:
+            self.groups.update(
+                Group.objects.filter(slug__in=slugs).values_list("slug", "pk")
+            )
+
+    def load_posts(self, rows):
+        post_ids = {
+            int(row["post"]) for row in rows
+            if str(row.get("post", "")).isdigit()
+            and str(row["post"]) not in self.imported
+        }
+        post_ids -= self.posts
+        if post_ids:
+            self.posts.update(
+                Post.objects.filter(pk__in=post_ids).values_list(
+                    "pk", flat=True
+                )
+            )
+
+    def load_comments(self, rows):
+        comment_ids = {
+            int(row["parent"]) for row in rows
+            if str(row.get("parent", "")).isdigit()
+            and str(row["parent"]) not in self.imported_comments
+        }
+        comment_ids -= self.comments.keys()
+        if comment_ids:
+            comments = Comment.objects.filter(pk__in=comment_ids)
+            for pk, *comment in comments.values_list(
+                "pk", "post_id", "path", "parent_id"
+            ):
+                self.comments[pk] = (pk, *comment)
+
+    def comment(self, reference):
+        reference = str(reference)
+        if reference in self.imported_comments:
+            return self.imported_comments[reference]
+        if reference.isdigit():
+            return self.comments.get(int(reference))
+        return None
+
+    def post_id(self, reference):
+        reference = str(reference)
+        if reference in self.imported:
+            return self.imported[reference]
+        if reference.isdigit() and int(reference) in self.posts:
+            return int(reference)
+        return None
+
+    def remember(self, rows, pks):
+        """id постов источника → id, под которыми они вставлены."""
+        for row, pk in zip(rows, pks):
+            if row.get("id") is not None:
+                self.imported[str(row["id"])] = pk
+                self.added.append(("post", str(row["id"]), pk))
+
+    def remember_comments(self, rows, comments):
+        for row, comment in zip(rows, comments):
+            if row.get("id") is not None:
+                value = (
+                    comment.pk, comment.post_id, comment.path,
+                    comment.parent_id,
+                )
+                self.imported_comments[str(row["id"])] = value
+                self.added.append(("comment", str(row["id"]), value))
+
+
+def _moment(value):
+    if not value:
+        return None
+    moment = parse_datetime(str(value))
+    if moment is None:
+        raise ValidationError(f"Неверная дата: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _reply_to(row, post_id, lookup):
+    """id и путь того, кому на самом деле отвечает комментарий."""
+    if row.get("parent") in (None, ""):
+        return None, ""
+    parent = lookup.comment(row["parent"])
+    if parent is None:
+        raise ValidationError(f"Нет комментария {row['parent']}")
+    parent_id, parent_post_id, path, grandparent_id = parent
+    if parent_post_id != post_id:
+        raise ValidationError(
+            f"Комментарий {row['parent']} относится к другому посту"
+        )
+    if path.count("/") < MAX_DEPTH - 1:
+        return parent_id, path
+    return grandparent_id, path.rsplit("/", 1)[0]
+
+
+def _author_id(row, lookup):
+    author_id = lookup.users.get(str(row.get("author")))
+    if author_id is None:
+        raise ValidationError(f"Нет пользователя {row.get('author')}")
+    return author_id
+
+
+def build(row, lookup):
+    """Несохранённый объект и его дата из строки импорта."""
+    kind = row.get("type", "post")
+    if kind == "post":
+        group_id = None
+        if row.get("group"):
+            group_id = lookup.groups.get(str(row["group"]))
+            if group_id is None:
+                raise ValidationError(f"Нет группы {row['group']}")
+        post = Post(
+            author_id=_author_id(row, lookup),
+            group_id=group_id,
+            text=_post_text.clean(row.get("text")),
+        )
+        return post, _moment(row.get("pub_date"))
+    if kind == "comment":
+        post_id = lookup.post_id(row.get("post", ""))
+        if post_id is None:
+            raise ValidationError(f"Нет поста {row.get('post')}")
+        parent_id, parent_path = _reply_to(row, post_id, lookup)
+        comment = Comment(
+            post_id=post_id,
+            parent_id=parent_id,
+            author_id=_author_id(row, lookup),
+            text=_comment_text.clean(row.get("text")),
+        )
+        # путь ответа дописывается после вставки, когда известен id
+        comment.parent_path = parent_path
+        return comment, _moment(row.get("created"))
+    raise ValidationError(f"Неизвестный type: {kind}")
+
+
+def _inserted_pks(model, objects, before, fields):
+    """
+    bulk_create на SQLite не проставляет id. Записи пачки — это строки с
+    id больше прежнего максимума; содержимое сверяется, чтобы не захватить
+    строки, вставленные параллельно.
+    """
+    if all(obj.pk for obj in objects):
+        return [obj.pk for obj in objects]
+    wanted = Counter(
+        tuple(getattr(obj, field) for field in fields) for obj in objects
+    )
+    pks = []
+    rows = model.objects.filter(pk__gt=before).order_by("pk").values_list(
+        "pk", *fields
+    )
+    for pk, *values in rows.iterator():
+        key = tuple(values)
+        if wanted[key]:
+            wanted[key] -= 1
+            pks.append(pk)
+    return pks
+
+
+def _insert(model, objects, moments, fields, date_field):
+    if not objects:
+        return []
+    before = model.objects.aggregate(last=Max("pk"))["last"] or 0
+    model.objects.bulk_create(objects)
+    pks = _inserted_pks(model, objects, before, fields)
+    # дату из источника ставит один UPDATE ... CASE на кусок пачки:
+    # auto_now_add при вставке её перезаписывает
+    # у Value свой output_field, иначе SQLite получит дату в формате
+    # драйвера, а не Django, и сравнения по ней сломаются
+    field = DateTimeField()
+    dated = [(pk, moment) for pk, moment in zip(pks, moments) if moment]
+    for start in range(0, len(dated), UPDATE_CHUNK):
+        chunk = dict(dated[start:start + UPDATE_CHUNK])
+        model.objects.filter(pk__in=chunk).update(**{
+            date_field: Case(
+                *(When(pk=pk, then=Value(moment, output_field=field))
+                  for pk, moment in chunk.items()),
+                output_field=field,
+            )
+        })
+    return pks
+
+
+def _after_insert(posts, comments):
+    """То, что для одиночных записей делают сигналы."""
+    for author_id, count in Counter(p.author_id for p in posts).items():
+        counters.bump_user(author_id, posts_count=count)
+    for post_id, count in Counter(c.post_id for c in comments).items():
+        counters.bump_post(post_id, count)
+    moments = defaultdict(list)
+    for post in posts:
+        moments[post.group_id].append(post.pub_date)
+    for group_id, group_moments in moments.items():
+        counters.group_posts_added(group_id, group_moments)
+    feed.fan_out_posts(posts)
+    search.get_backend().index(
+        [search.post_document(post) for post in posts]
+        + [search.comment_document(comment) for comment in comments]
+    )
+    touched = posts + [comment.post for comment in comments]
+    transaction.on_commit(lambda: cache.invalidate_posts(touched))
+
+
+def _build_all(batch, lookup, errors):
+    objects, rows, moments = [], [], []
+    for number, row in batch:
+        try:
+            obj, moment = build(row, lookup)
+        except ValidationError as error:
+            errors.append((number, "; ".join(error.messages)))
+            continue
+        objects.append(obj)
+        rows.append(row)
+        moments.append(moment)
+    return objects, rows, moments
+
+
+def _comment_levels(batch, errors):
+    """
+    Комментарии пачки слоями: ответ идёт в слое после своего родителя,
+    если родитель в той же пачке.
+    """
+    pending = batch
+    while pending:
+        waiting = {
+            str(row["id"]) for _, row in pending if row.get("id") is not None
+        }
+        level = [
+            item for item in pending
+            if str(item[1].get("parent")) not in waiting
+        ]
+        if not level:
+            for number, row in pending:
+                errors.append(
+                    (number, f"Нет комментария {row.get('parent')}")
+                )
+            return
+        yield level
+        pending = [
+            item for item in pending
+            if str(item[1].get("parent")) in waiting
+        ]
+
+
+def _insert_comments(level, lookup, errors):
+    rows = [row for _, row in level]
+    lookup.load_posts(rows)
+    lookup.load_comments(rows)
+    comments, rows, moments = _build_all(level, lookup, errors)
+    pks = _insert(
+        Comment, comments, moments,
+        ("post_id", "author_id", "text"), "created",
+    )
+    Comment.objects.filter(pk__in=pks).fill_root_paths()
+    replies = []
+    for comment, pk in zip(comments, pks):
+        comment.pk = pk
+        if comment.parent_id is None:
+            comment.path = f"{ROOT_BASE - pk:0{PATH_STEP}d}"
+        else:
+            comment.path = f"{comment.parent_path}/{pk:0{PATH_STEP}d}"
+            replies.append(comment)
+    Comment.objects.bulk_update(replies, ["path"], batch_size=UPDATE_CHUNK)
+    lookup.remember_comments(rows, comments)
+    return pks
+
+
+def ingest_batch(batch, lookup, errors):
+    lookup.load([row for _, row in batch])
+    # комментарии строятся после вставки постов: post может ссылаться
+    # на пост из этой же пачки
+    first_error = len(errors)
+    post_batch = [item for item in batch if item[1].get("type") != "comment"]
+    comment_batch = [
+        item for item in batch if item[1].get("type") == "comment"
+    ]
+    posts, post_rows, post_dates = _build_all(post_batch, lookup, errors)
+
+    with transaction.atomic():
+        post_ids = _insert(
+            Post, posts, post_dates, ("author_id", "text"), "pub_date"
+        )
+        lookup.remember(post_rows, post_ids)
+        comment_ids = []
+        for level in _comment_levels(comment_batch, errors):
+            comment_ids += _insert_comments(level, lookup, errors)
+        posts = list(
+            Post.objects.filter(pk__in=post_ids).select_related("author")
+        )
+        comments = list(
+            Comment.objects.filter(pk__in=comment_ids).select_related(
+                "author", "post__author"
+            )
+        )
+        _after_insert(posts, comments)
+    lookup.posts.update(post_ids)
+    errors[first_error:] = sorted(errors[first_error:])
+    return len(posts), len(comments)
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {"line": 0, "posts": 0, "comments": 0}
+    with open(path) as file:
+        return json.load(file)
+
+
+def load_ids(path):
+    """id постов и комментариев источника из файла, дописанного save_ids()."""
+    ids = {"post": {}, "comment": {}}
+    if not path or not os.path.exists(path):
+        return ids
+    with open(path) as file:
+        for line in file:
+            try:
+                kind, reference, value = json.loads(line)
+            except ValueError:
+                # строка, оборванная при падении: пачка импортируется заново
+                continue
+            ids[kind][reference] = value
+    return ids
+
+
+def save_ids(path, entries):
+    """
+    Дописывает новые соответствия: файл растёт с числом записей, а не
+    переписывается целиком после каждой пачки.
+    """
+    if not path or not entries:
+        return
+    with open(path, "a") as file:
+        file.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def save_checkpoint(path, state):
+    if not path:
+        return
+    # сначала во временный файл: оборванная запись не испортит точку
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def ingest(rows, batch_size=BATCH_SIZE, checkpoint=None, log=None):
+    """
+    Импортирует тройки из read_rows(). Возвращает число вставленных
+    постов и комментариев (с учётом прошлых запусков по той же точке)
+    и список ошибок (номер строки, текст) этого запуска.
+    """
+    log = log or (lambda message: None)
+    state = load_checkpoint(checkpoint)
+    ids_path = f"{checkpoint}.ids" if checkpoint else None
+    ids = load_ids(ids_path)
+    errors = []
+    lookup = Lookup(ids["post"], ids["comment"])
+    batch = []
+    last = state["line"]
+
+    def flush():
+        posts, comments = ingest_batch(batch, lookup, errors)
+        state.update(
+            line=last,
+            posts=state["posts"] + posts,
+            comments=state["comments"] + comments,
+        )
+        # сначала id: точка не должна опережать их
+        save_ids(ids_path, lookup.added)
+        lookup.added = []
+        save_checkpoint(checkpoint, state)
+        log(
+            f"Строка {last}: постов {state['posts']}, "
+            f"комментариев {state['comments']}, ошибок {len(errors)}"
+        )
+
+    for number, row, error in rows:
+        if number <= state["line"]:
+            continue
+        last = number
+        if error:
+            errors.append((number, error))
+            continue
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch or last > state["line"]:
+        flush()
+    return {
+        "posts": state["posts"],
+        "comments": state["comments"],
+        "errors": errors,
+    }
@@ -0,0 +1,89 @@
+"""
+Массовые действия админки пачками в фоне.
+
+Стандартное delete_selected собирает все выбранные объекты со связями в
+память ради страницы подтверждения и удаляет их одной транзакцией — на
+миллионе комментариев это минуты с заблокированной базой. Здесь выборка
+обходится keyset-курсором по id, и каждая пачка из ADMIN_JOB_BATCH_SIZE
+строк обрабатывается в своей короткой транзакции. Сигналы моделей
+срабатывают как обычно, поэтому счётчики, кэши и индекс поиска не
+расходятся с базой.
+
+Тот же фоновый поток выполняет смену режима ленты автора (posts.feed).
+
+Режим задаётся ADMIN_JOBS:
+    "thread" — отдельный поток веб-сервера после коммита запроса;
+    "sync"   — сразу в запросе (для тестов и отладки).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        # один поток: задачи не конкурируют друг с другом за запись в базу
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="admin-jobs"
+        )
+    return _executor
+
+
+def batches(queryset, batch_size):
+    """Списки id выборки по возрастанию, не больше batch_size в каждом."""
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last).order_by("pk").values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def run(queryset, operation, batch_size=None):
+    batch_size = batch_size or getattr(settings, "ADMIN_JOB_BATCH_SIZE", 500)
+    manager = queryset.model._default_manager
+    total = 0
+    for ids in batches(queryset, batch_size):
+        with transaction.atomic():
+            operation(manager.filter(pk__in=ids))
+        total += len(ids)
+    return total
+
+
+def _run_logged(queryset, operation, description):
+    try:
+        total = run(queryset, operation)
+        logger.info("%s: обработано %s", description, total)
+    except Exception:
+        logger.exception("Фоновая задача не выполнена: %s", description)
+    finally:
+        connections.close_all()
+
+
+def submit(queryset, operation, description):
+    """Запускает операцию над выборкой после коммита текущей транзакции."""
+    mode = getattr(settings, "ADMIN_JOBS", "thread")
+    queryset = queryset.order_by()
+    if mode == "sync":
+        run(queryset, operation)
+    else:
+        transaction.on_commit(partial(
+            executor().submit, _run_logged, queryset, operation, description
+        ))
+
+
+def delete(queryset):
+    queryset.delete()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import render_templates
+
+
+class Command(BaseCommand):
+    help = "Замеряет рендеринг страницы ленты из десяти карточек постов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=10)
+        parser.add_argument("--template", default="index.html")
+
+    def handle(self, *args, **options):
+        result = render_templates(
+            iterations=options["iterations"],
+            posts=options["posts"],
+            template_name=options["template"],
+        )
+        if not result["posts"]:
+            raise CommandError("Нет постов: запустите generate_data")
+        for key, value in result.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import bench_urls, compare, run_client, run_http
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет p50/p95/p99, число запросов к БД и пиковую память на "
+        "страницах постов и сравнивает с сохранённой базой"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50,
+                            help="запросов на страницу")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--http", metavar="BASE_URL",
+            help="нагружать запущенный сервер, а не тестовый клиент",
+        )
+        parser.add_argument("--workers", type=int, default=8,
+                            help="одновременных соединений для --http")
+        parser.add_argument("--baseline", help="JSON с базой для сравнения")
+        parser.add_argument("--save", help="куда записать отчёт в JSON")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="допустимый рост p95 и памяти в долях",
+        )
+
+    def handle(self, *args, **options):
+        found = bench_urls()
+        if found is None:
+            raise CommandError("Нет данных: запустите generate_data")
+        urls, reader = found
+
+        if options["http"]:
+            report = run_http(
+                options["http"], urls, reader,
+                requests=options["requests"], workers=options["workers"],
+            )
+        else:
+            report = run_client(
+                urls, reader,
+                requests=options["requests"], warmup=options["warmup"],
+            )
+
+        self.stdout.write(
+            f"{'страница':<14}{'p50':>9}{'p95':>9}{'p99':>9}"
+            f"{'запросов':>10}{'ошибок':>8}"
+        )
+        for name, page in report["pages"].items():
+            queries = "-" if page["queries"] is None else page["queries"]
+            self.stdout.write(
+                f"{name:<14}{page['p50_ms']:>9}{page['p95_ms']:>9}"
+                f"{page['p99_ms']:>9}{queries:>10}{page['errors']:>8}"
+            )
+        self.stdout.write(f"Запросов в секунду: {report['rps']}")
+        if report["peak_rss_kb"]:
+            self.stdout.write(f"Пиковый RSS: {report['peak_rss_kb']} КБ")
+
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+            regressions = compare(report, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError(
+                    "Регрессии относительно базы:\n" + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,106 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.feed import FeedPaginator
+from posts.models import Follow, Post, User
+from posts.paginators import older_than
+from posts.seed import seed
+
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?(?P<table>\w+)(?!.*USING)")
+# страница, отсортированная во временном B-дереве, читает весь диапазон
+SORT = "USE TEMP B-TREE"
+
+
+def feed_queries(user, author, group, post):
+    """
+    Запросы представлений лент в том виде, в каком их строят views, и
+    признак постраничного запроса: таким сортировка запрещена.
+    """
+    middle = Post.objects.order_by("-pub_date", "-pk")[5:6].get()
+    feeds = {
+        "index": Post.objects.for_cards(),
+        "group": Post.objects.filter(group=group).for_cards(),
+        "profile": author.posts.for_cards(),
+    }
+    for name, queryset in feeds.items():
+        yield name, queryset.order_by("-pub_date", "-pk")[:11], True
+        yield f"{name}?after=", older_than(
+            queryset, middle.pub_date, middle.pk
+        ).order_by("-pub_date", "-pk")[:11], True
+    # лента подписок: записи FeedEntry и посты автора без раскладки
+    paginator = FeedPaginator(user, 10)
+    for suffix, after in (("", None), ("?after=", middle)):
+        cursor = after and (after.pub_date, after.pk)
+        queries = paginator.key_queries(cursor, pull_authors=[author.pk])
+        for source, queryset in zip(("entries", "pull"), queries):
+            yield f"follow_index {source}{suffix}", queryset, True
+    yield "follow_index posts", Post.objects.for_cards().filter(
+        pk__in=[post.pk, middle.pk]
+    ), False
+    comments = post.comments.select_related("author").order_by("path")
+    yield "post comments", comments[:51], True
+    yield "post comments?after=", comments.filter(path__gt="5")[:51], True
+    yield "follow check", Follow.objects.filter(
+        user=user, author=author
+    ), False
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет запросы лент через EXPLAIN QUERY PLAN и падает, "
+        "если какой-то из них полностью сканирует таблицу или сортирует "
+        "страницу во временном B-дереве"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="сколько постов сгенерировать перед проверкой",
+        )
+        parser.add_argument("--users", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN есть только у SQLite")
+        if options["seed"]:
+            seed(
+                users=options["users"],
+                posts=options["seed"],
+                log=self.stdout.write,
+            )
+
+        user = User.objects.filter(follower__isnull=False).first()
+        post = Post.objects.exclude(group=None).first()
+        if user is None or post is None:
+            raise CommandError("Нет данных: запустите с --seed")
+
+        problems = []
+        queries = feed_queries(user, post.author, post.group, post)
+        for name, queryset, paginated in queries:
+            self.stdout.write(name)
+            for detail in explain(queryset):
+                self.stdout.write(f"    {detail}")
+                match = FULL_SCAN.match(detail)
+                table = match.group("table") if match else ""
+                if table.startswith(("posts_", "auth_")) or (
+                    paginated and SORT in detail
+                ):
+                    problems.append(f"{name}: {detail}")
+
+        if problems:
+            raise CommandError(
+                "Полный просмотр или сортировка страницы:\n"
+                + "\n".join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            "Полных просмотров таблиц и сортировок страниц нет"
+        ))
@@ -0,0 +1,36 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import export_chunks
+
+
+class Command(BaseCommand):
+    help = "Выгружает посты, комментарии и подписки пользователя в JSONL или zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=("jsonl", "zip"),
+                            default="jsonl")
+        parser.add_argument(
+            "--output", default="-",
+            help="файл для выгрузки, по умолчанию stdout",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Нет пользователя {options['username']}")
+
+        chunks = export_chunks(user, options["format"])
+        if options["output"] == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(options["output"], "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        self.stderr.write(f"Выгружено в {options['output']}")
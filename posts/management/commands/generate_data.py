@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.seed import BATCH_SIZE, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует пользователей, группы, посты, комментарии и подписки "
+        "со степенным распределением популярности авторов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--comments", type=int, default=100000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument(
+            "--follows", type=int, default=20,
+            help="среднее число подписок на пользователя",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="зерно генератора; разные зёрна дают разных пользователей",
+        )
+        parser.add_argument(
+            "--skip-search-index", action="store_true",
+            help="не перестраивать поисковый индекс после вставки",
+        )
+
+    def handle(self, *args, **options):
+        seed(
+            users=options["users"],
+            posts=options["posts"],
+            groups=options["groups"],
+            follows=options["follows"],
+            comments=options["comments"],
+            batch_size=options["batch_size"],
+            seed_value=options["seed"],
+            log=self.stdout.write,
+        )
+        # bulk_create обходит сигналы, индексирующие документы
+        if not options["skip_search_index"]:
+            total = search.rebuild(log=self.stdout.write)
+            self.stdout.write(f"Документов в поисковом индексе: {total}")
+        self.stdout.write(self.style.SUCCESS("Готово"))
@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.ingest import BATCH_SIZE, ingest, read_rows
+
+MAX_ERRORS_SHOWN = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует посты и комментарии из JSONL или CSV пачками; "
+        "прерванный импорт продолжается с контрольной точки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=("jsonl", "csv"),
+            help="по умолчанию — по расширению файла",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--checkpoint",
+            help="файл контрольной точки, по умолчанию <path>.checkpoint",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        data_format = options["format"]
+        if data_format is None:
+            data_format = "csv" if path.endswith(".csv") else "jsonl"
+        if not os.path.exists(path):
+            raise CommandError(f"Нет файла {path}")
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+
+        with open(path, newline="", encoding="utf-8") as file:
+            result = ingest(
+                read_rows(file, data_format),
+                batch_size=options["batch_size"],
+                checkpoint=checkpoint,
+                log=self.stdout.write,
+            )
+
+        for number, error in result["errors"][:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f"строка {number}: {error}")
+        if len(result["errors"]) > MAX_ERRORS_SHOWN:
+            self.stderr.write(
+                f"… и ещё {len(result['errors']) - MAX_ERRORS_SHOWN}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано постов: {result['posts']}, "
+            f"комментариев: {result['comments']}, "
+            f"ошибок: {len(result['errors'])}"
+        ))
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.images import mark_ready, render_variants, variant_dir
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Готовит варианты картинок для постов, где они ещё не готовы"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--loop", type=float, default=0,
+            help="опрашивать очередь раз в N секунд, не завершаясь",
+        )
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                done = self.process_pending(pool)
+                if not options["loop"]:
+                    break
+                if not done:
+                    time.sleep(options["loop"])
+
+    def process_pending(self, pool):
+        """
+        Число обработанных картинок. Сбойные остаются в очереди, но не
+        считаются: иначе с --loop одна битая картинка не давала бы уснуть.
+        """
+        pending = Post.objects.filter(image_ready=False).exclude(
+            image=""
+        ).exclude(image=None).values_list("pk", "image")
+        futures = {
+            pool.submit(
+                render_variants,
+                default_storage.path(name),
+                default_storage.path(variant_dir(name)),
+            ): (pk, name)
+            for pk, name in pending.iterator()
+        }
+        done = 0
+        for future in as_completed(futures):
+            pk, name = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                self.stderr.write(f"Пост {pk}: {error}")
+                continue
+            mark_ready(pk, name)
+            self.stdout.write(f"Пост {pk}: готово")
+            done += 1
+        return done
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит авторов между раскладкой постов по лентам и чтением при "
+        "показе, если число подписчиков пересекло FEED_FANOUT_LIMIT; "
+        "нужен после смены порога и при FEED_MODE_SWITCH=worker"
+    )
+
+    def handle(self, *args, **options):
+        switched = sum(
+            feed.switch_mode(author_id)
+            for author_id in list(feed.mismatched_authors())
+        )
+        self.stdout.write(f"Переключено авторов: {switched}")
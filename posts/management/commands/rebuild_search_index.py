@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import CHUNK_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс, читая данные пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        total = rebuild(options["batch_size"], log=self.stdout.write)
+        self.stdout.write(f"Документов в индексе: {total}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import refresh_groups
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает сводку активности групп; запускается по расписанию, "
+        "чтобы сдвигались окна 24 ч и 7 дней"
+    )
+
+    def handle(self, *args, **options):
+        groups = refresh_groups()
+        self.stdout.write(f"Пересчитано групп: {groups}")
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5(
+    kind UNINDEXED,
+    object_id UNINDEXED,
+    url UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(CREATE)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS posts_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_image_ready'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:19
+
+from django.db import migrations, models
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, LPad
+import django.db.models.deletion
+
+ROOT_BASE = 10 ** 10 - 1
+
+
+def fill_paths(apps, schema_editor):
+    # все существующие комментарии — корневые
+    Comment = apps.get_model("posts", "Comment")
+    Comment.objects.update(path=LPad(
+        Cast(Value(ROOT_BASE) - F("id"), CharField()), 10, Value("0")
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=66),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='posts_comme_post_id_abd11d_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:22
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def count_of(model, field, **filters):
+    rows = model.objects.filter(
+        **{field: OuterRef("pk")}, **filters
+    ).order_by().values(field).annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model("posts", "Group")
+    Post = apps.get_model("posts", "Post")
+    GroupStats = apps.get_model("posts", "GroupStats")
+    now = timezone.now()
+    GroupStats.objects.bulk_create(
+        [GroupStats(group_id=pk) for pk in Group.objects.values_list("pk", flat=True)],
+        batch_size=1000,
+    )
+    GroupStats.objects.update(
+        posts_count=count_of(Post, "group"),
+        posts_24h=count_of(Post, "group", pub_date__gte=now - timedelta(hours=24)),
+        posts_7d=count_of(Post, "group", pub_date__gte=now - timedelta(days=7)),
+        last_post_at=Subquery(
+            Post.objects.filter(group=OuterRef("pk"))
+            .order_by("-pub_date", "-id").values("pub_date")[:1]
+        ),
+        refreshed_at=now,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group')),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('last_post_at', models.DateTimeField(blank=True, null=True)),
+                ('posts_24h', models.PositiveIntegerField(default=0)),
+                ('posts_7d', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,27 @@
 from django.db import models
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, LPad
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# путь комментария — id предков и его собственный, по PATH_STEP цифр через
+# "/", так что порядок строк пути и есть порядок ветки. У корневых вместо id
+# стоит ROOT_BASE - id: новые обсуждения выше, ответы под родителем по
+# порядку
+PATH_STEP = 10
+ROOT_BASE = 10 ** PATH_STEP - 1
+MAX_DEPTH = 6
+
+
+class PostQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Всё, что нужно карточке поста, за один запрос: автор и группа.
+        Число комментариев хранится в самом посте (comment_count).
+        """
+        return self.select_related("author", "group")
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -19,6 +38,10 @@ class Post(models.Model):
         "date published",
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        "date updated",
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -34,6 +57,27 @@ class Post(models.Model):
         upload_to="posts/",
         blank=True, null=True
     )
+    image_ready = models.BooleanField(default=False, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["pub_date", "id"]),
+            models.Index(fields=["author", "pub_date", "id"]),
+            models.Index(fields=["group", "pub_date", "id"]),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+    def fill_root_paths(self):
+        """Пути корневых комментариев, вставленных через bulk_create()."""
+        return self.filter(path="").update(path=LPad(
+            Cast(Value(ROOT_BASE) - F("id"), CharField()),
+            PATH_STEP,
+            Value("0"),
+        ))
 
 
 class Comment(models.Model):
@@ -47,12 +91,67 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name="comments"
     )
+    parent = models.ForeignKey(
+        "self",
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="replies"
+    )
+    path = models.CharField(
+        max_length=MAX_DEPTH * (PATH_STEP + 1),
+        default="",
+        editable=False
+    )
     text = models.TextField()
     created = models.DateTimeField(
         "date published",
         auto_now_add=True
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "created"]),
+            models.Index(fields=["post", "path"]),
+        ]
+
+    @property
+    def depth(self):
+        return self.path.count("/")
+
+    def reply_target(self):
+        """Кому на самом деле отвечать: глубже MAX_DEPTH ветка не растёт."""
+        if self.depth < MAX_DEPTH - 1:
+            return self
+        return self.parent
+
+    def make_path(self):
+        if self.parent_id is None:
+            return f"{ROOT_BASE - self.pk:0{PATH_STEP}d}"
+        return f"{self.parent.path}/{self.pk:0{PATH_STEP}d}"
+
+    def path_parent_id(self):
+        """id родителя, записанный в пути."""
+        parts = self.path.split("/")
+        if len(parts) == 1:
+            return None
+        if len(parts) == 2:
+            return ROOT_BASE - int(parts[0])
+        return int(parts[-2])
+
+    def save(self, *args, **kwargs):
+        # путь ответов строится из пути родителя, поэтому перенос в другую
+        # ветку разошёлся бы с путями всего поддерева
+        if self.path and self.parent_id != self.path_parent_id():
+            raise ValueError("Родителя комментария нельзя изменить")
+        super().save(*args, **kwargs)
+        # путь строится из id, поэтому вторым запросом после вставки
+        if not self.path:
+            self.path = self.make_path()
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -65,4 +164,65 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name="following"
     )
-    unique_together = ["user", "author"]
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "author"],
+                name="unique_follow"
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя, обновляются сигналами."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # посты читаются при показе ленты, а не раскладываются (см. posts.feed)
+    feed_pull = models.BooleanField(default=False)
+
+
+class GroupStats(models.Model):
+    """
+    Сводка активности группы. Число постов и время последнего меняются
+    сигналами, окна 24 ч и 7 дней сдвигает refresh_group_stats.
+    """
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(blank=True, null=True)
+    posts_24h = models.PositiveIntegerField(default=0)
+    posts_7d = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(blank=True, null=True)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_entries"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="feed_entries"
+    )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = ["user", "post"]
+        indexes = [
+            # порядок ленты целиком в индексе: страница без сортировки
+            models.Index(fields=["user", "-pub_date", "-post"]),
+        ]
@@ -0,0 +1,250 @@
+"""
+Keyset-пагинация лент по ключу (pub_date, id).
+
+В отличие от django.core.paginator.Paginator не делает COUNT(*) и OFFSET:
+каждая страница выбирается диапазонным запросом от курсора ?after=/?before=.
+
+EstimatedCountPaginator — для админки, где нужны номера страниц: точный
+COUNT(*) только до порога, дальше оценка по статистике базы.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+from yatube.cache import get_or_recompute
+
+
+def pack_cursor(*values):
+    """Значения ключа страницы → токен для ?after= / ?before=."""
+    raw = "|".join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def unpack_cursor(token, *types):
+    """
+    Обратно к значениям, каждое приводится своим типом из types. Любой
+    испорченный токен — None, как будто курсора нет.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        values = raw.split("|")
+        if len(values) != len(types):
+            return None
+        return tuple(cast(value) for cast, value in zip(types, values))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return moment
+
+
+def encode_cursor(obj):
+    return pack_cursor(obj.pub_date.isoformat(), obj.pk)
+
+
+def decode_cursor(token):
+    return unpack_cursor(token, _moment, int)
+
+
+def older_than(queryset, pub_date, pk, key="pk"):
+    # отдельное условие pub_date <= X даёт SQLite диапазон по индексу,
+    # с одним только OR планировщик уходит в полный просмотр
+    return queryset.filter(pub_date__lte=pub_date).filter(
+        Q(pub_date__lt=pub_date) | Q(**{f"{key}__lt": pk})
+    )
+
+
+def newer_than(queryset, pub_date, pk, key="pk"):
+    return queryset.filter(pub_date__gte=pub_date).filter(
+        Q(pub_date__gt=pub_date) | Q(**{f"{key}__gt": pk})
+    )
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, cache_key=None, timeout=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.cache_key = cache_key
+        self.timeout = timeout
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after)
+        before = None if after else decode_cursor(before)
+
+        if not after and not before and self.cache_key:
+            return self._cached_first_page()
+
+        if before:
+            pub_date, pk = before
+            rows = list(
+                newer_than(self.object_list, pub_date, pk).order_by(
+                    "pub_date", "pk"
+                )[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return CursorPage(rows, True, has_previous)
+
+        queryset = self.object_list
+        if after:
+            queryset = older_than(queryset, *after)
+        rows = list(
+            queryset.order_by("-pub_date", "-pk")[:self.per_page + 1]
+        )
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], has_next, bool(after))
+
+    def _cached_first_page(self):
+        """
+        Первая страница по закэшированному списку id: вместо сортировки
+        ленты — выборка нескольких строк по первичному ключу.
+        """
+        ids = get_or_recompute(
+            cache,
+            self.cache_key,
+            lambda: list(
+                self.object_list.order_by("-pub_date", "-pk").values_list(
+                    "pk", flat=True
+                )[:self.per_page + 1]
+            ),
+            self.timeout,
+        )
+        page_ids = ids[:self.per_page]
+        posts = self.object_list.in_bulk(page_ids)
+        rows = [posts[pk] for pk in page_ids if pk in posts]
+        return CursorPage(rows, len(ids) > self.per_page, False)
+
+
+def estimated_rows(model, using="default"):
+    """
+    Число строк таблицы по статистике планировщика без её чтения или None,
+    если статистики нет (SQLite до ANALYZE).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        # первое число в stat — строк в таблице на момент ANALYZE
+        "sqlite": "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+        "postgresql": "SELECT reltuples FROM pg_class WHERE relname = %s",
+        "mysql": (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s"
+        ),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(queries[connection.vendor], [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    try:
+        return int(float(str(row[0]).split()[0]))
+    except (IndexError, ValueError):
+        return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Считает строки не дальше ADMIN_EXACT_COUNT_LIMIT: COUNT(*) по подзапросу
+    с LIMIT стоит не больше порога при любом размере таблицы. Если строк
+    больше, для всей таблицы берётся оценка из статистики, для выборки с
+    фильтром или поиском — сам порог. Тогда страница за последней по
+    оценке открывается, пока в ней есть строки.
+    """
+
+    exact = True
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, "ADMIN_EXACT_COUNT_LIMIT", 10000)
+        queryset = self.object_list
+        counted = queryset.order_by().values("pk")[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        self.exact = False
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate:
+                return max(estimate, counted)
+        return counted
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            if self.exact or number < 1:
+                raise
+            bottom = (number - 1) * self.per_page
+            if not self.object_list[bottom:bottom + 1].exists():
+                raise
+            return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number <= self.num_pages:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
@@ -0,0 +1,63 @@
+"""
+Кто на кого подписан.
+
+Подписки пользователя целиком хранятся в кэше множеством id авторов:
+один индексный запрос по (user, author) при промахе, дальше ответы на
+«подписан ли A на B» и «на кого из этих авторов подписан A» — без
+запросов к базе. Множество сбрасывается сигналами подписки и отписки,
+и тогда же отмечается время смены подписок: кнопки «Подписаться» есть на
+каждой карточке, поэтому оно входит в валидаторы условных GET.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import touch, version_key
+from .models import Follow
+
+FOLLOWING_TIMEOUT = 60 * 60
+
+
+def following_key(user_id):
+    return f"following:{user_id}"
+
+
+def following_ids(user):
+    """id авторов, на которых подписан пользователь; у анонима — никого."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = following_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Follow.objects.filter(user_id=user.pk).values_list(
+                "author_id", flat=True
+            )
+        )
+        cache.set(key, ids, FOLLOWING_TIMEOUT)
+    return ids
+
+
+def is_following(user, author_id):
+    return author_id in following_ids(user)
+
+
+def following_among(user, author_ids):
+    return following_ids(user).intersection(author_ids)
+
+
+def version(user_id):
+    """Ключ времени смены подписок: по нему меняется ETag страниц."""
+    return version_key("following", user_id)
+
+
+def invalidate(user_id):
+    key = following_key(user_id)
+
+    def forget():
+        cache.delete(key)
+        touch(version(user_id))
+
+    forget()
+    # и после коммита: параллельный запрос мог успеть закэшировать
+    # множество без этой подписки
+    transaction.on_commit(forget)
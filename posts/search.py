@@ -0,0 +1,248 @@
+"""
+Полнотекстовый поиск по постам, комментариям, группам и пользователям.
+
+Бэкенд выбирается настройкой SEARCH_BACKEND. По умолчанию — SQLite FTS5:
+индекс posts_search обновляется сигналами моделей, ранжирование по bm25,
+подсветка через snippet(), страницы — keyset-курсором по (score, rowid).
+SimpleBackend ищет по тексту постов через icontains и нужен для баз без
+FTS5.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Group, Post, User
+from .paginators import pack_cursor, unpack_cursor
+
+KINDS = ("post", "comment", "group", "user")
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+CHUNK_SIZE = 2000
+
+Document = namedtuple("Document", "kind object_id url title body")
+SearchHit = namedtuple("SearchHit", "kind object_id url title snippet")
+
+
+def doc_id(kind, object_id):
+    """rowid документа в индексе: id объекта и его тип в младших битах."""
+    return object_id * len(KINDS) + KINDS.index(kind)
+
+
+def post_document(post):
+    url = reverse("post", args=[post.author.username, post.pk])
+    return Document("post", post.pk, url, post.author.username, post.text)
+
+
+def comment_document(comment):
+    post = comment.post
+    url = reverse("post", args=[post.author.username, post.pk])
+    return Document(
+        "comment",
+        comment.pk,
+        f"{url}#comment_{comment.pk}",
+        comment.author.username,
+        comment.text,
+    )
+
+
+def group_document(group):
+    url = reverse("group", args=[group.slug])
+    return Document("group", group.pk, url, group.title, group.description)
+
+
+def user_document(user):
+    url = reverse("profile", args=[user.username])
+    return Document(
+        "user", user.pk, url, user.username, user.get_full_name()
+    )
+
+
+def all_documents():
+    """Все документы для перестроения индекса, без загрузки в память."""
+    posts = Post.objects.select_related("author").order_by("pk")
+    for post in posts.iterator(chunk_size=CHUNK_SIZE):
+        yield post_document(post)
+    comments = Comment.objects.select_related(
+        "author", "post__author"
+    ).order_by("pk")
+    for comment in comments.iterator(chunk_size=CHUNK_SIZE):
+        yield comment_document(comment)
+    for group in Group.objects.order_by("pk").iterator(chunk_size=CHUNK_SIZE):
+        yield group_document(group)
+    for user in User.objects.order_by("pk").iterator(chunk_size=CHUNK_SIZE):
+        yield user_document(user)
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
+
+
+class SqliteFTSBackend:
+    table = "posts_search"
+
+    def match_expression(self, query):
+        # каждое слово — отдельная фраза с поиском по префиксу, так что
+        # синтаксис FTS5 из пользовательского ввода не интерпретируется
+        words = [word.replace('"', '""') for word in query.split()]
+        return " ".join(f'"{word}"*' for word in words if word.strip('"'))
+
+    def index(self, documents):
+        rows = [
+            (doc_id(doc.kind, doc.object_id), doc.kind, doc.object_id,
+             doc.url, doc.title, doc.body)
+            for doc in documents
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.table}"
+                "(rowid, kind, object_id, url, title, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [(doc_id(kind, pk),) for pk in object_ids],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, query, after=None, limit=20):
+        expression = self.match_expression(query)
+        if not expression:
+            return [], None
+        cursor_values = unpack_cursor(after, float, int)
+        sql = (
+            "SELECT * FROM ("
+            " SELECT rowid, kind, object_id, url, title,"
+            f" snippet({self.table}, 4, %s, %s, '…', 16),"
+            f" bm25({self.table}, 0, 0, 0, 4.0, 1.0) AS score"
+            f" FROM {self.table} WHERE {self.table} MATCH %s"
+            ")"
+        )
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, expression]
+        if cursor_values:
+            score, rowid = cursor_values
+            sql += " WHERE score > %s OR (score = %s AND rowid > %s)"
+            params += [score, score, rowid]
+        sql += " ORDER BY score, rowid LIMIT %s"
+        params.append(limit + 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        hits = [
+            SearchHit(kind, object_id, url, title, highlight(snippet))
+            for _, kind, object_id, url, title, snippet, _ in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = pack_cursor(last[-1], last[0])
+        return hits, next_cursor
+
+    def object_ids(self, kind, query, limit=500):
+        """id объектов одного типа по запросу, лучшие совпадения первыми."""
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT object_id FROM {self.table}"
+                f" WHERE {self.table} MATCH %s AND kind = %s"
+                " ORDER BY rank LIMIT %s",
+                [expression, kind, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SimpleBackend:
+    """Поиск без индекса — только по тексту постов."""
+
+    def index(self, documents):
+        pass
+
+    def remove(self, kind, object_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, after=None, limit=20):
+        if not query.strip():
+            return [], None
+        posts = Post.objects.select_related("author").filter(
+            text__icontains=query
+        ).order_by("-pk")
+        cursor_values = unpack_cursor(after, int)
+        if cursor_values:
+            posts = posts.filter(pk__lt=cursor_values[0])
+        posts = list(posts[:limit + 1])
+        hits = []
+        for post in posts[:limit]:
+            doc = post_document(post)
+            hits.append(
+                SearchHit(doc.kind, doc.object_id, doc.url, doc.title,
+                          escape(doc.body[:200]))
+            )
+        next_cursor = None
+        if len(posts) > limit:
+            next_cursor = pack_cursor(posts[limit - 1].pk)
+        return hits, next_cursor
+
+    def object_ids(self, kind, query, limit=500):
+        if not query.strip():
+            return []
+        model, field = {
+            "post": (Post, "text"),
+            "comment": (Comment, "text"),
+            "group": (Group, "title"),
+            "user": (User, "username"),
+        }[kind]
+        return list(
+            model.objects.filter(**{f"{field}__icontains": query})
+            .order_by("-pk").values_list("pk", flat=True)[:limit]
+        )
+
+
+def get_backend():
+    default = (
+        "posts.search.SqliteFTSBackend"
+        if connection.vendor == "sqlite"
+        else "posts.search.SimpleBackend"
+    )
+    path = getattr(settings, "SEARCH_BACKEND", None) or default
+    return import_string(path)()
+
+
+def rebuild(batch_size=CHUNK_SIZE, log=None):
+    backend = get_backend()
+    backend.clear()
+    batch = []
+    total = 0
+    for document in all_documents():
+        batch.append(document)
+        if len(batch) >= batch_size:
+            backend.index(batch)
+            total += len(batch)
+            batch = []
+            if log:
+                log(f"Проиндексировано: {total}")
+    backend.index(batch)
+    return total + len(batch)
@@ -0,0 +1,191 @@
+"""
+Генерация тестовых данных пачками через bulk_create.
+
+Популярность авторов распределена по закону Ципфа: немногие пишут
+большую часть постов и собирают большую часть подписчиков, а число
+подписок на пользователя — по Парето, как в живой социальной сети.
+
+bulk_create не вызывает сигналы, поэтому после вставки счётчики
+пересчитываются recount() и refresh_groups(), а ленты подписок
+заполняются отдельно.
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters, feed
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 5000
+# показатель степени в распределении популярности авторов
+ZIPF_EXPONENT = 1.1
+# хвост распределения числа подписок на пользователя (среднее — 3)
+PARETO_ALPHA = 1.5
+WORDS = (
+    "лето море город книга утро друг дорога кофе работа музыка вечер "
+    "небо дом поезд снег сад окно река песня письмо"
+).split()
+
+
+@contextmanager
+def _without_auto_now_add(model, field_name):
+    """Позволяет задать дату публикации вручную, а не «сейчас»."""
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _text(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _zipf_weights(count, exponent=ZIPF_EXPONENT):
+    """Накопленные веса для random.choices: k-й по популярности ~ 1/k**s."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def _follow_pairs(rng, user_ids, follows):
+    """Подписки: в среднем follows на пользователя, авторы — по Ципфу."""
+    authors = rng.sample(user_ids, len(user_ids))
+    weights = _zipf_weights(len(authors))
+    pairs = set()
+    for user_id in user_ids:
+        wanted = rng.paretovariate(PARETO_ALPHA) * follows / 3
+        wanted = min(len(user_ids) - 1, max(1, round(wanted)))
+        chosen = set()
+        # популярных авторов выбирают повторно, поэтому попыток с запасом
+        for _ in range(wanted * 4):
+            author_id = rng.choices(authors, cum_weights=weights)[0]
+            if author_id != user_id:
+                chosen.add(author_id)
+                if len(chosen) >= wanted:
+                    break
+        pairs.update((user_id, author_id) for author_id in chosen)
+    return pairs
+
+
+def _insert(model, objects, batch_size):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def seed(users=100, posts=10000, groups=10, follows=10, comments=0,
+         batch_size=BATCH_SIZE, seed_value=0, log=None):
+    rng = random.Random(seed_value)
+    log = log or (lambda message: None)
+    prefix = f"seed{seed_value}_"
+
+    with transaction.atomic():
+        _insert(
+            User,
+            (User(username=f"{prefix}{i}", password="!") for i in range(users)),
+            batch_size,
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith=prefix).values_list(
+                "pk", flat=True
+            )
+        )
+        _insert(
+            Group,
+            (
+                Group(title=f"Группа {i}", slug=f"{prefix}{i}", description="")
+                for i in range(groups)
+            ),
+            batch_size,
+        )
+        group_ids = list(
+            Group.objects.filter(slug__startswith=prefix).values_list(
+                "pk", flat=True
+            )
+        )
+    log(f"Пользователей: {len(user_ids)}, групп: {len(group_ids)}")
+
+    authors = rng.sample(user_ids, len(user_ids))
+    author_weights = _zipf_weights(len(authors))
+    now = timezone.now()
+    with _without_auto_now_add(Post, "pub_date"):
+        for start in range(0, posts, batch_size):
+            with transaction.atomic():
+                Post.objects.bulk_create(
+                    [
+                        Post(
+                            text=_text(rng),
+                            author_id=rng.choices(
+                                authors, cum_weights=author_weights
+                            )[0],
+                            group_id=(
+                                rng.choice(group_ids)
+                                if group_ids and rng.random() < 0.5 else None
+                            ),
+                            pub_date=now - timedelta(seconds=posts - i),
+                        )
+                        for i in range(start, min(start + batch_size, posts))
+                    ]
+                )
+            log(f"Постов: {min(start + batch_size, posts)}")
+
+    post_ids = list(
+        Post.objects.filter(author__username__startswith=prefix)
+        .order_by("pk").values_list("pk", flat=True)
+    ) if comments else []
+    if post_ids:
+        # обсуждают тоже в основном немногие посты
+        post_weights = _zipf_weights(len(post_ids))
+        rng.shuffle(post_ids)
+        with _without_auto_now_add(Comment, "created"):
+            for start in range(0, comments, batch_size):
+                with transaction.atomic():
+                    Comment.objects.bulk_create(
+                        [
+                            Comment(
+                                post_id=rng.choices(
+                                    post_ids, cum_weights=post_weights
+                                )[0],
+                                author_id=rng.choice(user_ids),
+                                text=_text(rng, words=6),
+                                created=now - timedelta(seconds=comments - i),
+                            )
+                            for i in range(
+                                start, min(start + batch_size, comments)
+                            )
+                        ]
+                    )
+                log(f"Комментариев: {min(start + batch_size, comments)}")
+        Comment.objects.fill_root_paths()
+
+    pairs = _follow_pairs(rng, user_ids, follows)
+    _insert(
+        Follow,
+        (Follow(user_id=user, author_id=author) for user, author in pairs),
+        batch_size,
+    )
+    log(f"Подписок: {len(pairs)}")
+
+    counters.recount()
+    counters.refresh_groups()
+    # лент ещё нет: для популярных авторов только ставится флаг чтения
+    for author_id in list(feed.mismatched_authors()):
+        feed.switch_mode(author_id)
+    for user_id, author_id in pairs:
+        feed.add_author(user_id, author_id)
+
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    return user_ids
@@ -0,0 +1,71 @@
+from rest_framework import serializers
+
+from .models import Comment, Follow, Group, Post
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=id,text оставляет в ответе только перечисленные поля,
+    чтобы клиент получал лишь то, что показывает.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        fields = request.query_params.get("fields") if request else None
+        if fields:
+            wanted = set(fields.split(","))
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class GroupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    posts_count = serializers.IntegerField(
+        source="stats.posts_count", read_only=True
+    )
+    posts_24h = serializers.IntegerField(
+        source="stats.posts_24h", read_only=True
+    )
+    posts_7d = serializers.IntegerField(
+        source="stats.posts_7d", read_only=True
+    )
+    last_post_at = serializers.DateTimeField(
+        source="stats.last_post_at", read_only=True
+    )
+
+    class Meta:
+        model = Group
+        fields = (
+            "id", "title", "slug", "description",
+            "posts_count", "posts_24h", "posts_7d", "last_post_at",
+        )
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source="author.username", read_only=True)
+    group = serializers.SlugRelatedField(slug_field="slug", read_only=True)
+
+    class Meta:
+        model = Post
+        fields = (
+            "id", "text", "pub_date", "updated", "author", "group",
+            "image", "comment_count",
+        )
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source="author.username", read_only=True)
+    depth = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ("id", "post", "parent", "depth", "author", "text", "created")
+
+
+class FollowSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = serializers.CharField(source="user.username", read_only=True)
+    author = serializers.CharField(source="author.username", read_only=True)
+
+    class Meta:
+        model = Follow
+        fields = ("id", "user", "author")
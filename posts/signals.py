@@ -0,0 +1,161 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from yatube import edge
+
+from . import cache, counters, feed, images, relationships, search
+from .models import (
+    Comment, Follow, Group, GroupStats, Post, User, UserStats
+)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    search.get_backend().index([search.user_document(instance)])
+    cache.touch(cache.version_key("user", instance.pk))
+    # вход в систему меняет только last_login, которого нет на страницах
+    if set(kwargs.get("update_fields") or ()) != {"last_login"}:
+        cache.purge_edge(authors=[instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    search.get_backend().remove("user", [instance.pk])
+
+
+@receiver(post_init, sender=Group)
+def group_loaded(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get("slug")
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+    search.get_backend().index([search.group_document(instance)])
+    cache.touch(cache.version_key("group", instance.pk))
+    cache.purge_edge(slugs={instance._loaded_slug, instance.slug} - {None})
+    edge.purge("groups")
+    instance._loaded_slug = instance.slug
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    search.get_backend().remove("group", [instance.pk])
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # запоминаем состояние из БД, чтобы при правке сбросить старые ключи
+    instance._loaded_group_id = instance.__dict__.get("group_id")
+    instance._loaded_updated = instance.__dict__.get("updated")
+    instance._loaded_image = str(instance.__dict__.get("image") or "")
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    image = str(instance.image or "")
+    if image and image != instance._loaded_image:
+        images.schedule(instance)
+    instance._loaded_image = image
+    search.get_backend().index([search.post_document(instance)])
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        counters.group_posts_added(instance.group_id, [instance.pub_date])
+        feed.fan_out_post(instance)
+        cache.invalidate_post(instance)
+        cache.purge_edge(
+            authors=[instance.author_id],
+            group_ids=[instance.group_id],
+            index=True,
+        )
+        return
+    if instance._loaded_group_id != instance.group_id:
+        counters.group_post_removed(
+            instance._loaded_group_id, instance.pub_date
+        )
+        counters.group_posts_added(instance.group_id, [instance.pub_date])
+    card = None
+    if instance._loaded_updated is not None:
+        card = cache.card_key(
+            instance.pk, instance._loaded_updated, instance.author.username
+        )
+    cache.invalidate_post(instance, [instance._loaded_group_id], card)
+    # страницы, где пост уже есть, помечены post-<id>; группы — на случай
+    # переноса поста
+    moved = {instance._loaded_group_id, instance.group_id}
+    cache.purge_edge(
+        posts=[instance.pk],
+        group_ids=moved if len(moved) > 1 else (),
+    )
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_updated = instance.updated
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+    counters.group_post_removed(instance.group_id, instance.pub_date)
+    search.get_backend().remove("post", [instance.pk])
+    cache.invalidate_post(instance, card=cache.card_key(
+        instance.pk, instance.updated, instance.author.username
+    ))
+    cache.purge_edge(
+        posts=[instance.pk],
+        authors=[instance.author_id],
+        group_ids=[instance.group_id],
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id, 1)
+    search.get_backend().index([search.comment_document(instance)])
+    cache.touch_post(instance.post)
+    cache.purge_edge(posts=[instance.post_id])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    search.get_backend().remove("comment", [instance.pk])
+    try:
+        post = instance.post
+    except Post.DoesNotExist:
+        # комментарий удаляется вместе с постом
+        cache.touch(cache.version_key("post", instance.post_id))
+    else:
+        cache.touch_post(post)
+    cache.purge_edge(posts=[instance.post_id])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.user_id, following_count=1)
+        counters.bump_user(instance.author_id, followers_count=1)
+        feed.add_author(instance.user_id, instance.author_id)
+        feed.schedule_switch(instance.author_id)
+        relationships.invalidate(instance.user_id)
+        cache.touch(
+            cache.version_key("user", instance.user_id),
+            cache.version_key("user", instance.author_id),
+        )
+        cache.purge_edge(authors=[instance.user_id, instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    feed.remove_author(instance.user_id, instance.author_id)
+    feed.schedule_switch(instance.author_id)
+    relationships.invalidate(instance.user_id)
+    cache.touch(
+        cache.version_key("user", instance.user_id),
+        cache.version_key("user", instance.author_id),
+    )
+    cache.purge_edge(authors=[instance.user_id, instance.author_id])
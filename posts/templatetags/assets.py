@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def _read(path):
+    with staticfiles_storage.open(path) as source:
+        return source.read().decode()
+
+
+@register.simple_tag
+def inline_css(path):
+    """
+    Встраивает CSS первого экрана в <style>, чтобы страница рисовалась, не
+    дожидаясь внешних стилей. Файл читается один раз за жизнь процесса.
+    """
+    return mark_safe(f"<style>{_read(path)}</style>")
@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+from django import template
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.safestring import mark_safe
+
+from posts.relationships import following_among
+
+register = template.Library()
+
+POST_ITEM = "includes/post_item.html"
+# шаблоны URL, ссылки по которым есть на каждой карточке поста
+MEMOIZED_URLS = {
+    "profile", "post", "post_edit", "group",
+    "profile_follow", "profile_unfollow",
+}
+
+
+@lru_cache(maxsize=8192)
+def _reverse(prefix, urlconf, name, args):
+    return reverse(name, urlconf=urlconf, args=args)
+
+
+def cached_reverse(name, *args):
+    """reverse() для ссылок карточки: один и тот же пост на многих страницах."""
+    if name not in MEMOIZED_URLS:
+        return reverse(name, args=args)
+    args = tuple(str(arg) for arg in args)
+    return _reverse(get_script_prefix(), get_urlconf(), name, args)
+
+
+@receiver(setting_changed)
+def _clear_reverse_cache(setting, **kwargs):
+    if setting == "ROOT_URLCONF":
+        _reverse.cache_clear()
+
+
+@register.simple_tag
+def post_url(name, *args):
+    return cached_reverse(name, *args)
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    Карточки постов. Шаблон карточки берётся один раз на весь список,
+    а не заново в каждой итерации, как при {% include %} в цикле, и все
+    карточки рендерятся в одном render_context, так что вложенные
+    inclusion-теги тоже находят свои шаблоны один раз. Подписки
+    зрителя на авторов карточек берутся одним обращением к кэшу.
+    """
+    card = context.template.engine.get_template(POST_ITEM)
+    posts = list(posts)
+    user = context.get("user")
+    followed = frozenset()
+    if user is not None:
+        followed = following_among(user, {post.author_id for post in posts})
+    output = []
+    with context.render_context.push_state(card):
+        for post in posts:
+            following = post.author_id in followed
+            with context.push(post=post, following_author=following):
+                output.append(card.nodelist.render(context))
+    return mark_safe("".join(output))
@@ -0,0 +1,28 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from posts.images import VARIANT_WIDTHS, card_name, webp_name
+
+register = template.Library()
+
+
+@register.inclusion_tag("includes/post_picture.html")
+def post_picture(post):
+    """
+    Картинка карточки поста из заранее подготовленных вариантов.
+    Пока обработка не закончена, показывается исходный файл.
+    """
+    if not post.image:
+        return {"image": None}
+    name = post.image.name
+    if not post.image_ready:
+        return {"image": True, "src": default_storage.url(name)}
+    srcset = ", ".join(
+        f"{default_storage.url(webp_name(name, width))} {width}w"
+        for width in VARIANT_WIDTHS
+    )
+    return {
+        "image": True,
+        "src": default_storage.url(card_name(name)),
+        "srcset": srcset,
+    }
@@ -1,11 +1,65 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import zipfile
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
 from PIL import Image
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import EmptyPage
+from django.core.wsgi import get_wsgi_application
+from django.db import IntegrityError, connection, router
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
-from django.test import TestCase, Client
+from django.test import (
+    TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 from six import BytesIO
 
-from posts.models import Post, Follow
+from posts import images, jobs
+from posts.benchmark import bench_urls, render_templates, run_http
+from posts.cache import card_key, version_key
+from posts.concurrency import gather
+from posts.feed import FeedPaginator, is_pull_author
+from posts.paginators import EstimatedCountPaginator
+from posts.relationships import following_among, is_following
+from posts.search import get_backend
+from yatube import metrics
+from yatube.asgi import ASGIHandler, application as asgi_application
+from yatube.cache import get_or_recompute
+from yatube.edge import EdgeCache, HTTPPurger, local_store
+from yatube.middleware import PIN_COOKIE, ReplicaMiddleware
+from yatube.sessions import SessionStore
+from yatube.staticfiles import (
+    CompressedManifestStaticFilesStorage, serve as serve_static
+)
+from users.auth import get_user, snapshot_cache, snapshot_key
+from users.checks import shared_auth_caches
+from users.forms import CreationForm
+from posts.models import (
+    MAX_DEPTH, Post, Follow, FeedEntry, Group, GroupStats, Comment,
+    UserStats,
+)
 
 
 class TestPostsCreation(TestCase):
@@ -186,7 +240,39 @@ class TestCache(TestCase):
 
         Post.objects.create(text="check 2", author=self.user)  # noqa
         response = self.client_auth.get(reverse("index"))
-        self.assertNotContains(response, "check 2")
+        self.assertContains(response, "check 2")
+
+    def test_cached_card_is_replaced_after_edit(self):
+        post = Post.objects.create(text="before edit", author=self.user)
+        self.client_auth.get(reverse("index"))
+        self.assertIsNotNone(
+            cache.get(card_key(post.pk, post.updated, self.user.username))
+        )
+
+        post.text = "after edit"
+        post.save()
+        response = self.client_auth.get(reverse("index"))
+        self.assertContains(response, "after edit")
+        self.assertNotContains(response, "before edit")
+
+    def test_renamed_author_gets_new_profile_link_on_cards(self):
+        Post.objects.create(text="renamed", author=self.user)
+        self.client.get(reverse("index"))
+        old_link = reverse("profile", args=[self.user.username])
+        self.user.username = "renamed_author"
+        self.user.save()
+        response = self.client.get(reverse("index"))
+        self.assertContains(
+            response, reverse("profile", args=["renamed_author"])
+        )
+        self.assertNotContains(response, f'href="{old_link}"')
+
+    def test_deleted_post_leaves_feed(self):
+        post = Post.objects.create(text="to delete", author=self.user)
+        self.client_auth.get(reverse("index"))
+        post.delete()
+        response = self.client_auth.get(reverse("index"))
+        self.assertNotContains(response, "to delete")
 
 
 class TestCommentsFollows(TestCase):
@@ -317,3 +403,1819 @@ class TestCommentsFollows(TestCase):
             reverse("follow_index")
         )
         self.assertNotContains(response, "Text123")
+
+
+@override_settings(FEED_MODE_SWITCH="sync")
+class TestFollowFeed(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(
+            username="reader", password="12345"
+        )
+        self.author = User.objects.create_user(
+            username="author", password="12345"
+        )
+        self.client_auth = Client()
+        self.client_auth.force_login(self.reader)
+
+    def follow(self):
+        self.client_auth.get(
+            reverse("profile_follow", kwargs={"username": "author"})
+        )
+
+    def test_post_is_fanned_out_to_followers(self):
+        self.follow()
+        post = Post.objects.create(text="fan-out", author=self.author)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        response = self.client_auth.get(reverse("follow_index"))
+        self.assertContains(response, "fan-out")
+
+    def test_follow_backfills_and_unfollow_clears_feed(self):
+        Post.objects.create(text="old post", author=self.author)
+        self.follow()
+        response = self.client_auth.get(reverse("follow_index"))
+        self.assertContains(response, "old post")
+
+        self.client_auth.get(
+            reverse("profile_unfollow", kwargs={"username": "author"})
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        response = self.client_auth.get(reverse("follow_index"))
+        self.assertNotContains(response, "old post")
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_popular_author_is_read_on_demand(self):
+        self.follow()
+        Post.objects.create(text="popular", author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.client_auth.get(reverse("follow_index"))
+        self.assertContains(response, "popular")
+
+    def test_pages_merge_entries_and_pulled_authors(self):
+        star = User.objects.create_user(username="star")
+        Follow.objects.create(user=self.reader, author=star)
+        self.follow()
+        posts = []
+        for number in range(7):
+            author = star if number % 2 else self.author
+            posts.append(Post.objects.create(text=str(number), author=author))
+        # посты звезды остались в лентах с тех пор, как раскладывались
+        UserStats.objects.filter(user=star).update(feed_pull=True)
+        FeedEntry.objects.filter(post=posts[1]).delete()
+        expected = [post.pk for post in reversed(posts)]
+        paginator = FeedPaginator(self.reader, 3)
+        seen, page = [], paginator.get_page()
+        while True:
+            seen += [post.pk for post in page]
+            if not page.has_next():
+                break
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertEqual(seen, expected)
+        back = paginator.get_page(before=page.previous_cursor)
+        self.assertEqual([post.pk for post in back], expected[3:6])
+
+    def feed_texts(self):
+        return [post.text for post in FeedPaginator(self.reader, 20).get_page()]
+
+    def test_crossing_the_limit_keeps_feed_complete(self):
+        other = User.objects.create_user(username="other")
+        self.follow()
+        Post.objects.create(text="push", author=self.author)
+        with override_settings(FEED_FANOUT_LIMIT=1):
+            Follow.objects.create(user=other, author=self.author)
+            self.assertTrue(is_pull_author(self.author.pk))
+            self.assertFalse(
+                FeedEntry.objects.filter(post__author=self.author).exists()
+            )
+            Post.objects.create(text="pull", author=self.author)
+            self.assertEqual(self.feed_texts(), ["pull", "push"])
+
+            Follow.objects.filter(user=other).delete()
+            self.assertFalse(is_pull_author(self.author.pk))
+            self.assertEqual(
+                FeedEntry.objects.filter(user=self.reader).count(), 2
+            )
+            self.assertEqual(self.feed_texts(), ["pull", "push"])
+
+    def test_rebalance_command_applies_new_limit(self):
+        self.follow()
+        Post.objects.create(text="post", author=self.author)
+        out = StringIO()
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            call_command("rebalance_feeds", stdout=out)
+        self.assertIn("Переключено авторов: 1", out.getvalue())
+        self.assertTrue(is_pull_author(self.author.pk))
+        self.assertEqual(self.feed_texts(), ["post"])
+
+    def test_feed_page_is_read_in_index_order(self):
+        query = FeedEntry.objects.filter(user=self.reader).order_by(
+            "-pub_date", "-post_id"
+        ).values_list("pub_date", "post_id")[:11]
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="writer", password="1")
+        Post.objects.bulk_create(
+            Post(text=f"post {i}", author=self.user) for i in range(25)
+        )
+        self.url = reverse("profile", kwargs={"username": "writer"})
+
+    def test_pages_cover_feed_without_overlap(self):
+        seen = []
+        response = self.client.get(self.url)
+        while True:
+            page = response.context["page"]
+            seen.extend(post.id for post in page)
+            if not page.has_next():
+                break
+            response = self.client.get(
+                self.url, {"after": page.next_cursor}
+            )
+        expected = list(
+            Post.objects.order_by("-pub_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual(seen, expected)
+
+    def test_before_returns_previous_page(self):
+        first = self.client.get(self.url).context["page"]
+        second = self.client.get(
+            self.url, {"after": first.next_cursor}
+        ).context["page"]
+        back = self.client.get(
+            self.url, {"before": second.previous_cursor}
+        ).context["page"]
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(self.url, {"after": "garbage!"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 10)
+
+    @override_settings(POSTS_NUMBERED_PAGINATION=["profile"])
+    def test_numbered_pagination_is_opt_in(self):
+        response = self.client.get(self.url, {"page": 3})
+        self.assertEqual(response.context["page"].number, 3)
+        self.assertContains(response, "?page=2")
+
+
+class QueryBudgetMixin:
+    """Проверка, что страница укладывается в фиксированное число запросов."""
+
+    def assertQueryBudget(self, client, url, budget):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = "\n".join(query["sql"] for query in context.captured_queries)
+        self.assertLessEqual(len(context), budget, sql)
+        return len(context)
+
+
+class TestPostCardQueries(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(
+            title="group", slug="group", description="group"
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client_auth = Client()
+        self.client_auth.force_login(self.reader)
+
+    def add_posts(self, number):
+        for i in range(number):
+            post = Post.objects.create(
+                text=f"post {i}", author=self.author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.reader, text="c")
+
+    def check_pages(self, budgets):
+        self.add_posts(1)
+        small = {
+            url: self.assertQueryBudget(client, url, budget)
+            for url, client, budget in budgets
+        }
+        self.add_posts(15)
+        for url, client, budget in budgets:
+            self.assertEqual(
+                self.assertQueryBudget(client, url, budget), small[url], url
+            )
+
+    def test_listing_query_count_does_not_depend_on_page_size(self):
+        self.check_pages([
+            (reverse("index"), self.client, 2),
+            # плюс один запрос валидаторов условного GET
+            (reverse("group", kwargs={"slug": "group"}), self.client, 4),
+            (reverse("profile", kwargs={"username": "author"}), self.client, 5),
+            # ключи страницы по индексу FeedEntry, затем посты по id
+            (reverse("follow_index"), self.client_auth, 6),
+        ])
+
+    def test_comment_list_query_count_does_not_depend_on_size(self):
+        post = Post.objects.create(text="post", author=self.author)
+        url = reverse("post", kwargs={"username": "author", "post_id": post.id})
+        Comment.objects.create(post=post, author=self.reader, text="c")
+        small = self.assertQueryBudget(self.client, url, 4)
+        for _ in range(10):
+            Comment.objects.create(post=post, author=self.author, text="c")
+        self.assertEqual(self.assertQueryBudget(self.client, url, 4), small)
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(text="post", author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text="c"
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.reader.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.author.stats.followers_count, 0)
+
+    def test_profile_shows_follower_counts(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(
+            reverse("profile", kwargs={"username": "author"})
+        )
+        self.assertContains(response, "Подписчиков: 1")
+
+    def test_recount_fixes_drift(self):
+        post = Post.objects.create(text="post", author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text="c")
+        Post.objects.update(comment_count=7)
+        UserStats.objects.update(posts_count=0, followers_count=3)
+
+        call_command("recount_stats", stdout=StringIO())
+
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 0)
+
+
+class TestTieredCache(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_writes_go_to_shared_tier(self):
+        cache.set("key", "value", 60)
+        shared = caches["shared"]
+        self.assertEqual(shared.get(cache.make_key("key"), version=0), "value")
+        cache.l1.clear()
+        self.assertEqual(cache.get("key"), "value")
+        cache.delete("key")
+        self.assertIsNone(cache.get("key"))
+
+    def test_stale_value_is_served_while_other_worker_recomputes(self):
+        cache.set("feed", (["stale"], time.time() - 1), 60)
+        cache.add("feed:lock", 1, 10)
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return ["fresh"]
+
+        self.assertEqual(
+            get_or_recompute(cache, "feed", compute, 60), ["stale"]
+        )
+        self.assertEqual(computed, [])
+
+        cache.delete("feed:lock")
+        for _ in range(2):
+            self.assertEqual(
+                get_or_recompute(cache, "feed", compute, 60), ["fresh"]
+            )
+        self.assertEqual(computed, [True])
+
+    def test_lock_expires_in_shared_tier(self):
+        self.assertTrue(cache.add("lock", 1, 1))
+        self.assertFalse(cache.add("lock", 1, 1))
+        time.sleep(1.1)
+        self.assertTrue(cache.add("lock", 1, 1))
+        cache.set("gone", "value", 0)
+        self.assertIsNone(cache.get("gone"))
+
+
+class TestQueryPlans(TestCase):
+    def test_feed_queries_do_not_scan_tables(self):
+        out = StringIO()
+        call_command("explain_feeds", "--seed", "300", "--users", "20",
+                     stdout=out)
+        self.assertIn(
+            "Полных просмотров таблиц и сортировок страниц нет",
+            out.getvalue(),
+        )
+
+    def test_sorted_page_fails_the_check(self):
+        def sorted_feed(*args):
+            # по тексту индекса нет: страница сортируется целиком
+            yield "by text", Post.objects.order_by("text")[:11], True
+
+        with mock.patch(
+            "posts.management.commands.explain_feeds.feed_queries",
+            sorted_feed,
+        ):
+            with self.assertRaisesRegex(CommandError, "TEMP B-TREE"):
+                call_command("explain_feeds", "--seed", "50", "--users", "5",
+                             stdout=StringIO())
+
+    def test_follow_is_unique(self):
+        user = User.objects.create_user(username="user", password="1")
+        author = User.objects.create_user(username="author", password="1")
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=user, author=author)
+
+
+@override_settings(POSTS_IMAGE_PROCESSING="sync")
+class TestImageVariants(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username="sarah", password="1")
+        self.post = Post.objects.create(
+            text="with image",
+            author=self.user,
+            image=SimpleUploadedFile(
+                "photo.png", TestImg.create_test_image_file().read()
+            ),
+        )
+
+    def test_variants_are_rendered_without_metadata(self):
+        images.submit(self.post.pk, self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_ready)
+
+        name = self.post.image.name
+        with Image.open(default_storage.path(images.card_name(name))) as card:
+            self.assertEqual(card.size, images.CARD_SIZE)
+            self.assertFalse(card.info.get("exif"))
+        for width in images.VARIANT_WIDTHS:
+            path = default_storage.path(images.webp_name(name, width))
+            with Image.open(path) as variant:
+                self.assertEqual(variant.format, "WEBP")
+                self.assertEqual(variant.width, width)
+
+    def test_same_stem_with_other_extension_gets_own_variants(self):
+        jpeg = BytesIO()
+        Image.new("RGB", (1200, 800), "blue").save(jpeg, "JPEG")
+        other = Post.objects.create(
+            text="same stem", author=self.user,
+            image=SimpleUploadedFile("photo.jpg", jpeg.getvalue()),
+        )
+        images.submit(self.post.pk, self.post.image.name)
+        images.submit(other.pk, other.image.name)
+
+        cards = {
+            images.card_name(post.image.name) for post in (self.post, other)
+        }
+        self.assertEqual(len(cards), 2)
+        for name in cards:
+            self.assertTrue(default_storage.exists(name))
+
+    @override_settings(POSTS_IMAGE_PROCESSING="worker")
+    def test_worker_sleeps_when_only_broken_images_are_left(self):
+        broken = Post.objects.create(
+            text="broken", author=self.user,
+            image=SimpleUploadedFile("broken.png", b"not an image"),
+        )
+        # третий проход не наступает: sleep прерывает цикл
+        with mock.patch("time.sleep", side_effect=KeyboardInterrupt), \
+                self.assertRaises(KeyboardInterrupt):
+            call_command(
+                "process_images", "--workers", "1", "--loop", "1",
+                stdout=StringIO(), stderr=StringIO(),
+            )
+        self.post.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertTrue(self.post.image_ready)
+        self.assertFalse(broken.image_ready)
+
+    def test_templates_use_precomputed_variants(self):
+        url = reverse("profile", kwargs={"username": "sarah"})
+        response = self.client.get(url)
+        self.assertContains(response, self.post.image.url)
+        self.assertNotContains(response, "<picture>")
+
+        images.submit(self.post.pk, self.post.image.name)
+        response = self.client.get(url)
+        self.assertContains(response, "<picture>")
+        self.assertContains(response, "w480.webp 480w")
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah", password="1")
+        self.post = Post.objects.create(
+            text="Терминатор <b>вернётся</b>", author=self.user
+        )
+        self.url = reverse("search")
+
+    def test_finds_posts_comments_groups_and_users(self):
+        Comment.objects.create(
+            post=self.post, author=self.user, text="терминатор жив"
+        )
+        Group.objects.create(
+            title="Терминаторы", slug="t800", description="Фан-клуб"
+        )
+        response = self.client.get(self.url, {"q": "терминатор"})
+        kinds = {hit.kind for hit in response.context["hits"]}
+        self.assertEqual(kinds, {"post", "comment", "group"})
+        response = self.client.get(self.url, {"q": "sarah"})
+        self.assertIn("user", {hit.kind for hit in response.context["hits"]})
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        response = self.client.get(self.url, {"q": "вернётся"})
+        self.assertContains(response, "&lt;b&gt;<mark>вернётся</mark>")
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = "Скайнет"
+        self.post.save()
+        response = self.client.get(self.url, {"q": "терминатор"})
+        self.assertEqual(response.context["hits"], [])
+        response = self.client.get(self.url, {"q": "скайнет"})
+        self.assertEqual(len(response.context["hits"]), 1)
+        self.post.delete()
+        response = self.client.get(self.url, {"q": "скайнет"})
+        self.assertEqual(response.context["hits"], [])
+
+    def test_results_are_paginated_by_cursor(self):
+        for i in range(25):
+            Post.objects.create(text=f"скайнет {i}", author=self.user)
+        seen = []
+        after = None
+        while True:
+            hits, after = get_backend().search("скайнет", after=after)
+            seen.extend(hit.object_id for hit in hits)
+            if not after:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_rebuild_restores_index(self):
+        get_backend().clear()
+        call_command("rebuild_search_index", stdout=StringIO())
+        response = self.client.get(self.url, {"q": "терминатор"})
+        self.assertEqual(len(response.context["hits"]), 1)
+
+    def test_fts_syntax_in_query_is_harmless(self):
+        response = self.client.get(self.url, {"q": 'NEAR( " * OR'})
+        self.assertEqual(response.status_code, 200)
+
+
+class TestApi(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(
+            title="group", slug="group", description="group"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.reader)
+        for i in range(3):
+            post = Post.objects.create(
+                text=f"post {i}", author=self.author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.reader, text="c")
+        self.post = post
+
+    def test_requires_authentication(self):
+        response = APIClient().get("/api/v1/posts/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_posts_are_cursor_paginated_and_sparse(self):
+        response = self.api.get("/api/v1/posts/", {"fields": "id,text"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("next", response.data)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(set(response.data["results"][0]), {"id", "text"})
+
+    def test_post_list_query_count_does_not_depend_on_size(self):
+        small = self.assertQueryBudget(self.api, "/api/v1/posts/", 1)
+        for i in range(10):
+            Post.objects.create(text="more", author=self.reader)
+        self.assertEqual(
+            self.assertQueryBudget(self.api, "/api/v1/posts/", 1), small
+        )
+
+    def test_feed_comments_groups_and_follows(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        feed = self.api.get("/api/v1/feed/").data["results"]
+        self.assertEqual(len(feed), 3)
+        comments = self.api.get(f"/api/v1/posts/{self.post.pk}/comments/")
+        self.assertEqual(comments.data["results"][0]["author"], "reader")
+        group = self.api.get("/api/v1/groups/group/")
+        self.assertEqual(group.data["title"], "group")
+        follows = self.api.get("/api/v1/follows/").data["results"]
+        self.assertEqual(follows[0]["author"], "author")
+
+    def test_unchanged_page_returns_not_modified(self):
+        response = self.api.get("/api/v1/posts/")
+        etag = response["ETag"]
+        response = self.api.get("/api/v1/posts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(post=self.post, author=self.author, text="c")
+        response = self.api.get("/api/v1/posts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleted_post_changes_the_page(self):
+        newer = Post.objects.create(text="newer", author=self.author)
+        response = self.api.get("/api/v1/posts/")
+        etag = response["ETag"]
+        # по времени правки удаление не видно, поэтому Last-Modified нет
+        self.assertNotIn("Last-Modified", response)
+        newer.delete()
+        response = self.api.get("/api/v1/posts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(
+            "newer", [post["text"] for post in response.data["results"]]
+        )
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username="staff", password="1")
+        Post.objects.create(text="text", author=self.user)
+
+    def test_histogram_percentiles(self):
+        histogram = metrics.Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 1000)
+        self.assertEqual(summary["max"], 1000)
+        for percent, expected in ((50, 500), (95, 950), (99, 990)):
+            error = abs(summary[f"p{percent}"] - expected) / expected
+            self.assertLess(error, 0.07)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        index = metrics.registry.snapshot()["index"]
+        self.assertEqual(index["wall_ms"]["count"], 2)
+        self.assertGreater(index["queries"]["max"], 0)
+        self.assertGreater(index["template_ms"]["max"], 0)
+        self.assertGreater(index["cache_hits"] + index["cache_misses"], 0)
+
+    def test_duplicate_queries_are_counted(self):
+        stats = metrics.RequestStats()
+        stats.queries = [("SELECT 1", "()"), ("SELECT 1", "()"), ("SELECT 2", "()")]
+        self.assertEqual(stats.duplicates, 1)
+
+    @override_settings(SLOW_REQUEST_MS=-1)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs("yatube.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("index"))
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(SLOW_REQUEST_MS=-1)
+    def test_slow_request_log_has_no_query_params(self):
+        self.client.force_login(self.user)
+        session_key = self.client.session.session_key
+        with self.assertLogs("yatube.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("profile", args=[self.user.username]))
+        self.assertIn("django_session", logs.output[0])
+        self.assertNotIn(session_key, logs.output[0])
+        self.assertNotIn(self.user.password, logs.output[0])
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse("index"))
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        response = self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertIn("index", response.json())
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+
+class TestBenchmark(TestCase):
+    def setUp(self):
+        call_command(
+            "generate_data", "--users", "20", "--posts", "200",
+            "--comments", "100", "--groups", "3", "--follows", "5",
+            stdout=StringIO(),
+        )
+        self.report = tempfile.NamedTemporaryFile(suffix=".json")
+
+    def tearDown(self):
+        self.report.close()
+
+    def test_follow_graph_is_skewed_towards_popular_authors(self):
+        followers = sorted(
+            UserStats.objects.values_list("followers_count", flat=True),
+            reverse=True,
+        )
+        self.assertGreater(followers[0], 3 * followers[len(followers) // 2])
+        self.assertEqual(Comment.objects.count(), 100)
+
+    def test_report_and_regression_against_baseline(self):
+        out = StringIO()
+        call_command(
+            "benchmark", "--requests", "3", "--warmup", "1",
+            "--save", self.report.name, stdout=out,
+        )
+        self.assertIn("follow_index", out.getvalue())
+        with open(self.report.name) as file:
+            report = json.load(file)
+        for name, page in report["pages"].items():
+            self.assertEqual(page["errors"], 0, name)
+        self.assertEqual(report["pages"]["post"]["requests"], 3)
+
+        for page in report["pages"].values():
+            page["queries"] = 0
+        with open(self.report.name, "w") as file:
+            json.dump(report, file)
+        with self.assertRaisesMessage(CommandError, "запросов"):
+            call_command(
+                "benchmark", "--requests", "2", "--warmup", "0",
+                "--baseline", self.report.name, stdout=StringIO(),
+            )
+
+
+    def test_http_run_sends_token_to_api_pages(self):
+        urls, reader = bench_urls()
+        sent = {}
+
+        def urlopen(request, timeout):
+            sent[request.full_url] = request.get_header("Authorization")
+            response = mock.MagicMock(status=200)
+            response.__enter__.return_value = response
+            return response
+
+        with mock.patch("urllib.request.urlopen", urlopen):
+            report = run_http("http://bench.local", urls, reader, requests=1)
+        token = Token.objects.get(user=reader).key
+        self.assertEqual(
+            sent["http://bench.local/api/v1/posts/"], f"Token {token}"
+        )
+        self.assertIsNone(sent[f"http://bench.local{urls['index']}"])
+        for name, page in report["pages"].items():
+            self.assertEqual(page["errors"], 0, name)
+
+
+class TestTemplateRendering(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="1")
+        group = Group.objects.create(title="group", slug="group")
+        for i in range(10):
+            Post.objects.create(text=f"post {i}", author=author, group=group)
+
+    def test_template_work_does_not_grow_with_posts(self):
+        few = render_templates(iterations=3, posts=2)
+        many = render_templates(iterations=3, posts=10)
+        self.assertEqual(many["posts"], 10)
+        self.assertEqual(few["template_lookups"], many["template_lookups"])
+        self.assertEqual(many["reverse_misses"], 0)
+
+    def test_cards_are_rendered_for_every_post(self):
+        response = self.client.get(reverse("index"))
+        content = response.content.decode()
+        for i in range(10):
+            self.assertIn(f"post {i}", content)
+        self.assertIn('href="/group/group/"', content)
+        self.assertNotIn("&lt;div", content)
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(title="group", slug="group")
+        self.post = Post.objects.create(
+            text="post", author=self.author, group=self.group
+        )
+        self.urls = [
+            reverse("post", args=["author", self.post.pk]),
+            reverse("profile", args=["author"]),
+            reverse("group", args=["group"]),
+        ]
+
+    def etags(self, client=None):
+        client = client or self.client
+        return {url: client.get(url)["ETag"] for url in self.urls}
+
+    def assertNotModified(self, etags, urls, client=None):
+        client = client or self.client
+        for url in urls:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304, url)
+
+    def assertModified(self, etags, urls):
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_unchanged_pages_are_not_rendered(self):
+        etags = self.etags()
+        for url in self.urls:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+
+    def test_last_modified(self):
+        url = self.urls[1]
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_post_and_cards(self):
+        etags = self.etags()
+        Comment.objects.create(post=self.post, author=self.reader, text="c")
+        self.assertModified(etags, self.urls)
+
+    def test_follow_changes_cards_for_the_follower(self):
+        reader = Client()
+        reader.force_login(self.reader)
+        etags = self.etags(reader)
+        reader.get(reverse("profile_follow", args=["author"]))
+        for url in self.urls:
+            response = reader.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, "Отписаться")
+
+    def test_edit_and_new_post(self):
+        etags = self.etags()
+        self.post.text = "edited"
+        self.post.save()
+        self.assertModified(etags, self.urls)
+        etags = self.etags()
+        Post.objects.create(text="other", author=self.reader)
+        self.assertNotModified(etags, self.urls)
+
+    def test_follow_and_viewer_change_profile(self):
+        self.client.force_login(self.reader)
+        etags = self.etags()
+        other = Client()
+        other.force_login(self.author)
+        for url in self.urls:
+            response = other.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertModified(etags, self.urls[:2])
+
+
+class TestIngest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(title="group", slug="group")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(text="old", author=self.author)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, lines):
+        path = f"{self.dir}/{name}"
+        with open(path, "a") as file:
+            file.write("\n".join(lines) + "\n")
+        return path
+
+    def rows(self, *rows):
+        return [json.dumps(row) for row in rows]
+
+    def test_import_jsonl(self):
+        path = self.write("data.jsonl", self.rows(
+            {"author": "author", "text": "импорт", "group": "group",
+             "pub_date": "2015-05-01T10:00:00"},
+            {"type": "comment", "post": self.post.pk, "author": "reader",
+             "text": "комментарий"},
+            {"author": "nobody", "text": "x"},
+            {"author": "author", "text": ""},
+        ) + ["not json"])
+        err = StringIO()
+        call_command("import_posts", path, stdout=StringIO(), stderr=err)
+
+        post = Post.objects.get(text="импорт")
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(Comment.objects.get().post, self.post)
+        self.assertEqual(err.getvalue().count("строка"), 3)
+
+        self.author.stats.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.author.stats.posts_count, 2)
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        hits, _ = get_backend().search("импорт")
+        self.assertEqual(hits[0].object_id, post.pk)
+        response = self.client.get(reverse("profile", args=["author"]))
+        self.assertContains(response, "импорт")
+
+    def test_comments_reference_posts_from_the_same_file(self):
+        path = self.write("data.jsonl", self.rows(
+            {"id": 900, "author": "author", "text": "первый"},
+            {"type": "comment", "post": 900, "author": "reader",
+             "text": "к первому"},
+            {"id": self.post.pk, "author": "author", "text": "второй"},
+            {"type": "comment", "post": self.post.pk, "author": "reader",
+             "text": "ко второму"},
+            {"type": "comment", "post": 900, "author": "reader",
+             "text": "из следующей пачки"},
+        ))
+        call_command("import_posts", path, "--batch-size", "4",
+                     stdout=StringIO())
+        # соответствие id переживает перезапуск с контрольной точки
+        self.write("data.jsonl", self.rows(
+            {"type": "comment", "post": 900, "author": "reader",
+             "text": "после перезапуска"},
+        ))
+        call_command("import_posts", path, stdout=StringIO())
+
+        first = Post.objects.get(text="первый")
+        second = Post.objects.get(text="второй")
+        self.assertEqual(
+            set(first.comments.values_list("text", flat=True)),
+            {"к первому", "из следующей пачки", "после перезапуска"},
+        )
+        self.assertEqual(
+            list(second.comments.values_list("text", flat=True)),
+            ["ко второму"],
+        )
+        self.assertFalse(self.post.comments.exists())
+        # в точке только номер строки и счётчики, id дописываются рядом
+        with open(f"{path}.checkpoint") as file:
+            self.assertEqual(
+                set(json.load(file)), {"line", "posts", "comments"}
+            )
+        with open(f"{path}.checkpoint.ids") as file:
+            self.assertEqual(len(file.readlines()), 2)
+
+    def test_replies_keep_their_threads(self):
+        existing = Comment.objects.create(
+            post=self.post, author=self.reader, text="в базе"
+        )
+        chain = [
+            {"type": "comment", "id": 100 + number, "post": 900,
+             "parent": 100 + number - 1 if number else None,
+             "author": "reader", "text": f"уровень {number}"}
+            for number in range(MAX_DEPTH + 1)
+        ]
+        path = self.write("data.jsonl", self.rows(
+            {"id": 900, "author": "author", "text": "ветки"},
+            *chain,
+            {"type": "comment", "post": self.post.pk,
+             "parent": existing.pk, "author": "author", "text": "ответ"},
+            {"type": "comment", "post": 900, "parent": 999,
+             "author": "author", "text": "потерянный"},
+            {"type": "comment", "post": self.post.pk, "parent": 100,
+             "author": "author", "text": "чужой пост"},
+        ))
+        err = StringIO()
+        call_command("import_posts", path, "--batch-size", "3",
+                     stdout=StringIO(), stderr=err)
+
+        post = Post.objects.get(text="ветки")
+        comments = list(post.comments.order_by("path"))
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f"уровень {number}" for number in range(MAX_DEPTH + 1)],
+        )
+        for parent, reply in zip(comments, comments[1:MAX_DEPTH]):
+            self.assertEqual(reply.parent, parent)
+            self.assertEqual(reply.path, reply.make_path())
+        # глубже MAX_DEPTH ответ встаёт рядом с родителем
+        self.assertEqual(comments[-1].depth, MAX_DEPTH - 1)
+        self.assertEqual(comments[-1].parent, comments[-3])
+        reply = Comment.objects.get(text="ответ")
+        self.assertEqual(reply.parent, existing)
+        self.assertEqual(reply.path, reply.make_path())
+        self.assertIn("Нет комментария 999", err.getvalue())
+        self.assertIn("относится к другому посту", err.getvalue())
+
+    def test_imported_dates_sort_and_filter(self):
+        path = self.write("data.jsonl", self.rows(
+            {"author": "author", "text": "мск", "pub_date":
+             "2015-05-01T12:30:00+03:00"},
+            {"author": "author", "text": "utc", "pub_date":
+             "2015-05-01T10:00:00+00:00"},
+        ))
+        call_command("import_posts", path, stdout=StringIO())
+        moment = parse_datetime("2015-05-01T09:45:00+00:00")
+        self.assertEqual(
+            list(Post.objects.filter(
+                pub_date__lt=moment + timedelta(minutes=30),
+            ).order_by("pub_date").values_list("text", flat=True)),
+            ["мск", "utc"],
+        )
+        self.assertEqual(
+            Post.objects.filter(pub_date__gt=moment).count(), 2
+        )
+
+    def test_resume_from_checkpoint(self):
+        path = self.write("data.jsonl", self.rows(
+            {"author": "author", "text": "first"},
+            {"author": "author", "text": "second"},
+        ))
+        call_command("import_posts", path, "--batch-size", "1",
+                     stdout=StringIO())
+        self.write("data.jsonl", self.rows({"author": "author", "text": "third"}))
+        out = StringIO()
+        call_command("import_posts", path, stdout=out)
+        self.assertIn("Импортировано постов: 3", out.getvalue())
+        self.assertEqual(Post.objects.filter(text="first").count(), 1)
+        self.assertEqual(Post.objects.filter(text="third").count(), 1)
+
+    def test_import_csv(self):
+        path = self.write("data.csv", [
+            "type,author,group,text,post",
+            "post,author,group,из csv,",
+            f"comment,reader,,ответ,{self.post.pk}",
+        ])
+        call_command("import_posts", path, stdout=StringIO())
+        self.assertTrue(Post.objects.filter(text="из csv").exists())
+        self.assertEqual(Comment.objects.get().text, "ответ")
+
+    def test_bulk_api_is_for_staff(self):
+        api = APIClient()
+        body = "\n".join(self.rows(
+            {"author": "author", "text": "api 1"},
+            {"author": "author", "text": "api 2"},
+        ))
+        api.force_authenticate(self.reader)
+        response = api.post("/api/v1/bulk/", body,
+                            content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 403)
+
+        self.reader.is_staff = True
+        api.force_authenticate(self.reader)
+        response = api.post("/api/v1/bulk/", body,
+                            content_type="application/x-ndjson")
+        self.assertEqual(response.data["posts"], 2)
+        response = api.post(
+            "/api/v1/bulk/", [{"author": "x", "text": "y"}], format="json"
+        )
+        self.assertEqual(response.data["errors"][0]["line"], 1)
+
+
+@override_settings(POSTS_IMAGE_PROCESSING="worker")
+class TestExport(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username="sarah", password="1")
+        self.other = User.objects.create_user(username="john", password="1")
+        self.post = Post.objects.create(
+            text="with image",
+            author=self.user,
+            image=SimpleUploadedFile(
+                "photo.png", TestImg.create_test_image_file().read()
+            ),
+        )
+        Post.objects.create(text="plain", author=self.user)
+        Comment.objects.create(post=self.post, author=self.user, text="c")
+        Follow.objects.create(user=self.user, author=self.other)
+        Follow.objects.create(user=self.other, author=self.user)
+
+    def test_jsonl_is_streamed(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("export"))
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        kinds = [record["type"] for record in records]
+        self.assertEqual(
+            kinds,
+            ["user", "post", "post", "comment", "following", "follower"],
+        )
+        self.assertEqual(records[1]["author"], "sarah")
+
+    def test_zip_contains_data_and_images(self):
+        path = f"{self.media}/export.zip"
+        call_command("export_user", "sarah", "--format", "zip",
+                     "--output", path, stderr=StringIO())
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            self.assertIn("data.jsonl", names)
+            self.assertIn(f"media/{self.post.image.name}", names)
+            data = archive.read("data.jsonl").decode().splitlines()
+        self.assertEqual(len(data), 6)
+
+    def test_export_requires_login(self):
+        response = self.client.get(reverse("export"))
+        self.assertEqual(response.status_code, 302)
+
+
+@mock.patch("yatube.db.replica_alias", return_value="replica")
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", password="1")
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        def view(request):
+            if write:
+                Post.objects.create(text="post", author=self.user)
+            return HttpResponse(router.db_for_read(Post))
+        return ReplicaMiddleware(view)(request)
+
+    def test_commands_read_primary(self, replica_alias):
+        self.assertEqual(router.db_for_read(Post), "default")
+        self.assertEqual(router.db_for_write(Post), "default")
+
+    def test_safe_requests_read_replica(self, replica_alias):
+        response = self.route(self.factory.get("/"))
+        self.assertEqual(response.content, b"replica")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_after_write_are_pinned(self, replica_alias):
+        response = self.route(self.factory.post("/"))
+        self.assertEqual(response.content, b"default")
+        pin = response.cookies[PIN_COOKIE].value
+
+        request = self.factory.get("/")
+        request.COOKIES[PIN_COOKIE] = pin
+        self.assertEqual(self.route(request).content, b"default")
+        request = self.factory.get("/")
+        request.COOKIES[PIN_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.route(request).content, b"replica")
+
+    def test_write_in_get_pins_the_rest_of_request(self, replica_alias):
+        response = self.route(self.factory.get("/"), write=True)
+        self.assertEqual(response.content, b"default")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+class TestAsgi(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        Post.objects.create(text="через asgi", author=self.author)
+
+    def request(self, path, query=b""):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http", "method": "GET", "path": path,
+            "query_string": query, "headers": [(b"host", b"testserver")],
+        }
+        asyncio.run(asgi_application(scope, receive, send))
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        return messages[0]["status"], body.decode()
+
+    def test_pages_are_served(self):
+        status, body = self.request("/")
+        self.assertEqual(status, 200)
+        self.assertIn("через asgi", body)
+        status, body = self.request("/search/", b"q=%D0%B0%D1%81%D0%B3%D0%B8")
+        self.assertEqual(status, 200)
+        self.assertEqual(self.request("/no/such/page/")[0], 404)
+
+    def test_slow_client_does_not_hold_a_thread(self):
+        handler = ASGIHandler(get_wsgi_application(), threads=1)
+        scope = {
+            "type": "http", "method": "GET", "path": "/",
+            "query_string": b"", "headers": [(b"host", b"testserver")],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def scenario():
+            waiting, release = asyncio.Event(), asyncio.Event()
+            fast = []
+
+            async def slow_send(message):
+                waiting.set()
+                await release.wait()
+
+            async def fast_send(message):
+                fast.append(message)
+
+            slow = asyncio.ensure_future(handler(scope, receive, slow_send))
+            await waiting.wait()
+            # единственный поток свободен, хотя первый клиент ещё не читает
+            await asyncio.wait_for(handler(scope, receive, fast_send), 10)
+            release.set()
+            await slow
+            return fast[0]["status"]
+
+        self.assertEqual(asyncio.run(scenario()), 200)
+
+    def test_streaming_response_is_sent_in_chunks(self):
+        closed = []
+
+        class Body:
+            streaming = True
+
+            def __iter__(self):
+                return iter([b"a", b"", b"b", b"c"])
+
+            def close(self):
+                closed.append(True)
+
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return Body()
+
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/"}
+        asyncio.run(ASGIHandler(app, threads=1)(scope, receive, send))
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(
+            [m["body"] for m in messages[1:]], [b"a", b"b", b"c", b""]
+        )
+        self.assertEqual(closed, [True])
+
+    @override_settings(POSTS_PARALLEL_QUERIES=True)
+    def test_independent_queries_run_concurrently(self):
+        threads = gather(
+            lambda: threading.current_thread().name,
+            lambda: threading.current_thread().name,
+        )
+        self.assertNotEqual(threads[0], threads[1])
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("profile", args=["author"]))
+        self.assertTrue(response.context["following"])
+        self.assertEqual(len(response.context["page"]), 1)
+
+
+class TestRelationships(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.authors = [
+            User.objects.create_user(username=f"author{i}", password="1")
+            for i in range(3)
+        ]
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.client.force_login(self.reader)
+
+    def test_following_set_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(is_following(self.reader, self.authors[0].pk))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_following(self.reader, self.authors[1].pk))
+            self.assertEqual(
+                following_among(self.reader, [a.pk for a in self.authors]),
+                {self.authors[0].pk},
+            )
+
+    def test_follow_and_unfollow_invalidate(self):
+        self.assertFalse(is_following(self.reader, self.authors[1].pk))
+        self.client.get(reverse("profile_follow", args=["author1"]))
+        self.assertTrue(is_following(self.reader, self.authors[1].pk))
+        self.client.get(reverse("profile_unfollow", args=["author0"]))
+        self.assertFalse(is_following(self.reader, self.authors[0].pk))
+
+    def test_follow_of_missing_user_is_404(self):
+        response = self.client.get(reverse("profile_follow", args=["nobody"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cards_show_follow_state_without_queries(self):
+        for author in self.authors:
+            Post.objects.create(text=f"by {author.username}", author=author)
+        url = reverse("index")
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertContains(response, "Отписаться", count=1)
+        self.assertContains(response, "Подписаться", count=2)
+        self.assertContains(response, "/author0/unfollow/")
+        # с холодным кэшем: сессия, пользователь, его подписки и лента
+        budget = self.assertQueryBudget(self.client, url, 5)
+        for author in self.authors:
+            Post.objects.create(text="more", author=author)
+        self.assertEqual(self.assertQueryBudget(self.client, url, 5), budget)
+
+
+@override_settings(
+    EDGE_CACHE_SECONDS=60, EDGE_PURGER="yatube.edge.LocalPurger"
+)
+class TestEdgeCache(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        local_store.clear()
+        self.edge = EdgeCache(get_wsgi_application())
+        self.group = Group.objects.create(
+            title="Группа", slug="group", description="-"
+        )
+        self.author = User.objects.create_user(username="author", password="1")
+        self.other = User.objects.create_user(username="other", password="1")
+        self.post = Post.objects.create(
+            text="на краю", author=self.author, group=self.group
+        )
+        Post.objects.create(text="чужой", author=self.other)
+
+    def get(self, path, cookie=""):
+        environ = {"PATH_INFO": path, "HTTP_HOST": "testserver"}
+        if cookie:
+            environ["HTTP_COOKIE"] = cookie
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response.update(status=status, headers=dict(headers))
+
+        body = b"".join(self.edge(environ, start_response))
+        return response["headers"], body.decode()
+
+    def cached(self, path):
+        return self.get(path)[0]["X-Cache"] == "HIT"
+
+    def test_anonymous_pages_are_public_with_surrogate_keys(self):
+        pages = {
+            "/": {"index", f"post-{self.post.pk}", f"author-{self.author.pk}"},
+            "/group/group/": {"group-group", f"post-{self.post.pk}"},
+            "/author/": {f"author-{self.author.pk}", f"post-{self.post.pk}"},
+            f"/author/{self.post.pk}/": {
+                f"post-{self.post.pk}", f"author-{self.author.pk}",
+                "group-group",
+            },
+        }
+        for path, keys in pages.items():
+            with self.subTest(path=path):
+                headers, _ = self.get(path)
+                self.assertEqual(headers["X-Cache"], "MISS")
+                control = headers["Cache-Control"]
+                self.assertIn("public", control)
+                self.assertIn("s-maxage=60", control)
+                self.assertIn("max-age=0", control)
+                self.assertIn("Cookie", headers["Vary"])
+                self.assertTrue(keys <= set(headers["Surrogate-Key"].split()))
+                self.assertTrue(self.cached(path))
+
+    def test_signed_in_users_bypass_the_edge(self):
+        client = Client()
+        client.force_login(self.other)
+        session = client.cookies["sessionid"].value
+        headers, body = self.get("/", f"sessionid={session}")
+        self.assertIn("private", headers["Cache-Control"])
+        self.assertNotIn("Surrogate-Key", headers)
+        self.assertIn("Подписаться", body)
+        self.assertEqual(
+            self.get("/", f"sessionid={session}")[0]["X-Cache"], "MISS"
+        )
+        # чужие cookie аналитики не дробят кэш анонимов
+        self.get("/")
+        self.assertEqual(self.get("/", "_ga=1")[0]["X-Cache"], "HIT")
+
+    def test_edits_purge_only_affected_pages(self):
+        post_page = f"/author/{self.post.pk}/"
+        for path in ("/", "/group/group/", post_page, "/other/"):
+            self.get(path)
+        self.post.text = "правка"
+        self.post.save()
+        self.assertFalse(self.cached(post_page))
+        self.assertIn("правка", self.get("/")[1])
+        self.assertFalse(self.cached("/group/group/"))
+        self.assertTrue(self.cached("/other/"))
+
+        Comment.objects.create(post=self.post, author=self.other, text="-")
+        self.assertFalse(self.cached(post_page))
+        self.assertTrue(self.cached("/other/"))
+
+        Follow.objects.create(user=self.other, author=self.author)
+        self.assertFalse(self.cached("/author/"))
+        self.assertFalse(self.cached("/other/"))
+
+    def test_new_post_purges_feeds_of_author_and_group(self):
+        for path in ("/", "/group/group/", "/author/", "/other/"):
+            self.get(path)
+        Post.objects.create(text="новый", author=self.author, group=self.group)
+        self.assertFalse(self.cached("/"))
+        self.assertFalse(self.cached("/group/group/"))
+        self.assertFalse(self.cached("/author/"))
+        self.assertTrue(self.cached("/other/"))
+
+    def test_deleted_post_purges_its_group_in_directory(self):
+        for path in ("/groups/", "/other/"):
+            self.get(path)
+        self.post.delete()
+        self.assertFalse(self.cached("/groups/"))
+        self.assertTrue(self.cached("/other/"))
+
+    def test_group_stats_refresh_purges_group_pages(self):
+        for path in ("/groups/", "/group/group/", "/other/"):
+            self.get(path)
+        key = version_key("group", self.group.pk)
+        cache.set(key, 0, timeout=None)
+        call_command("refresh_group_stats", stdout=StringIO())
+        self.assertFalse(self.cached("/groups/"))
+        self.assertFalse(self.cached("/group/group/"))
+        self.assertTrue(self.cached("/other/"))
+        self.assertNotEqual(cache.get(key), 0)
+
+    @override_settings(EDGE_CACHE_SECONDS=0)
+    def test_disabled_by_default(self):
+        headers, _ = self.get("/")
+        self.assertNotIn("Surrogate-Key", headers)
+        self.assertFalse(self.cached("/"))
+
+    def test_http_purger_sends_surrogate_keys(self):
+        with mock.patch("yatube.edge.urlopen") as urlopen:
+            HTTPPurger("http://edge.local/").purge({"post-1", "index"})
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.get_method(), "PURGE")
+        self.assertEqual(request.get_header("Surrogate-key"), "index post-1")
+
+
+@override_settings(
+    SESSION_ENGINE="yatube.sessions", AUTH_SNAPSHOT_CACHE="shared"
+)
+class TestCachedAuth(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot_cache().clear()
+        self.user = User.objects.create_user(
+            username="reader", password="secret", email="r@example.com"
+        )
+        self.client.login(username="reader", password="secret")
+
+    def test_signed_in_pages_skip_session_and_user_tables(self):
+        Post.objects.create(text="пост", author=self.user)
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("profile", args=["reader"]))
+        self.assertTrue(response.context["user"].is_authenticated)
+        self.assertTrue(response.context["self"])
+        tables = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("django_session", tables)
+        self.assertNotIn('FROM "auth_user" WHERE "auth_user"."id"', tables)
+
+    def test_snapshot_user_loads_other_fields_on_demand(self):
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        get_user(request)
+        with self.assertNumQueries(0):
+            user = get_user(request)
+            self.assertEqual(user, self.user)
+            self.assertEqual(user.username, "reader")
+            self.assertFalse(user.is_staff)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "r@example.com")
+
+    def test_password_change_signs_out_other_sessions(self):
+        self.client.get(reverse("index"))
+        self.assertIsNotNone(snapshot_cache().get(snapshot_key(self.user.pk)))
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertIsNone(snapshot_cache().get(snapshot_key(self.user.pk)))
+        response = self.client.get(reverse("index"))
+        self.assertFalse(response.context["user"].is_authenticated)
+
+    @override_settings(AUTH_SNAPSHOT_CACHE=None)
+    def test_without_snapshot_cache_user_comes_from_database(self):
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user(request), self.user)
+        self.assertIsNone(caches["shared"].get(snapshot_key(self.user.pk)))
+
+    def test_process_local_caches_fail_system_check(self):
+        # L2 в тестах — LocMemCache, как без YATUBE_CACHE_URL
+        ids = {error.id for error in shared_auth_caches(None)}
+        self.assertEqual(ids, {"users.E001", "users.E002"})
+        with self.settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.db",
+            AUTH_SNAPSHOT_CACHE=None,
+        ):
+            self.assertEqual(shared_auth_caches(None), [])
+
+    def test_logout_drops_snapshot(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("logout"))
+        self.assertIsNone(snapshot_cache().get(snapshot_key(self.user.pk)))
+        response = self.client.get(reverse("index"))
+        self.assertFalse(response.context["user"].is_authenticated)
+
+    @override_settings(SESSION_WRITE_BEHIND_SECONDS=60)
+    def test_session_changes_reach_database_behind_cache(self):
+        session = SessionStore()
+        session["step"] = 1
+        session.create()
+        session.save()
+        session["step"] = 2
+        with self.assertNumQueries(0):
+            session.save()
+        self.assertEqual(SessionStore(session.session_key)["step"], 2)
+        stored = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(stored.get_decoded()["step"], 1)
+
+
+    def test_signup_rejects_usernames_taken_by_routes(self):
+        data = {
+            "username": "", "email": "s@example.com",
+            "password1": "Vfhrjdrf-73", "password2": "Vfhrjdrf-73",
+        }
+        for name in ("Search", "groups", "api", "metrics"):
+            data["username"] = name
+            self.assertIn("username", CreationForm(data).errors)
+        data["username"] = "searcher"
+        self.assertTrue(CreationForm(data).is_valid())
+
+
+class TestStaticAssets(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.storage = CompressedManifestStaticFilesStorage(
+            location=self.root, base_url="/static/"
+        )
+        self.css = "body { background: url('../img/dot.png'); }\n" * 20
+        self.storage.save("css/site.css", ContentFile(self.css.encode()))
+        self.storage.save("img/dot.png", ContentFile(b"png"))
+
+    def build(self):
+        paths = {
+            name: (self.storage, name) for name in ("css/site.css",)
+        }
+        processed = list(self.storage.post_process(paths))
+        errors = [item for item in processed if isinstance(item[2], Exception)]
+        self.assertFalse(errors)
+        return self.storage.stored_name("css/site.css")
+
+    def test_build_hashes_and_precompresses(self):
+        hashed = self.build()
+        self.assertRegex(hashed, r"^css/site\.[0-9a-f]{12}\.css$")
+        # файл, лежавший в STATIC_ROOT, тоже получил хеш
+        dot = self.storage.stored_name("img/dot.png")
+        self.assertNotEqual(dot, "img/dot.png")
+        with open(self.storage.path(hashed) + ".gz", "rb") as compressed:
+            content = gzip.decompress(compressed.read()).decode()
+        self.assertIn(f"../{dot}", content)
+        # маленькие и несжимаемые файлы не сжимаются
+        self.assertFalse(os.path.exists(self.storage.path("img/dot.png.gz")))
+
+    def test_serve_picks_encoding_and_caches_hashed_forever(self):
+        hashed = self.build()
+        factory = RequestFactory()
+        with override_settings(STATIC_ROOT=self.root):
+            request = factory.get("/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+            response = serve_static(request, hashed)
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(response["Content-Type"], "text/css")
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertIn("Accept-Encoding", response["Vary"])
+            body = gzip.decompress(b"".join(response.streaming_content))
+            self.assertEqual(body.decode().count("background"), 20)
+            response.close()
+
+            response = serve_static(factory.get("/"), "css/site.css")
+            self.assertNotIn("Content-Encoding", response)
+            self.assertIn("must-revalidate", response["Cache-Control"])
+            response.close()
+
+            request = factory.get(
+                "/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+            )
+            self.assertEqual(
+                serve_static(request, "css/site.css").status_code, 304
+            )
+            with self.assertRaises(Http404):
+                serve_static(factory.get("/"), "../etc/passwd")
+
+    def test_serve_respects_encoding_weights(self):
+        hashed = self.build()
+        factory = RequestFactory()
+        cases = {
+            "gzip;q=0, deflate": None,
+            "GZIP; q=0.8, identity": "gzip",
+            "*;q=0.5": "gzip",
+            "*, gzip;q=0": None,
+            "br;q=0, gzip;q=0.1": "gzip",
+            "identity": None,
+        }
+        with override_settings(STATIC_ROOT=self.root):
+            for header, encoding in cases.items():
+                with self.subTest(header=header):
+                    request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+                    response = serve_static(request, hashed)
+                    self.assertEqual(
+                        response.get("Content-Encoding"), encoding
+                    )
+                    response.close()
+
+    def test_base_inlines_critical_css(self):
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "<style>")
+        self.assertContains(response, ".navbar{")
+        self.assertContains(response, 'rel="preload"')
+
+
+class TestThreadedComments(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.post = Post.objects.create(text="обсуждение", author=self.author)
+        self.client.force_login(self.reader)
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(
+            post=self.post, author=self.reader, text=text, parent=parent
+        )
+
+    def test_thread_order_follows_path(self):
+        first = self.comment("first")
+        second = self.comment("second")
+        reply = self.comment("reply", first)
+        nested = self.comment("nested", reply)
+        later = self.comment("later", first)
+        thread = list(self.post.comments.order_by("path"))
+        self.assertEqual(thread, [second, first, reply, nested, later])
+        self.assertEqual([c.depth for c in thread], [0, 0, 1, 2, 1])
+        self.assertTrue(nested.path.startswith(reply.path + "/"))
+
+    def test_parent_cannot_change_after_creation(self):
+        first = self.comment("first")
+        reply = self.comment("reply", first)
+        nested = self.comment("nested", reply)
+        for comment in (first, reply, nested):
+            comment.text = "правка"
+            comment.save()
+        nested.parent = first
+        with self.assertRaises(ValueError):
+            nested.save()
+        first.parent = reply
+        with self.assertRaises(ValueError):
+            first.save()
+        reply.parent = None
+        with self.assertRaises(ValueError):
+            reply.save()
+
+    def test_reply_through_form_and_depth_cap(self):
+        parent = self.comment("root")
+        for level in range(MAX_DEPTH + 1):
+            self.client.post(
+                reverse("add_comment", args=["author", self.post.pk]),
+                {"text": f"level {level}", "parent": parent.pk},
+            )
+            parent = Comment.objects.latest("pk")
+        self.assertEqual(parent.depth, MAX_DEPTH - 1)
+        self.assertEqual(parent.parent.depth, MAX_DEPTH - 2)
+        # с мусором в parent получается корневой комментарий
+        self.client.post(
+            reverse("add_comment", args=["author", self.post.pk]),
+            {"text": "root again", "parent": "x"},
+        )
+        self.assertIsNone(Comment.objects.latest("pk").parent)
+
+    def test_first_page_is_capped_and_rest_loads_on_demand(self):
+        for number in range(55):
+            self.comment(f"comment {number}")
+        url = reverse("post", args=["author", self.post.pk])
+        response = self.client.get(url)
+        self.assertEqual(len(response.context["items"]), 50)
+        self.assertContains(response, "data-more-comments")
+        cursor = response.context["next_cursor"]
+
+        more = reverse("post_comments", args=["author", self.post.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(more, {"after": cursor})
+        self.assertContains(response, "comment 0")
+        self.assertNotContains(response, "comment 5")
+        self.assertNotContains(response, "data-more-comments")
+        thread = [q["sql"] for q in queries if "posts_comment" in q["sql"]
+                  and "ORDER BY" in q["sql"] and '"path" >' in q["sql"]]
+        self.assertEqual(len(thread), 1)
+
+        data = self.client.get(
+            more, {"after": cursor, "format": "json"}
+        ).json()
+        self.assertEqual(len(data["comments"]), 5)
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["comments"][0]["depth"], 0)
+
+
+class TestGroupStats(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="1")
+        self.quiet = Group.objects.create(
+            title="Тихая", slug="quiet", description="-"
+        )
+        self.busy = Group.objects.create(
+            title="Шумная", slug="busy", description="-"
+        )
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_signals_keep_rollup_current(self):
+        first = Post.objects.create(
+            text="1", author=self.author, group=self.busy
+        )
+        second = Post.objects.create(
+            text="2", author=self.author, group=self.busy
+        )
+        stats = self.stats(self.busy)
+        self.assertEqual(
+            (stats.posts_count, stats.posts_24h, stats.posts_7d), (2, 2, 2)
+        )
+        self.assertEqual(stats.last_post_at, second.pub_date)
+
+        second.group = self.quiet
+        second.save()
+        self.assertEqual(self.stats(self.busy).posts_count, 1)
+        self.assertEqual(self.stats(self.busy).last_post_at, first.pub_date)
+        self.assertEqual(self.stats(self.quiet).posts_24h, 1)
+
+        first.delete()
+        stats = self.stats(self.busy)
+        self.assertEqual((stats.posts_count, stats.posts_7d), (0, 0))
+        self.assertIsNone(stats.last_post_at)
+
+    def test_refresh_slides_activity_windows(self):
+        post = Post.objects.create(
+            text="1", author=self.author, group=self.busy
+        )
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=post.pub_date - timedelta(days=2)
+        )
+        out = StringIO()
+        call_command("refresh_group_stats", stdout=out)
+        self.assertIn("Пересчитано групп: 2", out.getvalue())
+        stats = self.stats(self.busy)
+        self.assertEqual(
+            (stats.posts_count, stats.posts_24h, stats.posts_7d), (1, 0, 1)
+        )
+        self.assertIsNotNone(stats.refreshed_at)
+
+    def test_group_page_shows_stats_without_extra_queries(self):
+        Post.objects.create(text="1", author=self.author, group=self.busy)
+        response = self.client.get(reverse("group", args=["busy"]))
+        with self.assertNumQueries(0):
+            self.assertEqual(response.context["group"].stats.posts_count, 1)
+        self.assertContains(response, "за сутки: 1")
+
+    def test_directory_and_api_list_active_groups_first(self):
+        Post.objects.create(text="1", author=self.author, group=self.busy)
+        response = self.client.get(reverse("groups"))
+        self.assertEqual(
+            [group.slug for group in response.context["page"]],
+            ["busy", "quiet"],
+        )
+        api = APIClient()
+        api.force_authenticate(self.author)
+        data = api.get("/api/v1/groups/").json()["results"]
+        by_slug = {group["slug"]: group for group in data}
+        self.assertEqual(by_slug["busy"]["posts_7d"], 1)
+        self.assertEqual(by_slug["quiet"]["posts_count"], 0)
+        self.assertIsNone(by_slug["quiet"]["last_post_at"])
+
+
+@override_settings(ADMIN_JOBS="sync")
+class TestAdmin(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="root", email="root@example.com", password="1"
+        )
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:posts_post_changelist")
+
+    def make_posts(self, count, text="пост"):
+        for number in range(count):
+            author = User.objects.create_user(username=f"a{number}-{text}")
+            Post.objects.create(text=f"{text} {number}", author=author)
+
+    def test_changelist_queries_do_not_grow_with_authors(self):
+        self.make_posts(3)
+        # первый запрос кладёт снимок пользователя в кэш
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url)
+        self.make_posts(10, "ещё")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(response.context["cl"].result_count, 13)
+        self.assertIsNone(response.context["cl"].full_result_count)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_count_is_estimated_past_limit(self):
+        self.make_posts(5)
+        response = self.client.get(self.url)
+        # статистики ещё нет: показывается порог
+        self.assertEqual(response.context["cl"].result_count, 4)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["cl"].result_count, 5)
+        response = self.client.get(self.url, {"q": "пост"})
+        self.assertEqual(response.context["cl"].result_count, 4)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_pages_past_estimate_open_while_they_have_rows(self):
+        self.make_posts(7)
+        posts = Post.objects.filter(text__startswith="пост").order_by("pk")
+        paginator = EstimatedCountPaginator(posts, 2)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(
+            [post.text for post in paginator.page(4)], ["пост 6"]
+        )
+        with self.assertRaises(EmptyPage):
+            paginator.page(5)
+        exact = EstimatedCountPaginator(posts.filter(pk__lte=posts[2].pk), 2)
+        with self.assertRaises(EmptyPage):
+            exact.page(3)
+
+    def test_search_uses_full_text_index(self):
+        self.make_posts(2)
+        target = Post.objects.create(text="Терминатор", author=self.admin)
+        response = self.client.get(self.url, {"q": "термина"})
+        self.assertEqual(list(response.context["cl"].result_list), [target])
+        response = self.client.get(
+            reverse("admin:posts_comment_changelist"), {"q": "термина"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 0)
+
+    def test_bulk_delete_runs_in_batches(self):
+        self.make_posts(5)
+        keep = Post.objects.order_by("pk").first()
+        selected = Post.objects.exclude(pk=keep.pk)
+        for post in selected[:2]:
+            Comment.objects.create(post=post, author=self.admin, text="к")
+        response = self.client.post(self.url, {
+            "action": "delete_in_background",
+            "_selected_action": [post.pk for post in selected],
+        }, follow=True)
+        self.assertContains(response, "Удаление запущено в фоне")
+        self.assertEqual(list(Post.objects.all()), [keep])
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            UserStats.objects.filter(posts_count__gt=0).count(), 1
+        )
+
+    def test_job_walks_queryset_by_id(self):
+        self.make_posts(5)
+        with CaptureQueriesContext(connection) as queries:
+            total = jobs.run(
+                Post.objects.all(), lambda batch: None, batch_size=2
+            )
+        self.assertEqual(total, 5)
+        selects = [q for q in queries if '"id" >' in q["sql"]]
+        self.assertEqual(len(selects), 4)
+
+    def test_change_forms_render_without_option_lists(self):
+        self.make_posts(1)
+        post = Post.objects.get()
+        comment = Comment.objects.create(
+            post=post, author=self.admin, text="к"
+        )
+        response = self.client.get(
+            reverse("admin:posts_post_change", args=[post.pk])
+        )
+        self.assertContains(response, "admin-autocomplete")
+        response = self.client.get(
+            reverse("admin:posts_comment_change", args=[comment.pk])
+        )
+        self.assertContains(response, "vForeignKeyRawIdAdminField")
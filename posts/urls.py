@@ -6,9 +6,17 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('export/', views.export_data, name='export'),
+    path('groups/', views.group_index, name='groups'),
     path('group/<str:slug>/', views.group_posts, name='group'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name="post_comments"
+    ),
     path(
         '<username>/<int:post_id>/comment',
         views.add_comment,
@@ -1,30 +1,98 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
-
+from django.db.models import F
+
+from yatube.edge import tag
+
+from .cache import feed_ids_timeout, feed_key, surrogate_keys
+from .concurrency import gather
+from .conditional import (
+    conditional_page, group_validators, post_validators, profile_validators
+)
+from .counters import stats_for
+from .export import export_chunks
+from .feed import FeedPaginator, feed_posts
 from .forms import NewPostForm, CommentForm
 from .models import Post, Group, Follow
+from .paginators import CursorPaginator
+from .relationships import is_following
+from .search import get_backend
+from .serializers import CommentSerializer
+
+POSTS_PER_PAGE = 10
+GROUPS_PER_PAGE = 50
+COMMENTS_PER_PAGE = 50
+COMMENT_CURSOR = re.compile(r"^[0-9/]+$")
+
+
+def paginate(request, post_list, view_name, cache_key=None):
+    """
+    Страница ленты: keyset-курсор по умолчанию, нумерованные страницы
+    только для представлений из POSTS_NUMBERED_PAGINATION. Для первой
+    страницы с cache_key список id берётся из кэша.
+    """
+    if view_name in settings.POSTS_NUMBERED_PAGINATION:
+        paginator = Paginator(
+            post_list.order_by("-pub_date", "-id"),
+            POSTS_PER_PAGE
+        )
+        page = paginator.get_page(request.GET.get("page"))
+    else:
+        paginator = CursorPaginator(
+            post_list,
+            POSTS_PER_PAGE,
+            cache_key=cache_key,
+            timeout=feed_ids_timeout(),
+        )
+        page = paginator.get_page(
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+        )
+    return {"page": page, "paginator": paginator}
+
+
+def comment_page(post, after=None):
+    """
+    Страница ветки комментариев после курсора — пути последнего
+    показанного. Один диапазонный запрос по индексу (post, path).
+    """
+    comments = post.comments.select_related("author").order_by("path")
+    if after and COMMENT_CURSOR.match(after):
+        comments = comments.filter(path__gt=after)
+    comments = list(comments[:COMMENTS_PER_PAGE + 1])
+    next_cursor = None
+    if len(comments) > COMMENTS_PER_PAGE:
+        next_cursor = comments[COMMENTS_PER_PAGE - 1].path
+    return comments[:COMMENTS_PER_PAGE], next_cursor
+
+
+def tag_posts(request, posts, *keys):
+    """Ключи края для списка постов: сами посты, их авторы и группы."""
+    posts = list(posts)
+    tag(request, *keys, *surrogate_keys(
+        posts=[post.pk for post in posts],
+        authors={post.author_id for post in posts},
+        groups={post.group.slug for post in posts if post.group_id},
+    ))
 
 
-@cache_page(20, key_prefix="index_page")
 def index(request):
-    post_list = Post.objects.order_by("-pub_date").all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(
-        request,
-        "index.html",
-        {"page": page, "paginator": paginator}
-    )
+    post_list = Post.objects.for_cards()
+    pages = paginate(request, post_list, "index", feed_key("index"))
+    tag_posts(request, pages["page"], "index")
+    return render(request, "index.html", pages)
 
 
 @login_required
 def new_post(request):
     if request.method == "POST":
-        form = NewPostForm(request.POST)
+        form = NewPostForm(request.POST, files=request.FILES or None)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
@@ -37,47 +105,65 @@ def new_post(request):
     return render(request, "new_post.html", {"form": form, "edit": False})
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group).order_by("-pub_date").all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+def group_index(request):
+    """Каталог групп: самые активные за неделю — первыми."""
+    groups = Group.objects.select_related("stats").order_by(
+        F("stats__posts_7d").desc(nulls_last=True),
+        F("stats__last_post_at").desc(nulls_last=True),
+        "title",
+    )
+    page = Paginator(groups, GROUPS_PER_PAGE).get_page(request.GET.get("page"))
+    tag(request, "groups", *surrogate_keys(
+        groups=[group.slug for group in page]
+    ))
     return render(
         request,
-        "group.html",
-        {"page": page, "paginator": paginator, "group": group}
+        "groups.html",
+        {"page": page, "paginator": page.paginator}
+    )
+
+
+@conditional_page(group_validators)
+def group_posts(request, slug):
+    # сводка активности приходит тем же запросом, что и группа
+    group = get_object_or_404(
+        Group.objects.select_related("stats"), slug=slug
     )
+    post_list = Post.objects.filter(group=group).for_cards()
+    pages = paginate(request, post_list, "group", feed_key("group", group.pk))
+    tag_posts(request, pages["page"], *surrogate_keys(groups=[group.slug]))
+    return render(request, "group.html", {"group": group, **pages})
 
 
+@conditional_page(profile_validators)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = user.posts.order_by("-pub_date").all()
-    count = post_list.count()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    user = get_object_or_404(
+        User.objects.select_related("stats"),
+        username=username
+    )
+    post_list = user.posts.for_cards()
+    stats = stats_for(user)
 
     self = False
     if request.user == user:
         self = True
 
-    following = False
-    if not request.user.is_anonymous:
-        if Follow.objects.filter(
-            user=User.objects.get(username=request.user),
-            author=User.objects.get(username=username)
-        ).count() != 0:
-            following = True
+    pages, following = gather(
+        lambda: paginate(
+            request, post_list, "profile", feed_key("profile", user.pk)
+        ),
+        lambda: is_following(request.user, user.pk),
+    )
+    tag_posts(request, pages["page"], *surrogate_keys(authors=[user.pk]))
 
     return render(
         request,
         "profile.html",
         {
             "username": username,
-            "page": page,
-            "paginator": paginator,
-            "count": count,
+            **pages,
+            "count": stats.posts_count,
+            "stats": stats,
             "author": user,
             "following": following,
             "self": self,
@@ -85,24 +171,29 @@ def profile(request, username):
     )
 
 
+@conditional_page(post_validators)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
-    post_list = post.author.posts.all()
-    count = post_list.count()
+    post = get_object_or_404(
+        Post.objects.select_related("author__stats", "group"),
+        author__username=username,
+        id=post_id,
+    )
+    stats = stats_for(post.author)
     form = CommentForm(instance=None)
-    items = post.comments.order_by("-created").all()
 
     self = False
     if request.user == post.author:
         self = True
 
-    following = False
-    if not request.user.is_anonymous:
-        if Follow.objects.filter(
-                user=User.objects.get(username=request.user.username),
-                author=User.objects.get(username=username)
-        ).count() != 0:
-            following = True
+    (items, next_cursor), following = gather(
+        lambda: comment_page(post),
+        lambda: is_following(request.user, post.author_id),
+    )
+    tag(request, *surrogate_keys(
+        posts=[post.pk],
+        authors={post.author_id, *(item.author_id for item in items)},
+        groups=[post.group.slug] if post.group_id else (),
+    ))
 
     return render(
         request,
@@ -111,16 +202,73 @@ def post_view(request, username, post_id):
             "username": username,
             "post_id": post_id,
             "post": post,
-            "count": count,
+            "count": stats.posts_count,
+            "stats": stats,
             "author": post.author,
             "form": form,
             "items": items,
+            "next_cursor": next_cursor,
+            "reply_to": request.GET.get("reply_to", ""),
             "following": following,
             "self": self,
         }
     )
 
 
+@conditional_page(post_validators)
+def post_comments(request, username, post_id):
+    """Следующая страница комментариев: HTML-фрагмент или ?format=json."""
+    post = get_object_or_404(
+        Post.objects.select_related("author"),
+        author__username=username,
+        id=post_id,
+    )
+    items, next_cursor = comment_page(post, request.GET.get("after"))
+    tag(request, *surrogate_keys(
+        posts=[post.pk], authors={item.author_id for item in items}
+    ))
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "comments": CommentSerializer(items, many=True).data,
+            "next": next_cursor,
+        })
+    return render(
+        request,
+        "includes/comment_list.html",
+        {"post": post, "items": items, "next_cursor": next_cursor}
+    )
+
+
+def search(request):
+    query = request.GET.get("q", "").strip()
+    hits, next_cursor = [], None
+    if query:
+        hits, next_cursor = get_backend().search(
+            query, after=request.GET.get("after")
+        )
+    return render(
+        request,
+        "search.html",
+        {"query": query, "hits": hits, "next_cursor": next_cursor}
+    )
+
+
+@login_required
+def export_data(request):
+    data_format = "zip" if request.GET.get("format") == "zip" else "jsonl"
+    response = StreamingHttpResponse(
+        export_chunks(request.user, data_format),
+        content_type=(
+            "application/zip" if data_format == "zip"
+            else "application/x-ndjson"
+        ),
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{request.user.username}.{data_format}"'
+    )
+    return response
+
+
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
 
@@ -151,43 +299,43 @@ def add_comment(request, username, post_id):
         comment = form.save(commit=False)
         comment.post = post
         comment.author = request.user
+        parent_id = request.POST.get("parent", "")
+        parent = parent_id.isdigit() and post.comments.filter(
+            pk=parent_id
+        ).first()
+        if parent:
+            comment.parent = parent.reply_target()
         comment.save()
     return redirect("post", username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__in=Follow.objects.filter(user=request.user)
-    ).order_by("-pub_date").all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-
-    return render(
-        request,
-        "follow.html",
-        {"page": page, "paginator": paginator}
-    )
+    if "follow_index" in settings.POSTS_NUMBERED_PAGINATION:
+        post_list = feed_posts(request.user).for_cards()
+        context = paginate(request, post_list, "follow_index")
+    else:
+        paginator = FeedPaginator(request.user, POSTS_PER_PAGE)
+        page = paginator.get_page(
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+        )
+        context = {"page": page, "paginator": paginator}
+    return render(request, "follow.html", context)
 
 
 @login_required
 def profile_follow(request, username):
-    author = User.objects.get(username=username)
-    if (
-            request.user != author
-            and Follow.objects.filter(
-                user=User.objects.get(username=request.user),
-                author=User.objects.get(username=username)
-            ).count() == 0
-    ):
-        Follow.objects.create(author=author, user=request.user)
+    author = get_object_or_404(User, username=username)
+    # запись решает база, а не кэш подписок: уникальный индекс (user, author)
+    if request.user != author:
+        Follow.objects.get_or_create(author=author, user=request.user)
     return redirect("profile", username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = User.objects.get(username=username)
+    author = get_object_or_404(User, username=username)
     Follow.objects.filter(
         user=request.user,
         author=author,
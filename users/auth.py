@@ -0,0 +1,98 @@
+"""
+Пользователь запроса из кэша вместо запроса к auth_user.
+
+SnapshotAuthenticationMiddleware заменяет AuthenticationMiddleware:
+request.user строится из снимка (id, username, флаги) в кэше
+AUTH_SNAPSHOT_CACHE. Это настоящий User с отложенными остальными полями,
+так что сравнение с автором поста, внешние ключи и save() работают как
+обычно, а обращение к другому полю (email, password) догружает его из базы.
+
+Снимок хранит и хеш для проверки сессии, поэтому смена пароля, как и в
+django.contrib.auth, разлогинивает остальные сессии. Снимок удаляется при
+сохранении пользователя и при выходе (см. users.signals), поэтому кэш
+должен быть общим для всех воркеров (см. users.checks). Если
+AUTH_SNAPSHOT_CACHE пуст, пользователь, как обычно, читается из базы.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+FIELDS = ("id", "username", "is_staff", "is_superuser", "is_active")
+
+
+def snapshot_cache():
+    alias = getattr(settings, "AUTH_SNAPSHOT_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def snapshot_key(user_id):
+    return f"user-snapshot:{user_id}"
+
+
+def forget(user_id):
+    cache = snapshot_cache()
+    if cache is not None:
+        cache.delete(snapshot_key(user_id))
+
+
+def remember(user):
+    cache = snapshot_cache()
+    if cache is None:
+        return
+    snapshot = {field: getattr(user, field) for field in FIELDS}
+    snapshot["session_hash"] = user.get_session_auth_hash()
+    cache.set(
+        snapshot_key(user.pk),
+        snapshot,
+        getattr(settings, "AUTH_SNAPSHOT_TIMEOUT", 3600),
+    )
+
+
+def from_snapshot(snapshot, backend):
+    model = auth.get_user_model()
+    # from_db() ждёт значения в порядке полей модели
+    names = [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname in FIELDS
+    ]
+    user = model.from_db(
+        DEFAULT_DB_ALIAS, names, [snapshot[name] for name in names]
+    )
+    user.backend = backend
+    return user
+
+
+def get_user(request):
+    """auth.get_user(), но без запроса к базе, если снимок есть в кэше."""
+    cache = snapshot_cache()
+    if cache is None:
+        return auth.get_user(request)
+    session = request.session
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend = session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    snapshot = cache.get(snapshot_key(user_id))
+    if snapshot is None or backend not in settings.AUTHENTICATION_BACKENDS:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            remember(user)
+        return user
+    if not constant_time_compare(
+        session.get(auth.HASH_SESSION_KEY) or "", snapshot["session_hash"]
+    ):
+        session.flush()
+        return AnonymousUser()
+    return from_snapshot(snapshot, backend)
+
+
+class SnapshotAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
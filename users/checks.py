@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from yatube.cache import is_shared
+
+CACHED_SESSION_ENGINES = (
+    "yatube.sessions",
+    "django.contrib.sessions.backends.cache",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+@register(Tags.security)
+def shared_auth_caches(app_configs, **kwargs):
+    """
+    Сессии и снимки пользователей в кэше процесса: выход и смена пароля
+    дошли бы только до одного воркера, остальные пускали бы по старой сессии.
+    """
+    errors = []
+    if (
+        settings.SESSION_ENGINE in CACHED_SESSION_ENGINES
+        and not is_shared(settings.SESSION_CACHE_ALIAS)
+    ):
+        errors.append(Error(
+            "Сессии в кэше, который не общий для воркеров.",
+            hint="Задайте YATUBE_CACHE_URL или сессии в базе "
+                 "(django.contrib.sessions.backends.db).",
+            id="users.E001",
+        ))
+    alias = getattr(settings, "AUTH_SNAPSHOT_CACHE", None)
+    if alias and not is_shared(alias):
+        errors.append(Error(
+            "Снимки пользователей в кэше, который не общий для воркеров.",
+            hint="Задайте YATUBE_CACHE_URL или AUTH_SNAPSHOT_CACHE = None.",
+            id="users.E002",
+        ))
+    return errors
@@ -1,9 +1,34 @@
+import re
+
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.urls import get_resolver
 
 
 User = get_user_model()
 
+SEGMENT = re.compile(r"[\w.@+-]+")
+
+
+def _first_segments(patterns):
+    for pattern in patterns:
+        route = str(pattern.pattern).lstrip("^")
+        if not route and hasattr(pattern, "url_patterns"):
+            yield from _first_segments(pattern.url_patterns)
+            continue
+        segment = route.split("/", 1)[0]
+        if SEGMENT.fullmatch(segment):
+            yield segment.lower()
+
+
+def reserved_usernames():
+    """
+    Первые части постоянных адресов сайта (search, groups, api, …): профиль
+    /<username>/ с таким именем перекрыт ими и не открывается.
+    """
+    return set(_first_segments(get_resolver().url_patterns))
+
 
 #  создадим собственный класс для формы регистрации
 #  сделаем его наследником предустановленного класса UserCreationForm
@@ -13,3 +38,9 @@ class CreationForm(UserCreationForm):
         model = User
         # укажем, какие поля должны быть видны в форме и в каком порядке
         fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username.lower() in reserved_usernames():
+            raise ValidationError("Это имя занято адресом сайта")
+        return username
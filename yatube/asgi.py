@@ -0,0 +1,200 @@
+"""
+ASGI config for yatube project.
+
+Django 2.2 ещё не умеет ASGI, поэтому здесь — переходник: ASGI-сервер
+(uvicorn, daphne, hypercorn) держит соединения в цикле событий, а сам
+Django выполняется в ограниченном пуле потоков ASGI_THREADS. Обычный
+ответ собирается в потоке целиком, поток освобождается, а клиенту ответ
+пишет цикл событий: медленный клиент занимает сокет, но не поток.
+
+Потоковый ответ (выгрузка, файлы) целиком не собрать. Его куски читает
+отдельный пул ASGI_STREAM_THREADS через очередь на STREAM_BUFFER кусков:
+медленный клиент держит один поток этого пула, но не пула страниц.
+Вместе пулы ограничивают и число соединений с базой.
+
+    uvicorn yatube.asgi:application --workers 4
+"""
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+# тело запроса больше этого пишется во временный файл
+BODY_SPOOL_SIZE = 1024 * 1024
+# кусков потокового ответа, прочитанных впрок, пока клиент их не забрал
+STREAM_BUFFER = 16
+
+
+class ASGIHandler:
+    def __init__(self, wsgi_application, threads, stream_threads=4):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="asgi"
+        )
+        self.stream_executor = ThreadPoolExecutor(
+            max_workers=stream_threads, thread_name_prefix="asgi-stream"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            body = await self.read_body(receive)
+            if body is None:
+                return
+            loop = asyncio.get_running_loop()
+            start, content, stream = await loop.run_in_executor(
+                self.executor, self.run_wsgi, scope, body
+            )
+            if stream is not None:
+                await self.stream(start, stream, send, loop)
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": content})
+        else:
+            raise ValueError(f"Неподдерживаемый тип соединения {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        body = SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                body.seek(0)
+                return body
+
+    def environ(self, scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        path = scope["path"].encode("utf-8").decode("latin-1")
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            "PATH_INFO": path,
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "REMOTE_ADDR": client[0],
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = f"HTTP_{name}"
+            if name in environ:
+                value = f"{environ[name]},{value}"
+            environ[name] = value
+        return environ
+
+    def run_wsgi(self, scope, body):
+        """
+        Выполняется в потоке пула: Django и его соединения с БД здесь.
+        Обычный ответ возвращается собранным, потоковый — непрочитанным.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+
+        try:
+            result = self.wsgi_application(
+                self.environ(scope, body), start_response
+            )
+            streaming = getattr(
+                result, "streaming", not isinstance(result, (list, tuple))
+            )
+            if streaming and "start" in response:
+                return response["start"], None, result
+            try:
+                content = b"".join(result)
+            finally:
+                # request_finished закрывает соединения с БД этого потока
+                if hasattr(result, "close"):
+                    result.close()
+            return response["start"], content, None
+        finally:
+            body.close()
+
+    def pump(self, result, queue, loop, stopped):
+        """Читает потоковый ответ в потоке stream_executor в очередь."""
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        try:
+            for chunk in result:
+                if stopped.is_set():
+                    break
+                if chunk:
+                    put(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+            put(None)
+
+    async def stream(self, start, result, send, loop):
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+        stopped = threading.Event()
+        pump = loop.run_in_executor(
+            self.stream_executor, self.pump, result, queue, loop, stopped
+        )
+        try:
+            await send(start)
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                })
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            # клиент мог уйти: освобождаем очередь, чтобы поток закрыл ответ
+            stopped.set()
+            while not pump.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait([pump], timeout=0.01)
+            await pump
+
+application = ASGIHandler(
+    get_wsgi_application(),
+    threads=int(os.environ.get("ASGI_THREADS", 16)),
+    stream_threads=int(os.environ.get("ASGI_STREAM_THREADS", 4)),
+)
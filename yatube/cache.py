@@ -0,0 +1,187 @@
+"""
+Двухуровневый кэш и защита от «эффекта толпы» (cache stampede).
+
+TieredCache держит в каждом процессе небольшой L1 (LocMemCache с коротким
+TTL) перед общим для всех воркеров L2 — любым кэшем из settings.CACHES
+(memcached, файловый кэш для разработки и т. п.). Соединения с L2 живут
+столько же, сколько поток воркера: django.core.cache.caches хранит
+экземпляры бэкендов по потокам, поэтому соединение открывается один раз
+и переиспользуется между запросами.
+
+get_or_recompute() отдаёт устаревшее значение, пока ровно один процесс
+пересчитывает его под блокировкой (stale-while-revalidate).
+"""
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import record_cache
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._l2_alias = options.get("L2", "shared")
+        self.l1_timeout = options.get("L1_TIMEOUT", 2)
+        self.l1 = LocMemCache(
+            f"tiered-l1-{location}",
+            {"OPTIONS": {"MAX_ENTRIES": options.get("L1_MAX_ENTRIES", 1000)}},
+        )
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l2_timeout(self, timeout):
+        # L2 сам переводит секунды в срок; get_backend_timeout() вернул бы
+        # абсолютное время, которое L2 принял бы за относительное
+        if timeout is DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            record_cache(hit=True)
+            return value
+        value = self.l2.get(key, _MISSING, version=0)
+        record_cache(hit=value is not _MISSING)
+        if value is _MISSING:
+            return default
+        self.l1.set(key, value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        missing = {}
+        for key in keys:
+            full_key = self.make_key(key, version=version)
+            value = self.l1.get(full_key, _MISSING)
+            if value is _MISSING:
+                missing[full_key] = key
+            else:
+                result[key] = value
+        for _ in range(len(keys) - len(missing)):
+            record_cache(hit=True)
+        if missing:
+            found = self.l2.get_many(list(missing), version=0)
+            for _ in range(len(missing) - len(found)):
+                record_cache(hit=False)
+            for full_key, value in found.items():
+                self.l1.set(full_key, value, self.l1_timeout)
+                record_cache(hit=True)
+                result[missing[full_key]] = value
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.l2.set(key, value, self._l2_timeout(timeout), version=0)
+        self.l1.set(key, value, self._l1_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version=version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add служит блокировкой, поэтому решает только общий L2
+        key = self.make_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.add(key, value, self._l2_timeout(timeout), version=0)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.incr(key, delta, version=0)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.l1.delete(key)
+        self.l2.delete(key, version=0)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.l1.delete(key)
+        self.l2.delete_many(keys, version=0)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.touch(key, self._l2_timeout(timeout), version=0)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+def is_shared(alias):
+    """
+    Видят ли все воркеры одни и те же записи кэша alias. LocMemCache и
+    L1 двухуровневого кэша живут в памяти процесса: удаление в одном
+    воркере до остальных не доходит.
+    """
+    return not isinstance(
+        caches[alias], (LocMemCache, DummyCache, TieredCache)
+    )
+
+
+def get_or_recompute(cache, key, compute, timeout, stale_timeout=None,
+                     lock_timeout=10, wait=0.05, attempts=20):
+    """
+    Значение из кэша или результат compute(), посчитанный одним процессом.
+
+    Значение хранится вместе со сроком свежести. Устаревшее значение
+    отдаётся всем, пока победитель гонки за блокировкой пересчитывает его.
+    Если значения нет совсем, остальные коротко ждут результат победителя.
+    """
+    lock_key = f"{key}:lock"
+    if stale_timeout is None:
+        stale_timeout = timeout
+
+    def store():
+        value = compute()
+        cache.set(key, (value, time.time() + timeout), timeout + stale_timeout)
+        return value
+
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, fresh_until = envelope
+        if fresh_until > time.time():
+            return value
+        if not cache.add(lock_key, 1, lock_timeout):
+            return value
+        try:
+            return store()
+        finally:
+            cache.delete(lock_key)
+
+    for _ in range(attempts):
+        if cache.add(lock_key, 1, lock_timeout):
+            try:
+                return store()
+            finally:
+                cache.delete(lock_key)
+        time.sleep(wait)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+    return compute()
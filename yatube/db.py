@@ -0,0 +1,82 @@
+"""
+Чтение с реплики и постоянные соединения.
+
+Если в DATABASES есть алиас "replica", ReplicaRouter отправляет на него
+чтения из безопасных (GET/HEAD) веб-запросов; записи, чтения внутри
+POST и всё вне веб-запросов (команды, фоновые задачи) идут в основную
+базу. Запрос, начавший сохранять или удалять модель, дальше тоже читает
+основную базу. После записи ReplicaMiddleware ставит cookie, и
+REPLICA_PIN_SECONDS секунд пользователь читает основную базу, чтобы
+сразу видеть свой пост или комментарий, даже если реплика отстаёт.
+
+При CONN_MAX_AGE соединения переживают запрос, поэтому перед каждым
+запросом они проверяются, и оборванное закрывается, а не роняет запрос.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import pre_delete, pre_save
+from django.dispatch import receiver
+
+REPLICA = "replica"
+
+_routing = ContextVar("db_routing", default=None)
+
+
+class Routing:
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def replica_alias():
+    return REPLICA if REPLICA in settings.DATABASES else None
+
+
+@contextmanager
+def request_routing(replica=True):
+    routing = Routing(replica)
+    token = _routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _routing.reset(token)
+
+
+@receiver(pre_save)
+@receiver(pre_delete)
+def _record_write(sender, **kwargs):
+    # до записи: обработчики сигналов записи тоже читают основную базу
+    routing = _routing.get()
+    # сессия сохраняется почти на каждом входе и на чтения не влияет
+    if routing is not None and sender._meta.app_label != "sessions":
+        routing.wrote = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (routing is not None and routing.replica and not routing.wrote
+                and replica_alias()):
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}
+
+    def allow_migrate(self, db, app_label, **hints):
+        # реплика получает схему репликацией, а не миграциями
+        return db == DEFAULT_DB_ALIAS
+
+
+@receiver(request_started)
+def ping_connections(**kwargs):
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
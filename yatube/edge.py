@@ -0,0 +1,262 @@
+"""
+Кэширование страниц на краю (CDN, Varnish) и сброс по суррогатным ключам.
+
+Представление помечает ответ ключами через tag(): например, страница поста —
+post-<id> и author-<id>. Если задан EDGE_CACHE_SECONDS, EdgeCacheMiddleware
+отдаёт такие страницы анонимам с Cache-Control: public, s-maxage и
+заголовком Surrogate-Key, а всем остальным — с private. Браузеру max-age=0:
+после сброса на краю он не должен показывать старую копию.
+
+Сигналы моделей вызывают purge() с ключами изменившихся объектов, а после
+коммита транзакции его выполняет пурджер из настройки EDGE_PURGER:
+    NullPurger  — ничего не делает (по умолчанию);
+    HTTPPurger  — запрос PURGE с заголовком Surrogate-Key на EDGE_PURGE_URL;
+    LocalPurger — сбрасывает EdgeCache этого процесса.
+
+EdgeCache — WSGI-обёртка с кэшем в памяти, которая ведёт себя как край:
+учитывает s-maxage, Vary и Set-Cookie, хранит суррогатные ключи. Нужна
+для разработки и тестов.
+"""
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+from functools import partial
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db import transaction
+from django.http import parse_cookie
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.module_loading import import_string
+
+from .middleware import PIN_COOKIE
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD")
+S_MAXAGE = re.compile(r"\bs-maxage=(\d+)")
+
+Entry = namedtuple("Entry", "status headers body expires")
+
+
+def cache_seconds():
+    return getattr(settings, "EDGE_CACHE_SECONDS", 0)
+
+
+def tag(request, *keys):
+    """Помечает ответ суррогатными ключами объектов, показанных на странице."""
+    current = getattr(request, "surrogate_keys", set())
+    request.surrogate_keys = current | set(keys)
+
+
+class EdgeCacheMiddleware:
+    """
+    Стоит выше SessionMiddleware и CsrfViewMiddleware, чтобы видеть все
+    cookie ответа: страница с Set-Cookie на краю не кэшируется.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        keys = getattr(request, "surrogate_keys", None)
+        seconds = cache_seconds()
+        if not keys or not seconds:
+            return response
+        user = getattr(request, "user", None)
+        if (
+            request.method in SAFE_METHODS
+            and response.status_code == 200
+            and user is not None
+            and not user.is_authenticated
+            and not response.cookies
+        ):
+            patch_cache_control(
+                response, public=True, max_age=0, s_maxage=seconds
+            )
+            response["Surrogate-Key"] = " ".join(sorted(keys))
+        else:
+            patch_cache_control(response, private=True)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
+class NullPurger:
+    def purge(self, keys):
+        pass
+
+
+class HTTPPurger:
+    def __init__(self, url=None, timeout=2):
+        self.url = url or settings.EDGE_PURGE_URL
+        self.timeout = timeout
+
+    def purge(self, keys):
+        request = Request(
+            self.url,
+            method="PURGE",
+            headers={"Surrogate-Key": " ".join(sorted(keys))},
+        )
+        try:
+            with urlopen(request, timeout=self.timeout):
+                pass
+        except OSError:
+            # страница устареет сама через EDGE_CACHE_SECONDS
+            logger.exception("Не удалось сбросить ключи %s", sorted(keys))
+
+
+class LocalPurger:
+    def __init__(self, store=None):
+        self.store = store if store is not None else local_store
+
+    def purge(self, keys):
+        self.store.purge(keys)
+
+
+def get_purger():
+    path = getattr(settings, "EDGE_PURGER", None) or "yatube.edge.NullPurger"
+    return import_string(path)()
+
+
+def enabled():
+    path = getattr(settings, "EDGE_PURGER", None)
+    return bool(path) and path != "yatube.edge.NullPurger"
+
+
+def _send(keys):
+    get_purger().purge(keys)
+
+
+def purge(*keys):
+    """Сбрасывает страницы с этими ключами после коммита транзакции."""
+    keys = frozenset(key for key in keys if key)
+    if keys and enabled():
+        transaction.on_commit(partial(_send, keys))
+
+
+def vary_cookies():
+    """Cookie, от которых зависит страница; остальные край отбрасывает."""
+    return (
+        settings.SESSION_COOKIE_NAME,
+        settings.CSRF_COOKIE_NAME,
+        PIN_COOKIE,
+        "messages",
+    )
+
+
+def _header(environ, name):
+    name = name.strip().lower()
+    if name == "cookie":
+        cookies = parse_cookie(environ.get("HTTP_COOKIE", ""))
+        return tuple(
+            (cookie, cookies[cookie])
+            for cookie in vary_cookies() if cookie in cookies
+        )
+    if name == "content-type":
+        return environ.get("CONTENT_TYPE", "")
+    return environ.get("HTTP_" + name.upper().replace("-", "_"), "")
+
+
+class EdgeStore:
+    """Ответы по (URL, значения заголовков из Vary) и индекс ключей."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self.vary = {}
+            self.tags = defaultdict(set)
+
+    def _variant(self, url, environ):
+        return url, tuple(
+            _header(environ, name) for name in self.vary.get(url, ())
+        )
+
+    def get(self, url, environ):
+        with self._lock:
+            entry = self.entries.get(self._variant(url, environ))
+        if entry is not None and entry.expires > time.monotonic():
+            return entry
+        return None
+
+    def save(self, url, environ, entry, vary, keys):
+        with self._lock:
+            self.vary[url] = vary
+            variant = self._variant(url, environ)
+            self.entries[variant] = entry
+            for key in keys:
+                self.tags[key].add(variant)
+
+    def purge(self, keys):
+        with self._lock:
+            for key in keys:
+                for variant in self.tags.pop(key, ()):
+                    self.entries.pop(variant, None)
+
+
+local_store = EdgeStore()
+
+
+class EdgeCache:
+    """WSGI-приложение с кэшем края перед другим WSGI-приложением."""
+
+    def __init__(self, application, store=None):
+        self.application = application
+        self.store = store if store is not None else local_store
+
+    def __call__(self, environ, start_response):
+        # HEAD тоже идёт мимо: его пустое тело нельзя отдавать на GET
+        if environ["REQUEST_METHOD"] != "GET":
+            return self.application(environ, start_response)
+        url = environ.get("PATH_INFO", "/")
+        if environ.get("QUERY_STRING"):
+            url += "?" + environ["QUERY_STRING"]
+        entry = self.store.get(url, environ)
+        if entry is not None:
+            start_response(entry.status, entry.headers + [("X-Cache", "HIT")])
+            return [entry.body]
+
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response.update(status=status, headers=headers)
+            return lambda data: None
+
+        result = self.application(environ, capture)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+        status, headers = response["status"], response["headers"]
+        values = defaultdict(list)
+        for name, value in headers:
+            values[name.lower()].append(value)
+        control = ", ".join(values["cache-control"])
+        ttl = S_MAXAGE.search(control)
+        vary = [
+            name.strip()
+            for value in values["vary"] for name in value.split(",")
+        ]
+        if (
+            ttl and int(ttl.group(1)) > 0
+            and status.startswith("200")
+            and "private" not in control and "no-store" not in control
+            and not values["set-cookie"]
+            and "*" not in vary
+        ):
+            keys = " ".join(values["surrogate-key"]).split()
+            expires = time.monotonic() + int(ttl.group(1))
+            self.store.save(
+                url, environ, Entry(status, headers, body, expires),
+                vary, keys,
+            )
+        start_response(status, headers + [("X-Cache", "MISS")])
+        return [body]
@@ -0,0 +1,174 @@
+"""
+Метрики производительности запросов.
+
+Для каждого представления (по имени URL) копятся гистограммы времени
+ответа, времени в БД и рендеринга шаблонов, числа запросов и дублей,
+а также попадания и промахи кэша. Гистограммы лог-линейные, как в
+HdrHistogram: 2**SUB_BUCKET_BITS корзин на каждую степень двойки, то есть
+относительная погрешность процентилей не больше ~6% при постоянной памяти.
+"""
+import math
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponseForbidden, JsonResponse
+
+SUB_BUCKET_BITS = 4
+
+_current = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(value):
+        if value < 1:
+            return 0
+        exponent = int(math.log2(value))
+        sub = int((value / 2 ** exponent - 1) * 2 ** SUB_BUCKET_BITS)
+        return 1 + (exponent << SUB_BUCKET_BITS) + sub
+
+    @staticmethod
+    def upper_bound(bucket):
+        if bucket == 0:
+            return 1.0
+        exponent, sub = divmod(bucket - 1, 2 ** SUB_BUCKET_BITS)
+        return 2 ** exponent * (1 + (sub + 1) / 2 ** SUB_BUCKET_BITS)
+
+    def record(self, value):
+        with self._lock:
+            self.counts[self.bucket(value)] += 1
+            self.total += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        with self._lock:
+            if not self.total:
+                return 0.0
+            rank = math.ceil(self.total * percent / 100)
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return min(self.upper_bound(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 3) if self.total else 0,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max, 3),
+        }
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def duplicates(self):
+        return len(self.queries) - len(set(self.queries))
+
+
+class Registry:
+    METRICS = ("wall_ms", "db_ms", "template_ms", "queries", "duplicates")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def endpoint(self, name):
+        with self._lock:
+            if name not in self.endpoints:
+                self.endpoints[name] = {
+                    "histograms": {
+                        metric: Histogram() for metric in self.METRICS
+                    },
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                }
+            return self.endpoints[name]
+
+    def record(self, name, wall_ms, stats):
+        endpoint = self.endpoint(name)
+        values = {
+            "wall_ms": wall_ms,
+            "db_ms": stats.db_time * 1000,
+            "template_ms": stats.template_time * 1000,
+            "queries": len(stats.queries),
+            "duplicates": stats.duplicates,
+        }
+        for metric, value in values.items():
+            endpoint["histograms"][metric].record(value)
+        with self._lock:
+            endpoint["cache_hits"] += stats.cache_hits
+            endpoint["cache_misses"] += stats.cache_misses
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = dict(self.endpoints)
+        return {
+            name: {
+                **{
+                    metric: histogram.summary()
+                    for metric, histogram in data["histograms"].items()
+                },
+                "cache_hits": data["cache_hits"],
+                "cache_misses": data["cache_misses"],
+            }
+            for name, data in endpoints.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+
+registry = Registry()
+
+
+def current():
+    return _current.get()
+
+
+def start():
+    return _current.set(RequestStats())
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def record_cache(hit):
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    authorized = request.user.is_staff or (
+        token and request.META.get("HTTP_AUTHORIZATION") == f"Bearer {token}"
+    )
+    if not authorized:
+        return HttpResponseForbidden()
+    return JsonResponse(registry.snapshot())
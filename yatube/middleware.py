@@ -0,0 +1,125 @@
+import logging
+import time
+from contextlib import ExitStack
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .db import request_routing
+
+logger = logging.getLogger("yatube.slow_requests")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "primary_pin"
+
+
+def _patch_template_render():
+    """Считает время рендеринга шаблонов, вызванных через render()."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, "timed", False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = metrics.current()
+        if stats is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    render.timed = True
+    Template.render = render
+
+
+def _timed_query(stats, execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        # параметры (хеши паролей, данные сессий, почта) не храним и не
+        # пишем в лог: для поиска дублей хватает их хеша
+        stats.queries.append((sql, hash(repr(params))))
+
+
+class PerformanceMiddleware:
+    """
+    Время ответа, время в БД и в шаблонах, число запросов и их дублей,
+    попадания в кэш — по каждому представлению. Запросы дольше
+    SLOW_REQUEST_MS пишутся в лог yatube.slow_requests вместе с текстом
+    SQL, но без значений параметров.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _patch_template_render()
+
+    def __call__(self, request):
+        token = metrics.start()
+        stats = metrics.current()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(partial(_timed_query, stats))
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.finish(token)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            metrics.registry.record(match.view_name, wall_ms, stats)
+        if wall_ms > getattr(settings, "SLOW_REQUEST_MS", 500):
+            logger.warning(
+                "%s %s: %.0f ms, %d queries (%d duplicate), db %.0f ms\n%s",
+                request.method,
+                request.get_full_path(),
+                wall_ms,
+                len(stats.queries),
+                stats.duplicates,
+                stats.db_time * 1000,
+                "\n".join(sql for sql, _ in stats.queries),
+            )
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Безопасные запросы читают реплику, если пользователь недавно ничего
+    не записывал. После небезопасного запроса или записи в GET (подписка
+    по ссылке) ставится cookie PIN_COOKIE со временем, до которого чтения
+    идут в основную базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        with request_routing(safe and not self.pinned(request)) as routing:
+            response = self.get_response(request)
+        if not safe or routing.wrote:
+            seconds = getattr(settings, "REPLICA_PIN_SECONDS", 10)
+            response.set_cookie(
+                PIN_COOKIE,
+                str(int(time.time() + seconds)),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,45 @@
+"""
+Сессии в кэше с отложенной записью в базу (write-behind).
+
+Кэш — основная копия: сессия читается из него, а каждое изменение сразу
+пишется в кэш. В таблицу django_session изменение попадает не чаще раза
+в SESSION_WRITE_BEHIND_SECONDS, создание и смена ключа (вход) — сразу.
+База нужна, только если запись вытеснена из кэша; тогда сессия теряет не
+больше последних SESSION_WRITE_BEHIND_SECONDS изменений.
+
+Кэш задаётся SESSION_CACHE_ALIAS. Он должен быть общим для всех воркеров,
+поэтому это не двухуровневый "default", у которого L1 в каждом процессе
+мог бы отдать сессию после выхода, и не LocMemCache: проверка users.E001
+не даёт запустить сайт с таким кэшем.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore
+)
+
+KEY_PREFIX = "yatube.sessions.synced"
+
+
+class SessionStore(CachedDBStore):
+    @property
+    def synced_key(self):
+        return f"{KEY_PREFIX}:{self._get_or_create_session_key()}"
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            super().save(must_create)
+            return
+        delay = getattr(settings, "SESSION_WRITE_BEHIND_SECONDS", 300)
+        # add() удаётся раз в delay секунд: тогда сессия уходит и в базу
+        if self._cache.add(self.synced_key, True, delay):
+            super().save(must_create)
+        else:
+            self._cache.set(
+                self.cache_key, self._session, self.get_expiry_age()
+            )
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            self._cache.delete(f"{KEY_PREFIX}:{session_key}")
+        super().delete(session_key)
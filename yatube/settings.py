@@ -46,6 +46,7 @@ SOCIAL_AUTH_FACEBOOK_PROFILE_EXTRA_PARAMS = {
 INSTALLED_APPS = [
     'posts',
     'users',
+    'rest_framework',
     'rest_framework.authtoken',
     'sorl.thumbnail',
     'django.contrib.sites',
@@ -56,7 +57,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'social_django',
     'sslserver',
 ]
@@ -67,16 +67,23 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.middleware.PerformanceMiddleware',
+    'yatube.edge.EdgeCacheMiddleware',
+    'yatube.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.auth.SnapshotAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# debug toolbar сам по себе тормозит каждый запрос, поэтому только в DEBUG
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -88,8 +95,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
+            # скомпилированные шаблоны держатся в памяти процесса и при DEBUG
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -119,10 +133,41 @@ REST_FRAMEWORK = {
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get(
+            'YATUBE_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+        # соединение живёт между запросами и проверяется перед каждым
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 60)),
     }
 }
 
+# реплика только для чтения, например копия файла SQLite; без переменной
+# всё читается из основной базы. Тесты запускаются без неё: в Django 2.2
+# зеркало — отдельное соединение и не видит транзакцию TestCase
+if os.environ.get('YATUBE_REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['YATUBE_REPLICA_DB_NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['yatube.db.ReplicaRouter']
+# независимые запросы представления — одновременно в пуле потоков;
+# у SQLite выигрыша нет, поэтому только для серверных СУБД
+POSTS_PARALLEL_QUERIES = (
+    DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3'
+)
+POSTS_QUERY_THREADS = 8
+# сколько секунд после записи пользователь читает основную базу
+REPLICA_PIN_SECONDS = 10
+
+# анонимные страницы кэшируются на краю (CDN, Varnish) столько секунд;
+# 0 — не кэшируются. Изменения сбрасываются по суррогатным ключам
+# пурджером EDGE_PURGER, см. yatube/edge.py
+EDGE_CACHE_SECONDS = int(os.environ.get('YATUBE_EDGE_CACHE_SECONDS', 0))
+EDGE_PURGER = os.environ.get('YATUBE_EDGE_PURGER', '')
+EDGE_PURGE_URL = os.environ.get('YATUBE_EDGE_PURGE_URL', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -141,12 +186,59 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-CACHES = {
-    'default': {
+# Общий для всех воркеров кэш (L2) задаётся переменной окружения
+# YATUBE_CACHE_URL:
+#   memcached://127.0.0.1:11211, memcached://unix:/run/memcached.sock
+#       (клиент — python-memcached из requirements.txt)
+#   file:///var/tmp/yatube-cache — локальная замена для разработки
+# без неё L2 живёт в памяти процесса.
+YATUBE_CACHE_URL = os.environ.get('YATUBE_CACHE_URL', '')
+
+if YATUBE_CACHE_URL.startswith('memcached://'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': YATUBE_CACHE_URL[len('memcached://'):],
+    }
+elif YATUBE_CACHE_URL.startswith('file://'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': YATUBE_CACHE_URL[len('file://'):],
+    }
+else:
+    SHARED_CACHE = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
     }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'yatube.cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_TIMEOUT': 2,
+        },
+    },
+    'shared': SHARED_CACHE,
 }
 
+# сессии — в общем кэше, в базу не чаще раза в SESSION_WRITE_BEHIND_SECONDS
+# (yatube/sessions.py). Без хранилища вовсе можно взять
+# django.contrib.sessions.backends.signed_cookies.
+# Выход и смена пароля удаляют сессию и снимок пользователя из кэша, и это
+# должно быть видно всем воркерам, поэтому без YATUBE_CACHE_URL (L2 в
+# памяти процесса) сессии хранятся в базе, а снимок не используется.
+# users/checks.py не даёт включить их с кэшем в памяти процесса
+SESSION_ENGINE = os.environ.get(
+    'YATUBE_SESSION_ENGINE',
+    'yatube.sessions' if YATUBE_CACHE_URL
+    else 'django.contrib.sessions.backends.db',
+)
+SESSION_CACHE_ALIAS = 'shared'
+SESSION_WRITE_BEHIND_SECONDS = 300
+# снимок пользователя запроса, см. users/auth.py; None — без снимка
+AUTH_SNAPSHOT_CACHE = 'shared' if YATUBE_CACHE_URL else None
+AUTH_SNAPSHOT_TIMEOUT = 3600
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -165,13 +257,47 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# сборка статики: collectstatic хеширует имена и кладёт рядом .gz и .br,
+# см. yatube/staticfiles.py. Без собранного манифеста {% static %} падает,
+# поэтому включается только для развёртывания
+if os.environ.get('YATUBE_HASHED_STATIC'):
+    STATICFILES_STORAGE = (
+        'yatube.staticfiles.CompressedManifestStaticFilesStorage'
+    )
+# статику раздаёт само приложение, если перед ним нет nginx
+STATIC_SERVE = bool(os.environ.get('YATUBE_STATIC_SERVE'))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# обработка загруженных картинок: "process" — пул процессов в веб-сервере,
+# "worker" — отдельный manage.py process_images, "sync" — прямо в запросе
+POSTS_IMAGE_PROCESSING = os.environ.get('POSTS_IMAGE_PROCESSING', 'process')
+POSTS_IMAGE_WORKERS = 2
+
+# смена режима ленты автора при пересечении FEED_FANOUT_LIMIT: "thread" —
+# фоновый поток после подписки, "sync" — в запросе, "worker" — только
+# manage.py rebalance_feeds по расписанию
+FEED_MODE_SWITCH = os.environ.get('YATUBE_FEED_MODE_SWITCH', 'thread')
+
+# админка: точный COUNT(*) в списках — до этого числа строк, дальше оценка;
+# массовое удаление идёт пачками в фоновом потоке ("thread") или в запросе
+ADMIN_EXACT_COUNT_LIMIT = 10000
+ADMIN_JOBS = os.environ.get('YATUBE_ADMIN_JOBS', 'thread')
+ADMIN_JOB_BATCH_SIZE = 500
+
 #  подключаем движок filebased.EmailBackend
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
+
+# представления лент, в которых остаётся нумерованная пагинация с COUNT(*);
+# остальные листаются keyset-курсором ?after=/?before=
+POSTS_NUMBERED_PAGINATION = []
+
+# запросы дольше этого (мс) пишутся в лог yatube.slow_requests вместе с SQL
+SLOW_REQUEST_MS = int(os.environ.get('YATUBE_SLOW_REQUEST_MS', 500))
+# /metrics/ доступен персоналу или с заголовком Authorization: Bearer <токен>
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
@@ -0,0 +1,159 @@
+"""
+Статика с хешем в имени, заранее сжатая, и её раздача без прокси.
+
+CompressedManifestStaticFilesStorage — ManifestStaticFilesStorage, которое
+после collectstatic кладёт рядом с каждым текстовым файлом варианты .gz и,
+если установлен пакет brotli, .br. Хешируются и файлы, положенные прямо в
+STATIC_ROOT (bootstrap и jquery из npm), а не только собранные из
+приложений. Имя с хешем меняется вместе с содержимым, поэтому такие файлы
+можно кэшировать навсегда.
+
+serve() отдаёт файлы из STATIC_ROOT, когда перед приложением нет nginx
+(STATIC_SERVE): выбирает .br или .gz по Accept-Encoding и отвечает
+FileResponse — WSGI-сервер передаёт его через wsgi.file_wrapper, то есть
+sendfile() без копирования в процесс.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (
+    ".css", ".js", ".svg", ".html", ".txt", ".json", ".map", ".xml",
+    ".ico", ".ttf", ".eot", ".otf",
+)
+MIN_SIZE = 256
+HASHED = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+FOREVER = 365 * 24 * 60 * 60
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def compressors():
+    yield ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield ".br", lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def existing_files(self, path=""):
+        """Файлы STATIC_ROOT, кроме уже хешированных и сжатых."""
+        directories, files = self.listdir(path)
+        for name in files:
+            name = posixpath.join(path, name)
+            if (
+                name != self.manifest_name
+                and not name.endswith((".gz", ".br"))
+                and not HASHED.search(name)
+            ):
+                yield name
+        for directory in directories:
+            yield from self.existing_files(posixpath.join(path, directory))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        if self.exists(""):
+            paths = {
+                **{name: (self, name) for name in self.existing_files()},
+                **paths,
+            }
+        yield from super().post_process(paths, dry_run, **options)
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        if len(data) < MIN_SIZE:
+            return
+        path = self.path(name)
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                with open(path + suffix, "wb") as target:
+                    target.write(compressed)
+
+
+def accepted_encodings(header):
+    """
+    Accept-Encoding → {кодировка: q}. q=0 — отказ от кодировки, "*" —
+    вес всех не названных.
+    """
+    weights = {}
+    for item in header.split(","):
+        encoding, *params = item.strip().lower().split(";")
+        if not encoding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[encoding.strip()] = q
+    return weights
+
+
+def _variant(path, request):
+    header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    weights = accepted_encodings(header)
+    best = None
+    for encoding, suffix in ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        # при равном весе — первая из ENCODINGS, она сжимает сильнее
+        if q > 0 and (best is None or q > best[0]):
+            if os.path.isfile(path + suffix):
+                best = (q, path + suffix, encoding)
+    if best is None:
+        return path, None
+    return best[1], best[2]
+
+
+def serve(request, path):
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    filepath, encoding = _variant(fullpath, request)
+    stat = os.stat(filepath)
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"),
+        stat.st_mtime, stat.st_size,
+    ):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(fullpath)
+        response = FileResponse(
+            open(filepath, "rb"),
+            content_type=content_type or "application/octet-stream",
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if HASHED.search(path):
+        response["Cache-Control"] = f"public, max-age={FOREVER}, immutable"
+    else:
+        response["Cache-Control"] = "public, max-age=0, must-revalidate"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
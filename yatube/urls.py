@@ -13,14 +13,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.contrib.flatpages import views
 from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 
+from .metrics import metrics_view
+from .staticfiles import serve as serve_static
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -29,6 +34,8 @@ urlpatterns = [
     path('auth/', include("users.urls")),
     path('auth/', include("django.contrib.auth.urls")),
     path('admin/', admin.site.urls),
+    path('api/v1/', include('posts.api_urls')),
+    path('metrics/', metrics_view, name='metrics'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('social_auth/', include('social_django.urls', namespace='social')),
     path('', include("posts.urls")),
@@ -41,6 +48,12 @@ urlpatterns += [
     path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='spec'),
 ]
 
+if settings.STATIC_SERVE:
+    urlpatterns.insert(0, re_path(
+        r"^%s(?P<path>.*)$" % re.escape(settings.STATIC_URL.lstrip("/")),
+        serve_static,
+    ))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)